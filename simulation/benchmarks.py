@@ -0,0 +1,358 @@
+""" Microbenchmarks for performance-sensitive parts of the simulation.
+
+Usage: python benchmarks.py [benchmark name ...]
+
+With no arguments, runs all benchmarks.  Each benchmark prints its results
+to stdout.
+"""
+
+import gc
+import itertools
+import logging
+import multiprocessing
+import Queue
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import event_queue
+import simulation
+import workload
+
+class DummyEvent(object):
+    """ Stand-in for an event; only used as a queue payload. """
+    pass
+
+def hold_model(queue, num_pending, num_operations):
+    """ Runs the classic "hold" workload against an event queue.
+
+    The queue is filled with num_pending events, and then each operation
+    removes the earliest event and schedules a new one a random time later,
+    so the queue size stays constant.  Times are integer milliseconds so that
+    ties between events are common, as in the simulation.
+
+    Returns the number of events processed per second.
+    """
+    events = [DummyEvent() for i in range(num_pending)]
+    for event in events:
+        queue.put((random.randint(0, 100), event))
+    delays = [random.randint(0, 100) for i in range(num_operations)]
+    start = time.time()
+    for delay in delays:
+        current_time, event = queue.get()
+        queue.put((current_time + delay, event))
+    elapsed = time.time() - start
+    return num_operations / elapsed
+
+def benchmark_event_queue():
+    """ Compares Queue.PriorityQueue with the simulation's event queues. """
+    num_operations = 200000
+    print "Event queue throughput (events/sec)"
+    print "pending\tPriorityQueue\tEventQueue\tTimingWheel"
+    for num_pending in [100, 10000, 1000000]:
+        random.seed(1)
+        baseline = hold_model(Queue.PriorityQueue(), num_pending,
+                              num_operations)
+        random.seed(1)
+        heap = hold_model(event_queue.EventQueue(), num_pending,
+                          num_operations)
+        random.seed(1)
+        wheel = hold_model(event_queue.TimingWheelEventQueue(), num_pending,
+                           num_operations)
+        print "%d\t%d\t%d\t%d" % (num_pending, baseline, heap, wheel)
+
+def time_simulation(args):
+    """ Runs a single simulation with the given list of "key=value" arguments.
+
+    Output files are written to a temporary directory that is removed
+    afterwards.  Returns the elapsed wall-clock time, in seconds.
+    """
+    results_dir = tempfile.mkdtemp()
+    try:
+        start = time.time()
+        simulation.main(args + ["results_dir=%s" % results_dir,
+                                "log_level=warning",
+                                "deterministic=True"])
+        return time.time() - start
+    finally:
+        shutil.rmtree(results_dir)
+
+def benchmark_deep_queues():
+    """ Runs the simulation above full utilization, so queues grow deep.
+
+    Queues grow linearly with the simulated time, so if launching a task is
+    constant time, the time per simulated task should stay roughly constant
+    as total_time increases.
+    """
+    num_servers = 100
+    num_tasks = 10
+    task_length = 100
+    utilization = 1.5
+    arrival_delay = (float(task_length * num_tasks) /
+                     (num_servers * utilization))
+    print "Simulation time at utilization %s" % utilization
+    print "total_time\ttasks\tseconds\tusec/task"
+    for total_time in [2000, 4000, 8000, 16000]:
+        elapsed = time_simulation(["num_servers=%d" % num_servers,
+                                   "num_tasks=%d" % num_tasks,
+                                   "task_length=%d" % task_length,
+                                   "num_users=1",
+                                   "probes_ratio=1.0",
+                                   "job_arrival_delay=%f" % arrival_delay,
+                                   "total_time=%d" % total_time])
+        num_simulated_tasks = int(total_time / arrival_delay) * num_tasks
+        print "%d\t%d\t%.2f\t%.1f" % (total_time, num_simulated_tasks,
+                                       elapsed,
+                                       elapsed * 1e6 / num_simulated_tasks)
+
+class ProbeBenchmarkJob(object):
+    """ Stand-in for a job; place_job only needs the number of tasks. """
+    def __init__(self, num_tasks):
+        self.num_tasks = num_tasks
+
+def benchmark_probe_sampling():
+    """ Times choosing probe targets for a 10-task job with 2 probes per task.
+    """
+    num_jobs = 2000
+    job = ProbeBenchmarkJob(10)
+    print "Time to place a job (usec)"
+    print "num_servers\tshuffle\tsample"
+    for num_servers in [1000, 10000, 100000]:
+        servers = [object() for i in range(num_servers)]
+        results = []
+        for probe_sampling in ["shuffle", "sample"]:
+            config = simulation.SimulationConfig(
+                num_servers=num_servers, probes_ratio=2,
+                probe_sampling=probe_sampling)
+            front_end = simulation.FrontEnd(servers, 0, None, config,
+                                            random.Random(1))
+            start = time.time()
+            for i in range(num_jobs):
+                front_end.place_job(job, 0)
+            results.append((time.time() - start) * 1e6 / num_jobs)
+        print "%d\t%.1f\t%.1f" % (num_servers, results[0], results[1])
+
+def benchmark_queue_selection():
+    """ Times placing a 200-task job when every server is probed.
+
+    This is the probes_ratio=-1 case, where the number of probe results
+    equals the cluster size.
+    """
+    num_tasks = 200
+    num_jobs = 20
+    print "Time to select queues for a %d-task job (msec)" % num_tasks
+    policies = ["greedy", "pack", "reverse_pack", "patrick"]
+    print "num_servers\t%s" % "\t".join(policies)
+    for num_servers in [1000, 10000, 100000]:
+        random.seed(1)
+        queue_lengths = [(i, random.randint(0, 5))
+                         for i in range(num_servers)]
+        results = []
+        for queue_selection in policies:
+            config = simulation.SimulationConfig(
+                queue_selection=queue_selection)
+            front_end = simulation.FrontEnd([], 0, None, config,
+                                            random.Random(1))
+            start = time.time()
+            for i in range(num_jobs):
+                front_end.get_best_n_queues(list(queue_lengths), num_tasks)
+            results.append((time.time() - start) * 1e3 / num_jobs)
+        print "%d\t%s" % (num_servers,
+                          "\t".join(["%.2f" % t for t in results]))
+
+def measure_memory(args, result_queue):
+    """ Runs a simulation and puts its memory use on result_queue.
+
+    This should be run in a separate process, since the peak resident set
+    size of a process never decreases.  Puts a tuple of the number of tasks
+    simulated, the peak resident set size (in KB) before and after running
+    the simulation, and the number of objects tracked by the garbage
+    collector before and after running it (while the simulation's completed
+    jobs and statistics are still referenced).
+    """
+    results_dir = tempfile.mkdtemp()
+    try:
+        gc.collect()
+        start_objects = len(gc.get_objects())
+        start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        config = simulation.SimulationConfig.from_args(
+            args + ["results_dir=%s" % results_dir, "deterministic=True"])
+        sim = simulation.Simulation(config)
+        sim.create_jobs(config.total_time)
+        sim.run()
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        gc.collect()
+        end_objects = len(gc.get_objects())
+        # The running task count changes when each task starts and finishes.
+        num_tasks = len(sim.stats_manager.total_running_tasks) / 2
+        result_queue.put((num_tasks, start_rss, peak_rss, start_objects,
+                          end_objects))
+    finally:
+        shutil.rmtree(results_dir)
+
+def benchmark_memory():
+    """ Measures peak memory use and retained objects per simulated task.
+
+    Runs with 4-core servers at 90% utilization, both keeping every job
+    (exact) and summarizing response times with sketches.  Memory per task
+    should stay roughly constant as total_time increases when keeping every
+    job, and fall with sketches, which use bounded memory.
+    """
+    logging.getLogger().setLevel(logging.WARNING)
+    num_servers = 500
+    cores_per_server = 4
+    num_tasks = 10
+    task_length = 100
+    utilization = 0.9
+    arrival_delay = (float(task_length * num_tasks) /
+                     (num_servers * cores_per_server * utilization))
+    print "Memory use at utilization %s" % utilization
+    print "mode\ttotal_time\ttasks\tpeak_rss_mb\tbytes/task\tobjects/task"
+    for mode, sketch_accuracy in [("exact", 0), ("sketch", 0.01)]:
+        for total_time in [2500, 5000, 10000]:
+            result_queue = multiprocessing.Queue()
+            process = multiprocessing.Process(
+                target=measure_memory,
+                args=(["num_servers=%d" % num_servers,
+                       "cores_per_server=%d" % cores_per_server,
+                       "num_tasks=%d" % num_tasks,
+                       "task_length=%d" % task_length,
+                       "num_users=1",
+                       "probes_ratio=2.0",
+                       "job_arrival_delay=%f" % arrival_delay,
+                       "total_time=%d" % total_time,
+                       "response_time_sketch=%s" % sketch_accuracy,
+                       "log_level=warning"], result_queue))
+            process.start()
+            (num_simulated_tasks, start_rss, peak_rss, start_objects,
+             end_objects) = result_queue.get()
+            process.join()
+            # ru_maxrss is in kilobytes on Linux.
+            print "%s\t%d\t%d\t%.1f\t%.0f\t%.2f" % (
+                mode, total_time, num_simulated_tasks, peak_rss / 1024.0,
+                (peak_rss - start_rss) * 1024.0 / num_simulated_tasks,
+                float(end_objects - start_objects) / num_simulated_tasks)
+
+def benchmark_output_stats():
+    """ Times writing response time statistics for 100,000 completed jobs.
+
+    Jobs are spread evenly over the users and over two job sizes, as with
+    the bimodal task distribution.
+    """
+    num_jobs = 100000
+    print "Time to output stats for %d jobs (sec)" % num_jobs
+    print "num_users\tseconds"
+    for num_users in [10, 100, 500]:
+        results_dir = tempfile.mkdtemp()
+        try:
+            config = simulation.SimulationConfig(
+                num_users=num_users, task_distribution="bimodal",
+                results_dir=results_dir, log_level="warning")
+            stats_manager = simulation.StatsManager(config)
+            rng = random.Random(1)
+            for i in range(num_jobs):
+                num_tasks = rng.choice([10, 200])
+                job = simulation.Job(i % num_users, i, num_tasks, 100,
+                                     stats_manager, i,
+                                     itertools.repeat(100))
+                job.longest_task = 100
+                job.completion_time = i + 100 + rng.expovariate(0.01)
+                stats_manager.job_finished(job)
+            start = time.time()
+            stats_manager.output_stats()
+            print "%d\t%.2f" % (num_users, time.time() - start)
+        finally:
+            shutil.rmtree(results_dir)
+
+def benchmark_workload():
+    """ Times generating ten million jobs with each workload generator.
+
+    Uses the bimodal task distribution and unequal demands from 10 users,
+    so each job needs an arrival time, a size and a user.
+    """
+    num_jobs = 10000000
+    print "Time to generate %d jobs (sec)" % num_jobs
+    print "generator\tseconds\tjobs/sec"
+    for generator in simulation.WORKLOAD_GENERATORS:
+        if generator == "numpy" and workload.N is None:
+            print "%s\tunavailable" % generator
+            continue
+        config = simulation.SimulationConfig(
+            job_arrival_delay=1, task_distribution="bimodal", num_users=10,
+            relative_demands="1,2,3,4,5,6,7,8,9,10",
+            workload_generator=generator)
+        # Give the stream enough time that it generates at least num_jobs.
+        stream = workload.job_stream(config, num_jobs * 2, random.Random(1))
+        start = time.time()
+        for job in itertools.islice(stream, num_jobs):
+            pass
+        elapsed = time.time() - start
+        print "%s\t%.2f\t%d" % (generator, elapsed, num_jobs / elapsed)
+
+def benchmark_parallel():
+    """ Times one large simulation with the sequential simulation and with
+    the parallel simulation (parallel.py), with up to one partition per core.
+
+    Every run has the same workload, so speedups are relative to the
+    sequential simulation (1 partition).  With more partitions than cores,
+    the times show the overhead of the parallel simulation instead.
+    """
+    num_servers = 20000
+    num_fes = 16
+    num_tasks = 10
+    task_length = 100
+    network_delay = 10
+    utilization = 0.8
+    total_time = 2000
+    arrival_delay = (float(task_length * num_tasks * num_fes) /
+                     (num_servers * utilization))
+    num_cores = multiprocessing.cpu_count()
+    max_partitions = max(num_cores, 2)
+    partition_counts = [1]
+    while partition_counts[-1] < max_partitions:
+        partition_counts.append(min(2 * partition_counts[-1],
+                                    max_partitions))
+    print ("Time to simulate %d servers for %d ms on %d cores" %
+           (num_servers, total_time, num_cores))
+    print "partitions\tseconds\tspeedup"
+    for partitions in partition_counts:
+        elapsed = time_simulation(["num_servers=%d" % num_servers,
+                                   "num_fes=%d" % num_fes,
+                                   "num_tasks=%d" % num_tasks,
+                                   "task_length=%d" % task_length,
+                                   "network_delay=%d" % network_delay,
+                                   "num_users=1",
+                                   "probes_ratio=2.0",
+                                   "job_arrival_delay=%f" % arrival_delay,
+                                   "total_time=%d" % total_time,
+                                   "partitions=%d" % partitions])
+        if partitions == 1:
+            sequential_elapsed = elapsed
+        print "%d\t%.2f\t%.2f" % (partitions, elapsed,
+                                   sequential_elapsed / elapsed)
+
+BENCHMARKS = {"deep_queues": benchmark_deep_queues,
+              "memory": benchmark_memory,
+              "output_stats": benchmark_output_stats,
+              "parallel": benchmark_parallel,
+              "probe_sampling": benchmark_probe_sampling,
+              "queue_selection": benchmark_queue_selection,
+              "workload": benchmark_workload,
+              "event_queue": benchmark_event_queue}
+
+def main(argv):
+    names = argv
+    if len(names) == 0:
+        names = sorted(BENCHMARKS.keys())
+    for name in names:
+        if name not in BENCHMARKS:
+            print ("Unknown benchmark %s; choices are %s" %
+                   (name, ", ".join(sorted(BENCHMARKS.keys()))))
+            sys.exit(1)
+        BENCHMARKS[name]()
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
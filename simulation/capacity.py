@@ -0,0 +1,125 @@
+""" Finds the highest utilization at which a configuration meets a response
+time SLO.
+
+Rather than sweeping utilization in fixed steps, bisects on utilization
+(by changing job_arrival_delay), assuming that response time grows with
+utilization.  At each utilization, replications run until the confidence
+interval for the response time metric is narrow (see replication.py); the
+utilization is sustainable if the upper end of the confidence interval
+meets the SLO.
+
+Usage: python capacity.py [slo_ms=v] [metric=mean|p50|p99]
+    [tolerance=v] [max_replications=v] [simulation parameters...]
+
+slo_ms defaults to twice task_length, and metric to p99.  The utilization
+tried at each step, and whether it met the SLO, are written to
+<file_prefix>_capacity in results_dir.
+"""
+
+import logging
+import os
+import sys
+
+import replication
+import simulation
+import sweep
+
+def point_for_utilization(args, utilization):
+    """ Returns the arguments for a simulation with the given args, but with
+    job_arrival_delay set so that the utilization is as given. """
+    config = simulation.SimulationConfig.from_args(args)
+    # Utilization is inversely proportional to the delay between jobs.
+    arrival_delay = (config.job_arrival_delay *
+                     simulation.offered_utilization(config) / utilization)
+    return args + ["job_arrival_delay=%f" % arrival_delay]
+
+def find_capacity(args, slo_ms, metric="p99", min_utilization=0.05,
+                  max_utilization=1.0, tolerance=0.01, max_replications=10,
+                  relative_half_width=0.05, processes=None):
+    """ Returns the highest utilization, to within tolerance, at which the
+    given metric meets the SLO.
+
+    Parameters:
+        args: "key=value" arguments describing the configuration.  Any
+            job_arrival_delay is replaced.
+        slo_ms: Largest acceptable value of the metric.
+        metric, max_replications, relative_half_width, processes: As for
+            replication.replicate.
+        min_utilization, max_utilization: The range of utilizations to
+            search.
+
+    Returns 0 if even min_utilization doesn't meet the SLO.
+    """
+    config = simulation.SimulationConfig.from_args(args)
+    sweep.make_dirs(config.results_dir)
+    filename = os.path.join(config.results_dir,
+                            "%s_capacity" % config.file_prefix)
+    results_file = open(filename, "w")
+    results_file.write("Util.\tJobArrivalDelay\tMean\tHalfWidth\t"
+                       "Replications\tMeetsSLO\n")
+    # Only the first simulation starts a new response time file.
+    first_time = [True]
+
+    def meets_slo(utilization):
+        point = point_for_utilization(args, utilization)
+        point.append("first_time=%s" % first_time[0])
+        first_time[0] = False
+        result = replication.replicate(
+            [point], metric=metric, relative_half_width=relative_half_width,
+            max_replications=max_replications, processes=processes)[0]
+        meets = result.mean + result.half_width <= slo_ms
+        point_config = simulation.SimulationConfig.from_args(point)
+        results_file.write("%f\t%f\t%f\t%f\t%d\t%s\n" %
+                           (utilization, point_config.job_arrival_delay,
+                            result.mean, result.half_width,
+                            len(result.values), meets))
+        results_file.flush()
+        logging.getLogger("Capacity").info(
+            "Utilization %f: %s %f +/- %f (%s the SLO)" %
+            (utilization, metric, result.mean, result.half_width,
+             ["misses", "meets"][meets]))
+        return meets
+
+    try:
+        if not meets_slo(min_utilization):
+            return 0
+        if meets_slo(max_utilization):
+            return max_utilization
+        # min_utilization always meets the SLO, and max_utilization doesn't.
+        while max_utilization - min_utilization > tolerance:
+            utilization = (min_utilization + max_utilization) / 2
+            if meets_slo(utilization):
+                min_utilization = utilization
+            else:
+                max_utilization = utilization
+        return min_utilization
+    finally:
+        results_file.close()
+
+def main(argv):
+    if len(argv) > 0 and "help" in argv[0]:
+        print __doc__
+        sys.exit(0)
+    options = {}
+    args = []
+    for arg in argv:
+        key, value = arg.split("=")
+        if key in ["slo_ms", "metric", "tolerance", "max_replications"]:
+            options[key] = value
+        else:
+            args.append(arg)
+    try:
+        config = simulation.SimulationConfig.from_args(args)
+    except ValueError as e:
+        print e
+        sys.exit(0)
+    logging.basicConfig(level=simulation.LEVELS.get(config.log_level))
+    slo_ms = float(options.get("slo_ms", 2 * config.task_length))
+    capacity = find_capacity(
+        args, slo_ms, metric=options.get("metric", "p99"),
+        tolerance=float(options.get("tolerance", 0.01)),
+        max_replications=int(options.get("max_replications", 10)))
+    print "Maximum utilization meeting the SLO: %f" % capacity
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -1,9 +1,9 @@
 """ This file runs multiple simulations to measure the effect of network delay.
 """
-import simulation
 import subprocess
 
 import stats
+import sweep
 
 class EffectOfNetworkDelay:
     def __init__(self):
@@ -31,6 +31,14 @@ class EffectOfNetworkDelay:
     def run_single(self, trial_number):
         """ Using -1 as the trial number indicates that this is for a 
         single run, so the trial number won't be included in the filename. """
+        points = self.sweep_points(trial_number)
+        # Seed each trial's points as run does, so the results are
+        # reproducible and are cached.
+        sweep.run_sweep(points, seed=max(trial_number, 0) * len(points))
+
+    def sweep_points(self, trial_number):
+        """ Returns the arguments for each simulation in the given trial. """
+        points = []
         avg_num_tasks = 200. / 6 + 5 * 10. / 6
         for network_delay, probes_ratio in zip(self.delay_values,
                                                self.probes_ratio_values):
@@ -42,16 +50,25 @@ class EffectOfNetworkDelay:
                 arrival_delay = (100. * avg_num_tasks *
                                  utilization_granularity /
                                  (self.num_servers * i))
-                simulation.main(["job_arrival_delay=%f" % arrival_delay,
-                                 "network_delay=%d" % network_delay,
-                                 "probes_ratio=%f" % probes_ratio,
-                                 "task_length_distribution=facebook",
-                                 "task_distribution=bimodal",
-                                 "file_prefix=%s" % file_prefix,
-                                 "num_servers=%d" % self.num_servers,
-                                 "total_time=%d" % self.total_time,
-                                 "first_time=%s" % first])
+                points.append(["job_arrival_delay=%f" % arrival_delay,
+                               "network_delay=%d" % network_delay,
+                               "probes_ratio=%f" % probes_ratio,
+                               "oracle_placement=%s" % (probes_ratio == -1),
+                               # Every network delay sees the same workload
+                               # at each utilization.  A single run
+                               # (trial -1) uses trial 0's workloads,
+                               # since negative seeds are ignored.
+                               "workload_seed=%d" %
+                               (max(trial_number, 0) *
+                                utilization_granularity + i),
+                               "task_length_distribution=facebook",
+                               "task_distribution=bimodal",
+                               "file_prefix=%s" % file_prefix,
+                               "num_servers=%d" % self.num_servers,
+                               "total_time=%d" % self.total_time,
+                               "first_time=%s" % first])
                 first = False
+        return points
         
     def graph_single(self):
         filename = "plot_single_network_delay.gp"
@@ -89,8 +106,11 @@ class EffectOfNetworkDelay:
         subprocess.call(["gnuplot", filename])
         
     def run(self, num_trials):
+        # Run all of the trials in one sweep, so that every core is used.
+        points = []
         for trial in range(num_trials):
-            self.run_single(trial)
+            points.extend(self.sweep_points(trial))
+        sweep.run_sweep(points, seed=0)
             
         filename = "plot_final_network_delay.gp"
         gnuplot_file = open(filename, 'w')
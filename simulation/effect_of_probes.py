@@ -1,8 +1,9 @@
 """ This file runs multiple simulations to measure the effect of probing. """
-import simulation
 import subprocess
 
+import replication
 import stats
+import sweep
 
 class EffectOfProbes:
     def __init__(self, file_prefix, remove_delay=False):
@@ -26,6 +27,14 @@ class EffectOfProbes:
     def run_single(self, trial_number):
         """ Using -1 as the trial number indicates that this is for a 
         single run, so the trial number won't be included in the filename. """
+        points = self.sweep_points(trial_number)
+        # Seed each trial's points as run does, so the results are
+        # reproducible and are cached.
+        sweep.run_sweep(points, seed=max(trial_number, 0) * len(points))
+
+    def sweep_points(self, trial_number):
+        """ Returns the arguments for each simulation in the given trial. """
+        points = []
         avg_num_tasks = 200.
         task_length = 100
         for probes_ratio in self.probes_ratio_values:
@@ -41,21 +50,30 @@ class EffectOfProbes:
                                  utilization_granularity /
                                  (self.num_servers * self.cores_per_server *
                                   i))
-                simulation.main(["job_arrival_delay=%f" % arrival_delay,
-                                 "num_users=1",
-                                 "network_delay=%d" % network_delay,
-                                 "probes_ratio=%f" % probes_ratio,
-                                 "task_length_distribution=constant",
-                                 "num_tasks=%d" % avg_num_tasks,
-                                 "task_length=%d" % task_length,
-                                 "task_distribution=constant",
-                                 "load_metric=total",
-                                 "cores_per_server=%d" % self.cores_per_server,
-                                 "file_prefix=%s" % file_prefix,
-                                 "num_servers=%d" % self.num_servers,
-                                 "total_time=%d" % self.total_time,
-                                 "first_time=%s" % first])
+                points.append(["job_arrival_delay=%f" % arrival_delay,
+                               "num_users=1",
+                               "network_delay=%d" % network_delay,
+                               "probes_ratio=%f" % probes_ratio,
+                               "oracle_placement=%s" % (probes_ratio == -1),
+                               # Every probes_ratio sees the same workload at
+                               # each utilization.  A single run (trial -1)
+                               # uses trial 0's workloads, since negative
+                               # seeds are ignored.
+                               "workload_seed=%d" %
+                               (max(trial_number, 0) *
+                                utilization_granularity + i),
+                               "task_length_distribution=constant",
+                               "num_tasks=%d" % avg_num_tasks,
+                               "task_length=%d" % task_length,
+                               "task_distribution=constant",
+                               "load_metric=total",
+                               "cores_per_server=%d" % self.cores_per_server,
+                               "file_prefix=%s" % file_prefix,
+                               "num_servers=%d" % self.num_servers,
+                               "total_time=%d" % self.total_time,
+                               "first_time=%s" % first])
                 first = False
+        return points
         
     def graph_single(self):
         """ Graphs the result of a single experiment. """
@@ -96,29 +114,14 @@ class EffectOfProbes:
             self.graph_single()
             return
 
+        print "********Running %s Trials**********" % num_trials
+        # Run all of the trials in one sweep, so that every core is used.
+        points = []
         for trial in range(num_trials):
-            print "********Running Trial %s**********" % trial
-            self.run_single(trial)
+            points.extend(self.sweep_points(trial))
+        sweep.run_sweep(points, seed=0)
             
-        filename = "plot_%s.gp" % self.file_prefix
-        gnuplot_file = open(filename, 'w')
-        gnuplot_file.write("set terminal postscript color 'Helvetica' 14\n")
-        #gnuplot_file.write("set size .5, .5\n")
-        gnuplot_file.write("set output 'graphs/%s.ps'\n" % self.file_prefix)
-        gnuplot_file.write("set xlabel 'Utilization'\n")
-        gnuplot_file.write("set ylabel 'Response Time (ms)'\n")
-        gnuplot_file.write("set yrange [0:700]\n")
-        gnuplot_file.write("set grid ytics\n")
-        #gnuplot_file.write("set xtics 0.25\n")
-        extra = ""
-        gnuplot_file.write("set title 'Effect of Load Probing on Response "
-                           "Time%s'\n" % extra)
-        #gnuplot_file.write("set key font 'Helvetica,10' left width -5"
-        #                   "title 'Probes:Tasks' samplen 2\n")
-        gnuplot_file.write("set key left\n")
-        gnuplot_file.write("plot ")
-        
-        for i, probes_ratio in enumerate(self.probes_ratio_values):
+        for probes_ratio in self.probes_ratio_values:
             # Aggregate results and write to a file.
             # Map of utilization to response times for that utilization.
             results = {}
@@ -140,16 +143,80 @@ class EffectOfProbes:
                         results[utilization] = []
                     results[utilization].append(normalized_response_time)
                     
-            agg_output_filename = ("raw_results/agg_%s_%f" %
-                                   (self.file_prefix, probes_ratio))
-            agg_output_file = open(agg_output_filename, "w")
+            agg_output_file = open(self.get_agg_filename(probes_ratio), "w")
             agg_output_file.write("Utilization\tResponseTime\tStdDev\n")
             for utilization in sorted(results.keys()):
                 avg_response_time = stats.lmean(results[utilization])
                 std_dev = stats.lstdev(results[utilization])
                 agg_output_file.write("%f\t%f\t%f\n" %
                                       (utilization, avg_response_time, std_dev))
-                
+            agg_output_file.close()
+
+        self.graph_aggregated()
+
+    def run_replicated(self, metric="p50", relative_half_width=0.05,
+                       max_replications=20):
+        """ Runs replications of each point until the confidence interval
+        for the given response time metric is narrow enough (see
+        replication.replicate), and graphs the means.
+
+        Each probes ratio is compared with the first probes ratio at the
+        same utilization, on the same workloads, so its replications stop
+        once the difference between them is known precisely enough.  The
+        aggregated results give the half-width of the confidence interval,
+        and the number of replications, for each utilization.
+        """
+        points = self.sweep_points(-1)
+        # sweep_points returns the points for each probes ratio in turn.
+        points_per_ratio = len(points) / len(self.probes_ratio_values)
+        references = ([None] * points_per_ratio +
+                      [index % points_per_ratio
+                       for index in range(points_per_ratio, len(points))])
+        results = replication.replicate(
+            points, metric=metric, relative_half_width=relative_half_width,
+            max_replications=max_replications, references=references)
+        for i, probes_ratio in enumerate(self.probes_ratio_values):
+            agg_output_file = open(self.get_agg_filename(probes_ratio), "w")
+            agg_output_file.write("Utilization\tResponseTime\tHalfWidth\t"
+                                  "Replications\n")
+            for result in results[i * points_per_ratio:
+                                  (i + 1) * points_per_ratio]:
+                response_time = result.mean
+                if self.remove_delay:
+                    response_time -= 3 * result.network_delay
+                agg_output_file.write("%f\t%f\t%f\t%d\n" %
+                                      (result.utilization, response_time,
+                                       result.half_width,
+                                       len(result.values)))
+            agg_output_file.close()
+
+        self.graph_aggregated()
+
+    def get_agg_filename(self, probes_ratio):
+        return "raw_results/agg_%s_%f" % (self.file_prefix, probes_ratio)
+
+    def graph_aggregated(self):
+        """ Graphs the aggregated results for each probes ratio. """
+        filename = "plot_%s.gp" % self.file_prefix
+        gnuplot_file = open(filename, 'w')
+        gnuplot_file.write("set terminal postscript color 'Helvetica' 14\n")
+        #gnuplot_file.write("set size .5, .5\n")
+        gnuplot_file.write("set output 'graphs/%s.ps'\n" % self.file_prefix)
+        gnuplot_file.write("set xlabel 'Utilization'\n")
+        gnuplot_file.write("set ylabel 'Response Time (ms)'\n")
+        gnuplot_file.write("set yrange [0:700]\n")
+        gnuplot_file.write("set grid ytics\n")
+        #gnuplot_file.write("set xtics 0.25\n")
+        extra = ""
+        gnuplot_file.write("set title 'Effect of Load Probing on Response "
+                           "Time%s'\n" % extra)
+        #gnuplot_file.write("set key font 'Helvetica,10' left width -5"
+        #                   "title 'Probes:Tasks' samplen 2\n")
+        gnuplot_file.write("set key left\n")
+        gnuplot_file.write("plot ")
+        
+        for i, probes_ratio in enumerate(self.probes_ratio_values):
+            agg_output_filename = self.get_agg_filename(probes_ratio)
             # Plot aggregated results.
             if i > 0:
                 gnuplot_file.write(', \\\n')
@@ -161,6 +228,7 @@ class EffectOfProbes:
                                (agg_output_filename, title, i))
             gnuplot_file.write(("'%s' using 1:2:3 notitle lt %d lw 4 with "
                                 "errorbars") % (agg_output_filename, i))
+        gnuplot_file.close()
             
         subprocess.call(["gnuplot", filename])
 
@@ -0,0 +1,165 @@
+""" Event queues used to drive the simulation.
+
+The simulation is single threaded, so the queues here avoid the locking done
+by Queue.PriorityQueue.  Events are stored as (time, sequence number, event)
+entries: the monotonically increasing sequence number breaks ties between
+events scheduled for the same time in the order they were added, so event
+objects themselves are never compared.
+"""
+
+import heapq
+
+class EventQueue(object):
+    """ Binary heap of events, ordered by time and then by insertion order.
+
+    Supports the subset of the Queue.PriorityQueue interface used by the
+    simulation: put() and get() take and return (time, event) tuples.
+    """
+    def __init__(self):
+        self.heap = []
+        self.sequence_number = 0
+
+    def put(self, time_and_event):
+        """ Adds a (time, event) tuple to the queue. """
+        time, event = time_and_event
+        heapq.heappush(self.heap, (time, self.sequence_number, event))
+        self.sequence_number += 1
+
+    def put_all(self, times_and_events):
+        """ Adds a list of (time, event) tuples to the queue.
+
+        Events are sequenced in list order, so this is equivalent to calling
+        put() on each tuple.  When the list is large relative to the queue,
+        the heap is rebuilt in linear time rather than pushing each entry.
+        """
+        sequence_number = self.sequence_number
+        entries = []
+        for time, event in times_and_events:
+            entries.append((time, sequence_number, event))
+            sequence_number += 1
+        self.sequence_number = sequence_number
+        if len(entries) > len(self.heap):
+            self.heap.extend(entries)
+            heapq.heapify(self.heap)
+        else:
+            for entry in entries:
+                heapq.heappush(self.heap, entry)
+
+    def get(self):
+        """ Removes and returns the earliest (time, event) tuple. """
+        time, sequence_number, event = heapq.heappop(self.heap)
+        return time, event
+
+    def peek_time(self):
+        """ Returns the time of the earliest event, without removing it. """
+        return self.heap[0][0]
+
+    def empty(self):
+        return len(self.heap) == 0
+
+    def qsize(self):
+        return len(self.heap)
+
+    def __len__(self):
+        return len(self.heap)
+
+class TimingWheelEventQueue(object):
+    """ Timing wheel of events, for simulations with integer times.
+
+    Events at an integer time within wheel_size milliseconds of the wheel's
+    cursor are appended to that millisecond's slot in O(1).  Events at
+    fractional times (e.g., from exponentially distributed task lengths) and
+    events too far in the future are kept in an overflow heap.  get() returns
+    whichever of the next wheel entry and the top of the heap is earlier, so
+    events come out in exactly the same (time, insertion order) sequence as
+    from EventQueue.
+    """
+    def __init__(self, wheel_size=4096):
+        self.wheel_size = wheel_size
+        # Each slot holds a list of (time, sequence number, event) entries,
+        # all with the same time, in insertion order.
+        self.slots = [[] for i in range(wheel_size)]
+        # Index of the first entry in each slot that has not been removed.
+        self.slot_starts = [0] * wheel_size
+        # Time of the earliest slot that may hold events.  Integer events
+        # before the cursor go in the overflow heap.
+        self.cursor = 0
+        self.wheel_entries = 0
+        self.overflow = []
+        self.sequence_number = 0
+
+    def put(self, time_and_event):
+        """ Adds a (time, event) tuple to the queue. """
+        self.put_all((time_and_event,))
+
+    def put_all(self, times_and_events):
+        """ Adds a list of (time, event) tuples to the queue, in list order.
+        """
+        slots = self.slots
+        wheel_size = self.wheel_size
+        sequence_number = self.sequence_number
+        for time, event in times_and_events:
+            int_time = int(time)
+            if int_time == time:
+                if self.wheel_entries == 0:
+                    # No events are in the wheel, so it can be moved to start
+                    # at this event's time.
+                    self.cursor = int_time
+                if 0 <= int_time - self.cursor < wheel_size:
+                    slots[int_time % wheel_size].append(
+                        (time, sequence_number, event))
+                    self.wheel_entries += 1
+                    sequence_number += 1
+                    continue
+            heapq.heappush(self.overflow, (time, sequence_number, event))
+            sequence_number += 1
+        self.sequence_number = sequence_number
+
+    def get(self):
+        """ Removes and returns the earliest (time, event) tuple. """
+        if self.wheel_entries > 0:
+            # Move the cursor to the earliest non-empty slot.
+            slots = self.slots
+            slot_starts = self.slot_starts
+            index = self.cursor % self.wheel_size
+            slot_start = slot_starts[index]
+            while slot_start == len(slots[index]):
+                if slot_start > 0:
+                    slots[index] = []
+                    slot_starts[index] = 0
+                self.cursor += 1
+                index = self.cursor % self.wheel_size
+                slot_start = slot_starts[index]
+            entry = slots[index][slot_start]
+            if not self.overflow or entry < self.overflow[0]:
+                slot_starts[index] = slot_start + 1
+                self.wheel_entries -= 1
+                return entry[0], entry[2]
+        time, sequence_number, event = heapq.heappop(self.overflow)
+        return time, event
+
+    def peek_time(self):
+        """ Returns the time of the earliest event, without removing it. """
+        if self.wheel_entries > 0:
+            # Move the cursor to the earliest non-empty slot, as get() does.
+            slots = self.slots
+            index = self.cursor % self.wheel_size
+            while self.slot_starts[index] == len(slots[index]):
+                if self.slot_starts[index] > 0:
+                    slots[index] = []
+                    self.slot_starts[index] = 0
+                self.cursor += 1
+                index = self.cursor % self.wheel_size
+            entry = slots[index][self.slot_starts[index]]
+            if not self.overflow or entry < self.overflow[0]:
+                return entry[0]
+        return self.overflow[0][0]
+
+    def empty(self):
+        return self.wheel_entries == 0 and len(self.overflow) == 0
+
+    def qsize(self):
+        return self.wheel_entries + len(self.overflow)
+
+    def __len__(self):
+        return self.qsize()
@@ -4,6 +4,7 @@
 import simulation
 import stats
 import subprocess
+import sweep
 
 def fairness_time(load_metric, cores_per_server):
     """ Plots the number of running tasks for each user, over time. """
@@ -79,31 +80,32 @@ def fairness_isolation(load_metric, network_delay, probes_ratio,
     constant_demand_per_milli = capacity_tasks_per_milli / 4.0
     changing_demand_per_milli = capacity_tasks_per_milli / 4.0
     first = True
+    points = []
     while changing_demand_per_milli < (1.5 * capacity_tasks_per_milli):
         total_demand = constant_demand_per_milli + changing_demand_per_milli
         arrival_delay = float(num_tasks) / total_demand
-        simulation.main(["job_arrival_delay=%f" % arrival_delay,
-                         "network_delay=%d" % network_delay,
-                         "probes_ratio=%f" % probes_ratio,
-                         "task_length_distribution=constant",
-                         "task_distribution=constant",
-                         "job_arrival_distribution=poisson",
-                         "deterministic=True",
-                         "file_prefix=%s" % file_prefix,
-                         "num_users=%d" % num_users,
-                         "num_servers=%d" % num_servers,
-                         "cores_per_server=%d" % cores_per_server,
-                         "num_tasks=%d" % num_tasks,
-                         "task_length=%d" % task_length,
-                         "total_time=%d" % total_time,
-                         "load_metric=%s" % load_metric,
-                         ("relative_demands=%d,%d" % 
-                          (constant_demand_per_milli,
-                           changing_demand_per_milli)),
-                         "first_time=%s" % first])
+        points.append(["job_arrival_delay=%f" % arrival_delay,
+                       "network_delay=%d" % network_delay,
+                       "probes_ratio=%f" % probes_ratio,
+                       "task_length_distribution=constant",
+                       "task_distribution=constant",
+                       "job_arrival_distribution=poisson",
+                       "deterministic=True",
+                       "file_prefix=%s" % file_prefix,
+                       "num_users=%d" % num_users,
+                       "num_servers=%d" % num_servers,
+                       "cores_per_server=%d" % cores_per_server,
+                       "num_tasks=%d" % num_tasks,
+                       "task_length=%d" % task_length,
+                       "total_time=%d" % total_time,
+                       "load_metric=%s" % load_metric,
+                       ("relative_demands=%d,%d" % 
+                        (constant_demand_per_milli,
+                         changing_demand_per_milli)),
+                       "first_time=%s" % first])
         first = False
         changing_demand_per_milli += 0.1 * capacity_tasks_per_milli
-        first = False
+    sweep.run_sweep(points)
       
     gnuplot_filename = "plot_fairness_isolation.gp"
     gnuplot_file = open(gnuplot_filename, "w")
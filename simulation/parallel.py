@@ -0,0 +1,479 @@
+""" Runs a single simulation in parallel, on several cores.
+
+The servers and front ends are divided among the simulation's partitions
+(server or front end i belongs to partition i % partitions), each of which
+runs in its own process with its own event queue.  Front ends and servers
+only interact through probes, probe replies, and task placements, each of
+which takes network_delay to arrive, so these are sent between partitions as
+messages.  Partitions are synchronized conservatively, in windows: if T is
+the earliest time of any pending event or message, no message sent at or
+after T can arrive before T + network_delay, so every partition can run its
+events before T + network_delay without waiting for the others.  At the end
+of each window, the messages sent during it are delivered, and the next
+window starts at the new earliest time.  Windows are only long enough to be
+worthwhile when there are many events per network_delay, as with large
+clusters.
+
+Task completions only change the state of the server that ran the task, so
+they aren't sent anywhere while the simulation runs.  Instead, when the
+simulation finishes, each partition reports when its part of each job
+completed, and the running and queued task counts over time, and these are
+merged into one StatsManager, which writes the same results files as the
+sequential simulation.
+
+Results are statistically equivalent to, rather than the same as, the
+sequential simulation's.  The workload is identical, since each front end's
+jobs are seeded exactly as in Simulation.create_jobs, but each partition
+makes its random choices (e.g., which servers to probe) with its own random
+number generator, and simultaneous events in different partitions may run
+in a different order.
+
+Usage: python simulation.py partitions=N [simulation parameters...]
+"""
+
+import array
+import cPickle
+import heapq
+import itertools
+import logging
+import multiprocessing
+import random
+
+import event_queue
+import simulation
+
+# Kinds of messages sent between partitions.  Every message is a tuple of
+# its delivery time, its kind, and then the kind's fields:
+#   PROBE: source partition, job id, user id, ids of the servers to probe.
+#   PROBE_REPLY: job id, list of (server id, load) pairs.
+#   TASKS: job id, user id, job arrival time, list of (server id, task
+#       length) pairs, one for each task placed in the partition.
+PROBE = 0
+PROBE_REPLY = 1
+TASKS = 2
+
+class PartitionStatsManager(simulation.StatsManager):
+    """ StatsManager for the servers in one partition.
+
+    Each partition only runs some of a job's tasks, so rather than keeping
+    completed jobs, records a (job id, user id, arrival time, number of
+    tasks, first task completion, completion time, longest task) tuple for
+    the part of each job that ran in the partition.
+    """
+    def __init__(self, config):
+        simulation.StatsManager.__init__(self, config)
+        self.completed_parts = []
+
+    def job_finished(self, job):
+        self.num_completed_jobs += 1
+        self.completed_parts.append(
+            (job.id_str, job.user_id, job.arrival_time, job.num_tasks,
+             job.first_task_completion, job.completion_time,
+             job.longest_task))
+
+class PartitionFrontEnd(simulation.FrontEnd):
+    """ Front end that sends its probes and tasks to servers in any
+    partition, as messages.
+
+    Servers are identified by their ids, rather than by Server objects.
+    """
+    __slots__ = ("partition",)
+
+    def __init__(self, server_ids, id_str, stats_manager, config, rng,
+                 partition):
+        simulation.FrontEnd.__init__(self, server_ids, id_str, stats_manager,
+                                     config, rng)
+        self.partition = partition
+
+    def place_job(self, job, current_time):
+        for probe_time, probe in simulation.FrontEnd.place_job(
+                self, job, current_time):
+            self.partition.send_probe(probe_time, probe)
+        return []
+
+    def probe_completed(self, job, queue_lengths, current_time):
+        for arrival_time, arrival in simulation.FrontEnd.probe_completed(
+                self, job, queue_lengths, current_time):
+            self.partition.send_tasks(arrival_time, arrival)
+        return []
+
+class ServerProbe(simulation.Event):
+    """ Event to probe the servers, in this partition, that a front end in
+    another partition (or in this one) chose to probe. """
+    __slots__ = ("partition", "source", "job_id", "user_id", "server_ids")
+
+    def __init__(self, partition, source, job_id, user_id, server_ids):
+        self.partition = partition
+        self.source = source
+        self.job_id = job_id
+        self.user_id = user_id
+        self.server_ids = server_ids
+
+    def run(self, current_time):
+        servers = self.partition.servers
+        loads = [(server_id,
+                  servers[server_id].probe_load(self.user_id, current_time))
+                 for server_id in self.server_ids]
+        self.partition.send(self.source,
+                            (current_time + self.partition.network_delay,
+                             PROBE_REPLY, self.job_id, loads))
+        return []
+
+class Partition(object):
+    """ The servers and front ends simulated by one process.
+
+    Attributes:
+        index: Index of this partition.
+        servers: Dictionary mapping the id of each server in this partition
+            to its Server.
+        outbox: For each partition, the list of messages sent to it during
+            the current window.
+        pending_probes: Maps the id of each job that a front end in this
+            partition is probing for to a list of its Probe, the number of
+            partitions that haven't replied yet, and a dictionary of the
+            loads replied so far.
+    """
+    def __init__(self, config, index):
+        self.config = config
+        self.index = index
+        self.num_partitions = config.partitions
+        self.network_delay = config.network_delay
+        workload_seed_rng, rng = simulation.make_rngs(config)
+        # Every partition draws the same list of seeds and uses its own, so
+        # the partitions' random choices are independent, but reproducible
+        # with deterministic=True.
+        seeds = [rng.getrandbits(64) for i in range(self.num_partitions)]
+        self.rng = random.Random(seeds[index])
+        if config.event_queue == "timing_wheel":
+            self.event_queue = event_queue.TimingWheelEventQueue()
+        else:
+            self.event_queue = event_queue.EventQueue()
+        self.events_processed = 0
+        self.peak_queue_size = 0
+        self.stats_manager = PartitionStatsManager(config)
+        self.outbox = [[] for i in range(self.num_partitions)]
+        self.pending_probes = {}
+        # The result of the window run by start_window.
+        self.window_result = None
+
+        self.servers = {}
+        for server_id in range(index, config.num_servers,
+                               self.num_partitions):
+            self.servers[server_id] = simulation.Server(
+                server_id, self.stats_manager, config)
+
+        server_ids = range(config.num_servers)
+        for front_end_id in range(config.num_fes):
+            # Seeds are drawn for every front end, exactly as in
+            # Simulation.create_jobs, so each front end gets the same
+            # workload as in the sequential simulation.
+            workload_rng = random.Random(workload_seed_rng.getrandbits(64))
+            task_length_rng = random.Random(workload_seed_rng.getrandbits(64))
+            if front_end_id % self.num_partitions != index:
+                continue
+            front_end = PartitionFrontEnd(server_ids, front_end_id,
+                                          self.stats_manager, config,
+                                          self.rng, self)
+            arrivals = simulation.job_arrivals(
+                config, front_end.id_str, config.total_time,
+                self.stats_manager, workload_rng, task_length_rng)
+            first_job = next(arrivals, None)
+            if first_job is not None:
+                self.event_queue.put((first_job.arrival_time,
+                                      simulation.JobArrival(
+                                          first_job, front_end, arrivals)))
+
+    def partition_of(self, server_id):
+        return server_id % self.num_partitions
+
+    def send(self, partition, message):
+        self.outbox[partition].append(message)
+
+    def send_probe(self, probe_time, probe):
+        """ Sends a Probe to the partitions with the servers it probes. """
+        server_ids = [[] for i in range(self.num_partitions)]
+        for server_id in probe.servers:
+            server_ids[self.partition_of(server_id)].append(server_id)
+        num_replies = 0
+        for partition, ids in enumerate(server_ids):
+            if len(ids) > 0:
+                self.send(partition, (probe_time, PROBE, self.index,
+                                      probe.job.id_str, probe.job.user_id,
+                                      ids))
+                num_replies += 1
+        self.pending_probes[probe.job.id_str] = [probe, num_replies, {}]
+
+    def send_tasks(self, arrival_time, arrival):
+        """ Sends the tasks in a BatchedTaskArrival to the partitions with the
+        servers they were placed on. """
+        job = arrival.job
+        tasks = [[] for i in range(self.num_partitions)]
+        for server_id, task_index in arrival.placements:
+            tasks[self.partition_of(server_id)].append(
+                (server_id, job.task_lengths[task_index]))
+        for partition, partition_tasks in enumerate(tasks):
+            if len(partition_tasks) > 0:
+                self.send(partition, (arrival_time, TASKS, job.id_str,
+                                      job.user_id, job.arrival_time,
+                                      partition_tasks))
+
+    def deliver(self, messages):
+        """ Adds the events for the given messages to the event queue. """
+        events = []
+        for message in messages:
+            time, kind = message[:2]
+            if kind == PROBE:
+                source, job_id, user_id, server_ids = message[2:]
+                events.append((time, ServerProbe(self, source, job_id,
+                                                 user_id, server_ids)))
+            elif kind == PROBE_REPLY:
+                job_id, loads = message[2:]
+                pending = self.pending_probes[job_id]
+                pending[1] -= 1
+                pending[2].update(loads)
+                if pending[1] == 0:
+                    # All of the replies are in; the probe returns to its front
+                    # end with the loads in the order the servers were probed.
+                    del self.pending_probes[job_id]
+                    probe, num_replies, loads = pending
+                    probe.queue_lengths = [(server_id, loads[server_id])
+                                           for server_id in probe.servers]
+                    events.append((time, probe))
+            else:
+                job_id, user_id, arrival_time, tasks = message[2:]
+                # This partition's part of the job.
+                job = simulation.Job(user_id, arrival_time, len(tasks),
+                                     self.config.task_length,
+                                     self.stats_manager, job_id,
+                                     (length for server_id, length in tasks))
+                placements = [(self.servers[server_id], task_index)
+                              for task_index, (server_id, length)
+                              in enumerate(tasks)]
+                events.append((time, simulation.BatchedTaskArrival(
+                    job, placements)))
+        self.event_queue.put_all(events)
+
+    def run_window(self, end_time, messages):
+        """ Delivers messages, and then runs the events before end_time.
+
+        Returns a (messages for each partition, earliest time) tuple, where
+        the earliest time is that of the first event left in the event queue
+        or of the first message sent, whichever is earlier (or None if there
+        are neither).
+        """
+        self.deliver(messages)
+        queue = self.event_queue
+        while not queue.empty() and queue.peek_time() < end_time:
+            current_time, event = queue.get()
+            new_events = event.run(current_time)
+            self.events_processed += 1
+            if new_events:
+                queue.put_all(new_events)
+                if len(queue) > self.peak_queue_size:
+                    self.peak_queue_size = len(queue)
+
+        outbox = self.outbox
+        self.outbox = [[] for i in range(self.num_partitions)]
+        times = [message[0] for messages in outbox for message in messages]
+        if not queue.empty():
+            times.append(queue.peek_time())
+        earliest_time = None
+        if len(times) > 0:
+            earliest_time = min(times)
+        return outbox, earliest_time
+
+    def start_window(self, end_time, batches):
+        """ Runs a window, delivering the lists of messages in batches. """
+        self.window_result = self.run_window(end_time,
+                                             itertools.chain(*batches))
+
+    def finish_window(self):
+        return self.window_result
+
+    def results(self):
+        """ Returns the statistics collected by this partition, as a tuple
+        of the running tasks for each user, the total running tasks, the
+        enqueued tasks for each user, the total enqueued tasks, the completed
+        job parts, the number of events processed, and the peak event queue
+        size. """
+        stats_manager = self.stats_manager
+        return (stats_manager.running_tasks, stats_manager.total_running_tasks,
+                stats_manager.enqueued_tasks,
+                stats_manager.total_enqueued_tasks,
+                stats_manager.completed_parts, self.events_processed,
+                self.peak_queue_size)
+
+def serve_partition(config, index, connection):
+    """ Runs a Partition for PartitionProcess, in a child process.
+
+    Messages are pickled here, once for each destination partition, so that
+    the coordinator can pass them on without unpickling them.
+    """
+    partition = Partition(config, index)
+    while True:
+        request = connection.recv()
+        if request is None:
+            connection.send(partition.results())
+            break
+        end_time, batches = request
+        messages = itertools.chain(*[cPickle.loads(batch)
+                                     for batch in batches])
+        outbox, earliest_time = partition.run_window(end_time, messages)
+        connection.send(([cPickle.dumps(partition_messages,
+                                        cPickle.HIGHEST_PROTOCOL)
+                          for partition_messages in outbox],
+                         earliest_time))
+    connection.close()
+
+class PartitionProcess(object):
+    """ Runs a Partition in a child process.
+
+    Has the same start_window, finish_window, and results methods as a
+    Partition, so that all of the partitions can run a window at once.
+    """
+    def __init__(self, config, index):
+        self.connection, child_connection = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=serve_partition, args=(config, index, child_connection))
+        self.process.daemon = True
+        self.process.start()
+
+    def start_window(self, end_time, batches):
+        self.connection.send((end_time, batches))
+
+    def finish_window(self):
+        return self.connection.recv()
+
+    def results(self):
+        self.connection.send(None)
+        results = self.connection.recv()
+        self.process.join()
+        return results
+
+def merge_time_series(series_list):
+    """ Returns a TimeSeries whose count is the sum of the counts of the
+    given TimeSeries.
+
+    Changes made at the same time are merged in the order of series_list,
+    and then in the order they were made.
+    """
+    merged = simulation.TimeSeries()
+    if simulation.N is not None:
+        N = simulation.N
+        times = []
+        changes = []
+        for series in series_list:
+            if len(series) > 0:
+                times.append(N.frombuffer(series.times, dtype=N.float64))
+                counts = N.frombuffer(series.counts, dtype=N.intc)
+                changes.append(N.diff(N.concatenate(([0], counts))))
+        if len(times) > 0:
+            times = N.concatenate(times)
+            # A stable sort keeps changes made at the same time in order.
+            order = N.argsort(times, kind="mergesort")
+            counts = N.cumsum(N.concatenate(changes)[order]).astype(N.intc)
+            merged.times = array.array("d", times[order].tostring())
+            merged.counts = array.array("i", counts.tostring())
+            merged.count = int(counts[-1])
+        return merged
+
+    def changes(index, series):
+        previous_count = 0
+        for sequence_number, (time, count) in enumerate(series):
+            yield time, index, sequence_number, count - previous_count
+            previous_count = count
+    for time, index, sequence_number, change in heapq.merge(
+            *[changes(index, series)
+              for index, series in enumerate(series_list)]):
+        merged.add(time, change)
+    return merged
+
+def merge_results(config, results):
+    """ Returns a StatsManager with the statistics from every partition's
+    results. """
+    stats_manager = simulation.StatsManager(config)
+    for user_id in range(config.num_users):
+        stats_manager.running_tasks[user_id] = merge_time_series(
+            [result[0][user_id] for result in results])
+        stats_manager.enqueued_tasks[user_id] = merge_time_series(
+            [result[2][user_id] for result in results])
+    stats_manager.total_running_tasks = merge_time_series(
+        [result[1] for result in results])
+    stats_manager.total_enqueued_tasks = sum(
+        [result[3] for result in results])
+
+    # Combine the parts of each job, from each partition its tasks ran in.
+    jobs = {}
+    for result in results:
+        for (job_id, user_id, arrival_time, num_tasks, first_task_completion,
+             completion_time, longest_task) in result[4]:
+            job = jobs.get(job_id)
+            if job is None:
+                job = simulation.Job(user_id, arrival_time, 0,
+                                     config.task_length, stats_manager,
+                                     job_id, iter(()))
+                job.first_task_completion = first_task_completion
+                jobs[job_id] = job
+            job.num_tasks += num_tasks
+            job.tasks_finished += num_tasks
+            job.first_task_completion = min(job.first_task_completion,
+                                            first_task_completion)
+            job.completion_time = max(job.completion_time, completion_time)
+            job.longest_task = max(job.longest_task, longest_task)
+    completed_jobs = jobs.values()
+    completed_jobs.sort(key=lambda job: (job.completion_time, job.id_str))
+    for job in completed_jobs:
+        job.task_lengths = None
+        stats_manager.job_finished(job)
+    return stats_manager
+
+def run(config, use_processes=True):
+    """ Runs the simulation described by config, with config.partitions
+    partitions, and writes its results.
+
+    Parameters:
+        use_processes: Whether to run each partition in its own process.
+            Otherwise, the partitions take turns running each window in
+            this process, which gives the same results.
+
+    Returns the merged StatsManager.
+    """
+    logger = logging.getLogger("Parallel")
+    if use_processes:
+        partitions = [PartitionProcess(config, index)
+                      for index in range(config.partitions)]
+    else:
+        partitions = [Partition(config, index)
+                      for index in range(config.partitions)]
+    # An empty window, before any time, finds the first event.  Each inbox
+    # is a list of the batches of messages sent to a partition by each
+    # partition in the last window.
+    inboxes = [[] for partition in partitions]
+    end_time = float("-inf")
+    num_windows = 0
+    while True:
+        for partition, inbox in zip(partitions, inboxes):
+            partition.start_window(end_time, inbox)
+        inboxes = [[] for partition in partitions]
+        earliest_time = None
+        for partition in partitions:
+            outbox, partition_time = partition.finish_window()
+            for inbox, batch in zip(inboxes, outbox):
+                inbox.append(batch)
+            if partition_time is not None and (earliest_time is None or
+                                               partition_time < earliest_time):
+                earliest_time = partition_time
+        if earliest_time is None:
+            break
+        end_time = earliest_time + config.network_delay
+        num_windows += 1
+
+    results = [partition.results() for partition in partitions]
+    logger.info("Processed %d events in %d windows" %
+                (sum([result[5] for result in results]), num_windows))
+    logger.info("Peak event queue size: %d" %
+                max([result[6] for result in results]))
+    stats_manager = merge_results(config, results)
+    stats_manager.output_stats()
+    simulation.output_params(config)
+    return stats_manager
@@ -0,0 +1,118 @@
+""" Mergeable sketches for summarizing a stream of values in bounded memory.
+
+Used by the simulation to summarize job response times without keeping
+every completed job.
+"""
+
+import math
+
+class LogHistogram(object):
+    """ Histogram with logarithmically sized buckets.
+
+    Each positive value is counted in the bucket i with
+    gamma^(i-1) < value <= gamma^i, where gamma = (1 + a) / (1 - a) for the
+    relative accuracy a.  A bucket is represented by a value within a
+    fraction a of every value in it, so quantiles are accurate to within a
+    relative error of a, using memory proportional to the logarithm of the
+    range of values rather than to the number of values.  Values that are
+    not positive are counted in a separate bucket represented by 0.
+
+    The exact count, mean, standard deviation, minimum and maximum are also
+    tracked.  Two histograms with the same accuracy can be merged.
+    """
+    def __init__(self, relative_accuracy=0.01):
+        assert 0 < relative_accuracy < 1
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        # Maps bucket index to the number of values in the bucket.
+        self.buckets = {}
+        self.zero_count = 0
+        self.count = 0
+        self.min = None
+        self.max = None
+        # Running mean and sum of squared differences from the mean, for
+        # computing the standard deviation (Welford's method).
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value):
+        """ Adds a value to the histogram. """
+        if value > 0:
+            index = int(math.ceil(math.log(value) / self.log_gamma))
+            self.buckets[index] = self.buckets.get(index, 0) + 1
+        else:
+            self.zero_count += 1
+        self.count += 1
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def merge(self, other):
+        """ Adds all of the values in another histogram to this one. """
+        assert other.relative_accuracy == self.relative_accuracy
+        if other.count == 0:
+            return
+        for index, count in other.buckets.iteritems():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.zero_count += other.zero_count
+        if self.min is None or other.min < self.min:
+            self.min = other.min
+        if self.max is None or other.max > self.max:
+            self.max = other.max
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + (delta * delta * self.count * other.count /
+                               count)
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def stdev(self):
+        """ Returns the sample standard deviation of the values, or 0 if
+        there are fewer than two values. """
+        if self.count < 2:
+            return 0.0
+        return math.sqrt(self.m2 / (self.count - 1))
+
+    def __value_at_rank(self, rank, sorted_buckets):
+        """ Returns an estimate of the value with the given (0-based) rank.
+        """
+        if rank < self.zero_count:
+            return 0
+        seen = self.zero_count
+        for index, count in sorted_buckets:
+            seen += count
+            if rank < seen:
+                value = 2 * self.gamma ** index / (self.gamma + 1)
+                # The estimate can't be outside the range of the values.
+                return max(self.min, min(self.max, value))
+        return self.max
+
+    def quantile(self, percent):
+        """ Returns an estimate of the given quantile of the values.
+
+        Like StatsManager.percentile, interpolates between the values with
+        the ranks on either side of (count - 1) * percent.  Returns None if
+        the histogram is empty.
+
+        Arguments:
+            percent: Float value from 0.0 to 1.0.
+        """
+        if self.count == 0:
+            return None
+        sorted_buckets = sorted(self.buckets.items())
+        k = (self.count - 1) * percent
+        f = math.floor(k)
+        c = math.ceil(k)
+        if f == c:
+            return self.__value_at_rank(int(k), sorted_buckets)
+        d0 = self.__value_at_rank(int(f), sorted_buckets) * (c - k)
+        d1 = self.__value_at_rank(int(c), sorted_buckets) * (k - f)
+        return d0 + d1
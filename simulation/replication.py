@@ -0,0 +1,237 @@
+""" Runs independent replications of simulation points until the response
+time is known precisely enough.
+
+Each replication of a point is a simulation with the point's parameters and
+its own random seed (and its own workload_seed, if the point sets one).
+Replications continue until the confidence interval for the chosen metric is
+narrower than the target, relative to the metric's mean, or until a maximum
+number of replications have run.  A point can instead be compared with a
+reference point (e.g., another policy): each of its replications runs on the
+same workload as the reference's replication with the same index, and
+replications continue until the confidence interval for the per-replication
+differences from the reference is narrow enough.  Since the workload's noise
+cancels in the differences, paired points usually need fewer replications.
+Replications of all of the points that need them run together, in parallel
+(see sweep.py), and are cached like sweep points.
+"""
+
+import os
+import shutil
+
+import simulation
+import stats
+import sweep
+
+# Metric name => column of the metric in the response time file.
+METRIC_COLUMNS = {"mean": 3, "p50": 6, "p99": 8}
+
+# Columns of the response time file used to describe each point.
+UTILIZATION_COLUMN = 2
+NETWORK_DELAY_COLUMN = 9
+
+def t_critical_value(df, confidence):
+    """ Returns the value t such that a Student's t random variable with df
+    degrees of freedom lies in [-t, t] with probability confidence. """
+    alpha = 1 - confidence
+    def two_tailed_prob(t):
+        return stats.lbetai(0.5 * df, 0.5, float(df) / (df + t * t))
+    low = 0.0
+    high = 1.0
+    while two_tailed_prob(high) > alpha:
+        high *= 2
+    # two_tailed_prob decreases with t, so find t by bisection.
+    for i in range(60):
+        middle = (low + high) / 2
+        if two_tailed_prob(middle) > alpha:
+            low = middle
+        else:
+            high = middle
+    return high
+
+def confidence_interval(values, confidence):
+    """ Returns the mean of values and the half-width of its confidence
+    interval. """
+    mean = stats.lmean(values)
+    half_width = (t_critical_value(len(values) - 1, confidence) *
+                  stats.lsterr(values))
+    return mean, half_width
+
+class Replications(object):
+    """ Replications of one point.
+
+    Attributes:
+        point: List of "key=value" arguments for the point.
+        values: The metric from each replication so far.
+        utilization: Utilization of the point.
+        network_delay: Network delay of the point.
+        workload_seed: The point's workload_seed (-1 if it doesn't set
+            one).
+        mean, half_width: Mean of values, and the half-width of its
+            confidence interval (-1 until there are two replications).
+        reference: The Replications of the point this point is compared
+            with, or None.
+        difference_mean, difference_half_width: Mean of the differences
+            between values and the reference's values from the same
+            replications, and the half-width of its confidence interval (-1
+            until there are two differences).
+    """
+    def __init__(self, point, reference=None):
+        self.point = point
+        self.workload_seed = simulation.SimulationConfig.from_args(
+            point).workload_seed
+        self.values = []
+        self.utilization = -1
+        self.network_delay = -1
+        self.mean = -1
+        self.half_width = -1
+        self.reference = reference
+        self.difference_mean = 0
+        self.difference_half_width = -1
+
+    def add(self, row, metric, confidence):
+        """ Adds the given row of the response time file from a new
+        replication. """
+        self.utilization = float(row[UTILIZATION_COLUMN])
+        self.network_delay = float(row[NETWORK_DELAY_COLUMN])
+        self.values.append(float(row[METRIC_COLUMNS[metric]]))
+        if len(self.values) > 1:
+            self.mean, self.half_width = confidence_interval(self.values,
+                                                             confidence)
+
+    def compare(self, confidence):
+        """ Updates the confidence interval for the differences from the
+        reference, over the replications both points have run. """
+        differences = [value - reference_value for value, reference_value
+                       in zip(self.values, self.reference.values)]
+        if len(differences) > 1:
+            self.difference_mean, self.difference_half_width = (
+                confidence_interval(differences, confidence))
+
+    def converged(self, relative_half_width):
+        """ Returns whether the metric (or, for a point with a reference, its
+        difference from the reference) is known to within
+        relative_half_width of the metric's mean. """
+        if self.reference is None:
+            return (len(self.values) > 1 and
+                    self.half_width <= relative_half_width * abs(self.mean))
+        return (self.difference_half_width >= 0 and
+                self.difference_half_width <=
+                relative_half_width * abs(self.mean))
+
+def read_row(args, point_dir):
+    """ Returns the row of the response time file for the given point, split
+    into columns. """
+    config = simulation.SimulationConfig.from_args(args)
+    results_file = open(os.path.join(point_dir, "%s_response_time" %
+                                     config.file_prefix))
+    # Skip the header.
+    results_file.readline()
+    row = results_file.readline().split("\t")
+    results_file.close()
+    return row
+
+def replicate(points, metric="p50", relative_half_width=0.05,
+              confidence=0.95, min_replications=2, max_replications=20,
+              seed=1, references=None, processes=None, use_cache=True):
+    """ Runs replications of each point until the metric is known precisely
+    enough, and writes a summary of each point.
+
+    Parameters:
+        points: List of points, each a list of "key=value" arguments.
+        metric: "mean", "p50" or "p99" response time.
+        relative_half_width: Replications of a point stop once the
+            half-width of the confidence interval for the metric is at most
+            this fraction of the metric's mean.
+        confidence: Confidence level of the confidence intervals.
+        min_replications, max_replications: Bounds on the number of
+            replications of each point.
+        seed: Replication r of point i runs with random_seed
+            seed + i * max_replications + r, and, if the point sets its own
+            workload_seed, with that workload_seed too.
+        references: If given, a list with, for each point, the index of
+            the point to compare it with, or None.  Replication r of every
+            point then runs with workload_seed seed + r, so that paired
+            replications see the same workload; a point with a reference
+            stops once its difference from the reference has converged, and
+            a reference runs at least as many replications as the points
+            compared with it.
+        processes, use_cache: As for sweep.run_sweep.
+
+    Returns a Replications for each point.  The summary for each point is
+    appended to the <file_prefix>_replications file in results_dir (which is
+    first truncated if the point sets first_time=True).
+    """
+    assert metric in METRIC_COLUMNS
+    assert 2 <= min_replications <= max_replications
+    results = [Replications(point) for point in points]
+    if references is not None:
+        for result, reference in zip(results, references):
+            if reference is not None:
+                result.reference = results[reference]
+    pending = list(enumerate(results))
+    while len(pending) > 0:
+        # The number of replications each point should have after this
+        # round: enough to reach min_replications, or one more for each
+        # point that hasn't converged.  References keep up with the points
+        # compared with them, so that every replication has a pair.
+        targets = {}
+        for index, result in pending:
+            targets[index] = max(min_replications, len(result.values) + 1)
+        for index, result in pending:
+            if result.reference is not None:
+                targets[references[index]] = max(
+                    targets.get(references[index], 0), targets[index])
+        batch = []
+        for index in sorted(targets.keys()):
+            result = results[index]
+            for replication in range(len(result.values), targets[index]):
+                random_seed = seed + index * max_replications + replication
+                replication_args = result.point + [
+                    "deterministic=True", "random_seed=%d" % random_seed]
+                if references is not None:
+                    replication_args.append("workload_seed=%d" %
+                                            (seed + replication))
+                elif result.workload_seed >= 0:
+                    # Replications of a point with a fixed workload would
+                    # all see the same workload, so they wouldn't be
+                    # independent.
+                    replication_args.append("workload_seed=%d" % random_seed)
+                batch.append((result, replication_args))
+        args = [replication_args for result, replication_args in batch]
+        point_dirs = sweep.run_points(args, processes, use_cache)
+        for (result, replication_args), point_dir in zip(batch, point_dirs):
+            result.add(read_row(replication_args, point_dir), metric,
+                       confidence)
+            if not use_cache:
+                shutil.rmtree(point_dir)
+        for result in results:
+            if result.reference is not None:
+                result.compare(confidence)
+        pending = [(index, result) for index, result in enumerate(results)
+                   if not result.converged(relative_half_width) and
+                   len(result.values) < max_replications]
+
+    for result in results:
+        write_summary(result, metric, relative_half_width)
+    return results
+
+def write_summary(result, metric, relative_half_width):
+    """ Appends a row describing the given Replications to the point's
+    <file_prefix>_replications file. """
+    config = simulation.SimulationConfig.from_args(result.point)
+    sweep.make_dirs(config.results_dir)
+    filename = os.path.join(config.results_dir, "%s_replications" %
+                            config.file_prefix)
+    if config.first_time:
+        f = open(filename, "w")
+        f.write("n\tProbesRatio\tUtil.\tNetworkDelay\tMetric\tMean\t"
+                "HalfWidth\tDiffFromReference\tDiffHalfWidth\t"
+                "Replications\tConverged\n")
+        f.close()
+    f = open(filename, "a")
+    f.write("%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n" %
+            (config.num_tasks, config.probes_ratio, result.utilization,
+             result.network_delay, metric, result.mean, result.half_width,
+             result.difference_mean, result.difference_half_width,
+             len(result.values), result.converged(relative_half_width)))
+    f.close()
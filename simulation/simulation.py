@@ -13,15 +13,31 @@ an event queue, and runs the simulation until all jobs have completed.  Useful
 data is collected using a StatsManager object.
 """
 
+import array
+import bisect
+import collections
 import copy
+import functools
+import heapq
+import itertools
 import logging
 import math
+import operator
 import os
-import Queue
 import random
 import sys
 
+import event_queue
+import quantile_sketch
 import stats as stats_mod
+import steady_state
+import workload
+
+try:
+    # Used, if available, to sort response times.
+    import numpy as N
+except ImportError:
+    N = None
         
 # Log levels
 LEVELS = {'debug': logging.DEBUG,
@@ -77,13 +93,28 @@ PARAMS = {'num_fes': [int, 1],             # number of frontends
           # on what was observed from the facebook data: 95% of tasks in a job
           # will have length task_length, and 5% will have length
           # task_length + x, where x is exponentially distributed with mean
-          # 0.1 * task_length.
+          # 0.1 * task_length.  If set to "empirical", task lengths are
+          # sampled from the lengths in task_length_file, scaled to have mean
+          # task_length.  Each job's task lengths are drawn when it arrives,
+          # from a stream for its front end, so with deterministic=True every
+          # policy sees the same task lengths.
           'task_length_distribution': [str, "constant"],
+          # File of task lengths (e.g., from a trace), one per line, for the
+          # "empirical" task_length_distribution.
+          'task_length_file': [str, ""],
           'log_level': [str, "info"],
           'network_delay': [int, 0], # Network delay
           'job_arrival_delay': [float, 40], # Arrival delay on each frontend
           'deterministic': [lambda x: x == "True", False], # Use fixed workload 
           'random_seed': [int, 1],   # Seed to use for workload generation
+          # If non-negative, the seed for the workload (job arrivals, sizes,
+          # users and task lengths) alone, whether or not deterministic is
+          # set.  Runs of different policies with the same workload_seed see
+          # exactly the same workload (common random numbers), so differences
+          # in their results are due to the policies rather than to the
+          # workload.  The random choices made by the policies (e.g., which
+          # servers to probe) come from a separate random stream.
+          'workload_seed': [int, -1],
           'first_time': [lambda x: x == "True", True], # Whether this is the
                                                       # first in a series of
                                                       # trials (used for
@@ -109,28 +140,270 @@ PARAMS = {'num_fes': [int, 1],             # number of frontends
           # comma separated list of relative weights with which to run tasks
           # for each user.  Currently, only integers are supported.
           'relative_weights': [get_int_list, []],
-          # Whether extra queue state should be recorded.
+          # Whether extra queue state should be recorded: every millisecond,
+          # the number of empty queues and percentiles of the queue lengths
+          # on all servers (written to the <file_prefix>_queue_state file).
           'record_queue_state': [lambda x: x == "True", False],
           # Whether to record information about individual tasks, including
           # expected load (based on the probe) and runtime.
-          'record_task_info': [lambda x: x == "True", False]
+          'record_task_info': [lambda x: x == "True", False],
+          # The data structure used to order events.  Options are "heap", a
+          # binary heap, and "timing_wheel", which runs events at integer
+          # millisecond times in O(1) and falls back to a heap for fractional
+          # times.  Both run events in the same order.
+          'event_queue': [str, "heap"],
+          # How front ends choose which servers to probe.  "sample" samples
+          # servers without replacement; "shuffle" shuffles a copy of the full
+          # list of servers for each job, which is slower but draws the same
+          # random numbers as earlier versions of the simulation (so, with
+          # workload_generator=legacy and deterministic=True, gives the same
+          # results).
+          'probe_sampling': [str, "sample"],
+          # Whether front ends should place tasks on the least loaded servers
+          # using global knowledge of server loads, rather than by probing.
+          # This gives the same placements as probing every server
+          # (probes_ratio=-1) with no network delay, but takes time
+          # proportional to the number of tasks rather than the number of
+          # servers.  Requires the "total" load metric and "greedy" queue
+          # selection.
+          'oracle_placement': [lambda x: x == "True", False],
+          # Relative accuracy of the sketches used to summarize job response
+          # times.  0 (the default) keeps every completed job until the end of
+          # the simulation and computes exact statistics.  A positive value
+          # (e.g., 0.01) instead folds each job into per-user and per-job-size
+          # LogHistograms when it completes, and keeps the running and
+          # enqueued task counts over time as DownsampledTimeSeries, so memory
+          # doesn't grow with total_time.  Percentiles are then accurate to
+          # within that fraction, the running_tasks files have a resolution
+          # that decreases with total_time, and the per-job response_vs_time
+          # files are not written.  Can't be used with record_task_info.
+          'response_time_sketch': [float, 0],
+          # Whether to leave out jobs that arrived during the warm-up period
+          # at the start of the simulation, while queues were filling, from
+          # the response time results.  The end of the warm-up period is
+          # found with MSER-5 (see steady_state.py).  Can't be used with
+          # response_time_sketch, since that doesn't keep completed jobs.
+          'truncate_warmup': [lambda x: x == "True", False],
+          # How the jobs arriving at each front end are generated.  "python"
+          # draws each job with the random module, one at a time.  "numpy"
+          # draws arrival times, job sizes and users for large batches of
+          # jobs at once, and task lengths in large batches too, which is
+          # much faster for long simulations; it requires NumPy.  Both are
+          # seeded by workload_seed, or by random_seed when deterministic is
+          # set.  "legacy" creates every job before the simulation starts,
+          # and draws task lengths as tasks start, all from the same random
+          # stream as the components' choices; with deterministic=True and
+          # probe_sampling=shuffle, this reproduces the results of versions
+          # of the simulation from before the workload had its own random
+          # streams.  It keeps the whole workload in memory, and can't be
+          # used with workload_seed or partitions.
+          'workload_generator': [str, "python"],
+          # Number of processes to divide the servers and front ends of a
+          # single simulation among (see parallel.py), so that large clusters
+          # can be simulated on several cores.  1 (the default) runs the
+          # sequential simulation.  Requires a positive network_delay, and
+          # can't be used with oracle_placement, record_task_info or
+          # record_queue_state.  Sweeps already run one simulation per core,
+          # so when sweep.py runs points in a pool of processes, each point's
+          # partitions take turns in the point's process (which gives the
+          # same results).
+          'partitions': [int, 1]
          }
 
-def get_param(key):
-    return PARAMS[key][1]
+# Choices for parameters that select a policy.
+LOAD_METRICS = ["total", "estimate", "per_user_length", "per_user_estimate"]
+QUEUE_SELECTIONS = ["greedy", "pack", "reverse_pack", "patrick"]
+TASK_DISTRIBUTIONS = ["constant", "bimodal"]
+PROBE_SAMPLINGS = ["sample", "shuffle"]
+EVENT_QUEUES = ["heap", "timing_wheel"]
+WORKLOAD_GENERATORS = ["python", "numpy", "legacy"]
+
+TASK_LENGTH_DISTRIBUTIONS = ["constant", "exponential", "facebook",
+                             "empirical"]
+
+class SimulationConfig(object):
+    """ Validated, immutable parameters for a single simulation.
+
+    Each parameter in PARAMS is available as an attribute.  Parameters take
+    their default values from PARAMS unless overridden; string overrides are
+    converted with the parameter's convert function.  Policy parameters are
+    resolved when the config is built, so code that runs for every task
+    doesn't need to look up and compare strings.
+
+    Attributes (in addition to the parameters):
+        empirical_task_lengths: Tuple of the task lengths read from
+            task_length_file, for the "empirical" task_length_distribution
+            (otherwise empty).
+    """
+    def __init__(self, **overrides):
+        values = {}
+        for key, (convert_func, default) in PARAMS.items():
+            values[key] = default
+        for key, value in overrides.items():
+            if key not in PARAMS:
+                raise ValueError("Unknown parameter %s" % key)
+            if isinstance(value, str):
+                value = PARAMS[key][0](value)
+            values[key] = value
+        values["relative_demands"] = tuple(values["relative_demands"])
+        values["relative_weights"] = tuple(values["relative_weights"])
+        if len(values["relative_weights"]) == 0:
+            # All users have equal weight.
+            values["relative_weights"] = (1,) * values["num_users"]
+        self.__validate(values)
+
+        for key, value in values.items():
+            object.__setattr__(self, key, value)
+        empirical_task_lengths = ()
+        if self.task_length_distribution == "empirical":
+            empirical_task_lengths = workload.read_task_lengths(
+                self.task_length_file, self.task_length)
+        object.__setattr__(self, "empirical_task_lengths",
+                           empirical_task_lengths)
+
+    def __validate(self, values):
+        """ Raises a ValueError if the given parameters are inconsistent. """
+        if values["probes_ratio"] < 1.0 and values["probes_ratio"] != -1:
+            raise ValueError("Given value, %f, is not a valid probes_ratio" %
+                             values["probes_ratio"])
+        if (len(values["relative_demands"]) > 0 and
+            len(values["relative_demands"]) != values["num_users"]):
+            raise ValueError("The length of relative demands does not match "
+                             "the given number of users")
+        if len(values["relative_weights"]) != values["num_users"]:
+            raise ValueError("The length of relative weights does not match "
+                             "the given number of users")
+        if values["cores_per_server"] < 1:
+            raise ValueError("cores_per_server must be at least 1")
+        for key, choices in [("load_metric", LOAD_METRICS),
+                             ("queue_selection", QUEUE_SELECTIONS),
+                             ("task_distribution", TASK_DISTRIBUTIONS),
+                             ("task_length_distribution",
+                              TASK_LENGTH_DISTRIBUTIONS),
+                             ("probe_sampling", PROBE_SAMPLINGS),
+                             ("event_queue", EVENT_QUEUES),
+                             ("workload_generator", WORKLOAD_GENERATORS)]:
+            if values[key] not in choices:
+                raise ValueError("Given value, %s, is not a valid %s" %
+                                 (values[key], key))
+        if values["oracle_placement"] and (
+                values["load_metric"] != "total" or
+                values["queue_selection"] != "greedy"):
+            raise ValueError("oracle_placement requires load_metric=total and "
+                             "queue_selection=greedy")
+        if (values["task_length_distribution"] == "empirical" and
+                not values["task_length_file"]):
+            raise ValueError("task_length_distribution=empirical requires "
+                             "task_length_file")
+        if values["workload_generator"] == "numpy" and workload.N is None:
+            raise ValueError("workload_generator=numpy requires NumPy")
+        if values["workload_generator"] == "legacy":
+            for key in ["workload_seed", "partitions"]:
+                if values[key] != PARAMS[key][1]:
+                    raise ValueError("workload_generator=legacy can't be used "
+                                     "with %s" % key)
+        if not 0 <= values["response_time_sketch"] < 1:
+            raise ValueError("Given value, %f, is not a valid "
+                             "response_time_sketch" %
+                             values["response_time_sketch"])
+        if values["response_time_sketch"] > 0 and values["record_task_info"]:
+            raise ValueError("response_time_sketch can't be used with "
+                             "record_task_info")
+        if values["response_time_sketch"] > 0 and values["truncate_warmup"]:
+            raise ValueError("response_time_sketch can't be used with "
+                             "truncate_warmup")
+        if not 1 <= values["partitions"] <= values["num_servers"]:
+            raise ValueError("partitions must be between 1 and num_servers")
+        if values["partitions"] > 1:
+            if values["network_delay"] <= 0:
+                raise ValueError("partitions requires a positive "
+                                 "network_delay")
+            for key in ["oracle_placement", "record_task_info",
+                        "record_queue_state"]:
+                if values[key]:
+                    raise ValueError("partitions can't be used with %s" %
+                                     key)
 
-def output_params():
-    results_dirname = get_param('results_dir')
+    def __setattr__(self, key, value):
+        raise AttributeError("SimulationConfig is immutable")
+
+    @classmethod
+    def from_args(cls, argv):
+        """ Builds a config from a list of "key=value" strings. """
+        overrides = {}
+        for arg in argv:
+            kv = arg.split("=")
+            if len(kv) == 2 and kv[0] in PARAMS:
+                overrides[kv[0]] = kv[1]
+            elif kv[0] not in PARAMS:
+                logging.warn("Ignoring key %s" % kv[0])
+        return cls(**overrides)
+
+    def items(self):
+        """ Returns a list of (parameter name, value) pairs. """
+        return [(key, getattr(self, key)) for key in PARAMS.keys()]
+
+def offered_utilization(config):
+    """ Returns the expected fraction of the cluster's cores in use, given
+    the rate at which jobs arrive. """
+    avg_num_tasks = config.num_tasks
+    if config.task_distribution == "bimodal":
+        avg_num_tasks = (200. / 6) + (10 * 5. / 6)
+    tasks_per_milli = (float(config.num_fes * avg_num_tasks) /
+                       config.job_arrival_delay)
+
+    capacity_tasks_per_milli = (float(config.num_servers *
+                                      config.cores_per_server) /
+                                config.task_length)
+    return tasks_per_milli / capacity_tasks_per_milli
+
+def make_rngs(config):
+    """ Returns a (workload_seed_rng, rng) tuple of the random number
+    generators for a simulation with the given config.
+
+    workload_seed_rng is used only to seed the workload for each front end,
+    and rng for the random choices made by the simulation's components, so
+    that the workload doesn't depend on the components.  The "legacy"
+    workload_generator draws everything from one stream, seeded directly by
+    random_seed, so both are the same generator.
+    """
+    if config.workload_generator == "legacy":
+        if config.deterministic:
+            rng = random.Random(config.random_seed)
+        else:
+            rng = random.Random()
+        return rng, rng
+    if config.deterministic:
+        seed_rng = random.Random(config.random_seed)
+    else:
+        seed_rng = random.Random()
+    workload_seed_rng = random.Random(seed_rng.getrandbits(64))
+    if config.workload_seed >= 0:
+        workload_seed_rng = random.Random(config.workload_seed)
+    rng = random.Random(seed_rng.getrandbits(64))
+    return workload_seed_rng, rng
+
+def job_arrivals(config, front_end_id, total_time, stats_manager,
+                 workload_rng, task_length_rng):
+    """ Generates the Jobs that arrive at the given front end, in arrival
+    order. """
+    task_length = config.task_length
+    record_task_info = config.record_task_info
+    task_lengths = workload.task_lengths(config, task_length_rng)
+    jobs = workload.job_stream(config, total_time, workload_rng)
+    for count, (arrival_time, num_tasks, user_id) in enumerate(jobs):
+        yield Job(user_id, arrival_time, num_tasks, task_length,
+                  stats_manager, front_end_id + ":" + str(count),
+                  task_lengths, record_task_info)
+
+def output_params(config):
+    results_dirname = config.results_dir
     f = open(os.path.join(results_dirname, 
-                          "%s.params" % get_param("file_prefix")), "w")
-    for key, value in PARAMS.items():
-        f.write("%s: %s\n" % (key, value[1]))
+                          "%s.params" % config.file_prefix), "w")
+    for key, value in config.items():
+        f.write("%s: %s\n" % (key, value))
     f.close()
 
-def set_param(key, val):
-    convert_func = PARAMS[key][0]
-    PARAMS[key][1] = convert_func(val)
-
 ###############################################################################
 #                    Components: Jobs, Servers, oh my!                        #
 ###############################################################################
@@ -142,24 +415,41 @@ class Job(object):
         arrival_time: Time the job arrives at the front end.
         num_tasks: Integer specifying the number of tasks needed for the job.
         longest_task: Runtime (in ms) of the longest task.
+        task_lengths: List of the lengths of the job's tasks, indexed by task
+            id, or None once the job has completed.
     """
-    def __init__(self, user_id, arrival_time, num_tasks, 
-                 task_length, stats_manager, id_str, servers):
+    # A Job is allocated for every simulated job and kept until the end of
+    # the simulation, so instances don't have a __dict__.
+    __slots__ = ("user_id", "arrival_time", "first_task_completion",
+                 "completion_time", "num_tasks", "task_length",
+                 "task_lengths", "record_task_info", "stats_manager",
+                 "tasks_finished", "id_str", "longest_task", "probe_results",
+                 "wait_times")
+
+    def __init__(self, user_id, arrival_time, num_tasks, task_length,
+                 stats_manager, id_str, task_lengths,
+                 record_task_info=False):
+        """ Creates a job, taking the lengths of its num_tasks tasks from the
+        task_lengths iterator.
+        """
         self.user_id = user_id
         self.arrival_time = arrival_time
         self.first_task_completion = -1
         self.completion_time = -1
-        self.servers = servers
         self.num_tasks = num_tasks
         self.task_length = task_length
+        self.task_lengths = list(itertools.islice(task_lengths, num_tasks))
+        self.record_task_info = record_task_info
         self.stats_manager = stats_manager
         self.tasks_finished = 0
         self.id_str = str(id_str)
         self.longest_task = 0
         
-        if get_param("record_task_info"):
-            # Expected load (based on the probe) and actual wait time for all
-            # tasks, indexed by the task id.
+        # Expected load (based on the probe) and actual wait time for all
+        # tasks, indexed by the task id.
+        self.probe_results = None
+        self.wait_times = None
+        if record_task_info:
             self.probe_results = []
             self.wait_times = []
             while len(self.probe_results) < self.num_tasks:
@@ -172,12 +462,7 @@ class Job(object):
         This should only be called once for each task! Otherwise it is likely
         to return inconsistent results.
         """
-        task_length = self.task_length
-        if get_param("task_length_distribution") == "exponential":
-            task_length = random.expovariate(1.0 / self.task_length)
-        elif get_param("task_length_distribution") == "facebook":
-            if random.random() > 0.95:
-                task_length += random.expovariate(10.0 / self.task_length)
+        task_length = self.task_lengths[task_id]
         self.longest_task = max(self.longest_task, task_length)
         return task_length
     
@@ -187,12 +472,12 @@ class Job(object):
         This function should only be called if the "record_task_info" parameter
         is true.
         """
-        assert get_param("record_task_info")
+        assert self.record_task_info
         assert task_id < self.num_tasks
         self.probe_results[task_id] = load
         
     def record_wait_time(self, task_id, launch_time):
-        assert get_param("record_task_info")
+        assert self.record_task_info
         assert task_id < self.num_tasks
         self.wait_times[task_id] = launch_time - self.arrival_time
         
@@ -207,6 +492,7 @@ class Job(object):
         self.stats_manager.task_finished(self.user_id, current_time)
         if self.tasks_finished == self.num_tasks:
             self.completion_time = current_time
+            self.task_lengths = None
             self.stats_manager.job_finished(self)
         
     def response_time(self):
@@ -221,21 +507,235 @@ class Job(object):
     def wait_time(self):
         assert(self.first_task_completion != -1)
         return self.first_task_completion - self.arrival_time
-        
+
+class LegacyJob(Job):
+    """ Job for the "legacy" workload_generator, which draws the length of
+    each task from the task_lengths iterator when the task starts, rather
+    than when the job is created, as earlier versions of the simulation did.
+    """
+    __slots__ = ()
+
+    def __init__(self, user_id, arrival_time, num_tasks, task_length,
+                 stats_manager, id_str, task_lengths,
+                 record_task_info=False):
+        Job.__init__(self, user_id, arrival_time, num_tasks, task_length,
+                     stats_manager, id_str, (), record_task_info)
+        self.task_lengths = task_lengths
+
+    def get_task_length(self, task_id):
+        task_length = next(self.task_lengths)
+        self.longest_task = max(self.longest_task, task_length)
+        return task_length
+
+class ProbeWindow(object):
+    """ Tracks the times of recent probes to a server.
+
+    Probe times must be added in non-decreasing order.  Expired probes are
+    dropped from the front of the window in amortized constant time.
+    """
+    __slots__ = ("times", "start")
+
+    def __init__(self):
+        self.times = []
+        # Index in self.times of the oldest probe that has not expired.
+        self.start = 0
+
+    def add(self, time):
+        self.times.append(time)
+
+    def expire(self, cutoff):
+        """ Drops all probes received at or before cutoff. """
+        times = self.times
+        start = self.start
+        while start < len(times) and times[start] <= cutoff:
+            start += 1
+        if start > 32 and start * 2 > len(times):
+            # Most of the list has expired, so reclaim the space.
+            del times[:start]
+            start = 0
+        self.start = start
+
+    def count_after(self, cutoff):
+        """ Returns the number of probes received after cutoff.
+
+        Does not modify the window, so this can be used to inspect the
+        current estimate cheaply.
+        """
+        return len(self.times) - bisect.bisect_right(self.times, cutoff,
+                                                     self.start)
+
+    def __len__(self):
+        return len(self.times) - self.start
+
+class UserQueueIndex(object):
+    """ Index of per-user queue lengths, used to estimate when a task will run.
+
+    Users are scheduled round-robin, with user i running up to weight[i]
+    tasks per round.  Within r rounds, user i runs min(length[i], r *
+    weight[i]) tasks.  Let rounds[i] = ceil(length[i] / weight[i]); then that
+    count is length[i] if rounds[i] <= r, and r * weight[i] otherwise.
+
+    A two-dimensional Fenwick tree over (user id, rounds[i]) stores the
+    lengths and weights of all users, so the total number of tasks that a
+    contiguous range of users runs within r rounds can be found in
+    O(log(users) * log(rounds)) time, rather than by examining every user.
+    """
+    def __init__(self, weights, lengths):
+        self.weights = weights
+        self.num_users = len(weights)
+        self.lengths = list(lengths)
+        # weight_sums[i] is the sum of the weights of users 0 through i - 1.
+        self.weight_sums = [0]
+        for weight in weights:
+            self.weight_sums.append(self.weight_sums[-1] + weight)
+        self.__build()
+
+    def __rounds(self, user_id, length):
+        return -(-length // self.weights[user_id])
+
+    def __build(self):
+        """ Builds the tree from self.lengths. """
+        # Number of distinct rounds values the tree can hold; rounds values
+        # from 0 to max_rounds - 1 can be stored.
+        self.max_rounds = 1
+        for user_id, length in enumerate(self.lengths):
+            while self.__rounds(user_id, length) >= self.max_rounds:
+                self.max_rounds *= 2
+        # Tree nodes for each user index, each mapping a rounds index to
+        # the sum of the lengths and of the weights of the users it covers.
+        self.length_tree = [{} for i in range(self.num_users + 1)]
+        self.weight_tree = [{} for i in range(self.num_users + 1)]
+        for user_id, length in enumerate(self.lengths):
+            self.__add(user_id, self.__rounds(user_id, length), length,
+                       self.weights[user_id])
+
+    def __add(self, user_id, rounds, length, weight):
+        i = user_id + 1
+        while i <= self.num_users:
+            length_node = self.length_tree[i]
+            weight_node = self.weight_tree[i]
+            j = rounds + 1
+            while j <= self.max_rounds:
+                length_node[j] = length_node.get(j, 0) + length
+                weight_node[j] = weight_node.get(j, 0) + weight
+                j += j & -j
+            i += i & -i
+
+    def __prefix(self, end_user, rounds):
+        """ Returns the sums of lengths and weights for users before end_user
+        that need at most the given number of rounds to empty their queues.
+        """
+        total_length = 0
+        total_weight = 0
+        i = end_user
+        while i > 0:
+            length_node = self.length_tree[i]
+            weight_node = self.weight_tree[i]
+            j = min(rounds + 1, self.max_rounds)
+            while j > 0:
+                total_length += length_node.get(j, 0)
+                total_weight += weight_node.get(j, 0)
+                j -= j & -j
+            i -= i & -i
+        return total_length, total_weight
+
+    def update(self, user_id, length):
+        """ Records that the given user's queue now has the given length. """
+        old_length = self.lengths[user_id]
+        self.lengths[user_id] = length
+        old_rounds = self.__rounds(user_id, old_length)
+        new_rounds = self.__rounds(user_id, length)
+        if new_rounds >= self.max_rounds:
+            self.__build()
+        elif old_rounds == new_rounds:
+            self.__add(user_id, new_rounds, length - old_length, 0)
+        else:
+            weight = self.weights[user_id]
+            self.__add(user_id, old_rounds, -old_length, -weight)
+            self.__add(user_id, new_rounds, length, weight)
+
+    def tasks_run(self, start_user, end_user, rounds):
+        """ Returns the number of tasks that users start_user through
+        end_user - 1 will run in the given number of rounds. """
+        if start_user >= end_user:
+            return 0
+        end_length, end_weight = self.__prefix(end_user, rounds)
+        start_length, start_weight = self.__prefix(start_user, rounds)
+        # Weight of users that won't empty their queues in time.
+        remaining_weight = (self.weight_sums[end_user] -
+                            self.weight_sums[start_user] -
+                            (end_weight - start_weight))
+        return end_length - start_length + rounds * remaining_weight
+
+    def tasks_run_cyclic(self, start_user, end_user, rounds):
+        """ Like tasks_run, but the range of users may wrap around.
+
+        The range is empty if start_user == end_user.
+        """
+        if start_user <= end_user:
+            return self.tasks_run(start_user, end_user, rounds)
+        return (self.tasks_run(start_user, self.num_users, rounds) +
+                self.tasks_run(0, end_user, rounds))
+
+    def tasks_before(self, user_id, current_user, task_count, running_tasks):
+        """ Returns the number of tasks that will run before a new task for
+        user_id.
+
+        This includes any currently running tasks, since we realistically
+        assume that we don't know when these will complete.
+        """
+        # First, we compute the number of rounds (including the current one)
+        # needed to empty user_id's queue and ultimately run the potential
+        # new task.  1 indicates that the task will be run as part of the
+        # current round, and so forth.
+        queue_length = self.lengths[user_id] + 1
+        if current_user == user_id:
+            queue_length += task_count
+        rounds = -(-queue_length // self.weights[user_id])
+
+        # The current user runs first.  Account for tasks that have already
+        # run in this round.
+        potential_tasks_before = rounds * self.weights[current_user]
+        if running_tasks > 0:
+            potential_tasks_before -= task_count
+        total_tasks_before = (running_tasks +
+                              min(self.lengths[current_user],
+                                  potential_tasks_before))
+        if current_user != user_id:
+            # Users after current_user, up to and including user_id, run in
+            # each of the rounds.
+            total_tasks_before += self.tasks_run_cyclic(
+                (current_user + 1) % self.num_users,
+                (user_id + 1) % self.num_users, rounds)
+        # Users after user_id in the scheduling round get one less round
+        # before user_id's task runs.
+        total_tasks_before += self.tasks_run_cyclic(
+            (user_id + 1) % self.num_users, current_user, rounds - 1)
+        return total_tasks_before
+
 class Server(object):
     """ Represents a back end server, which runs jobs. """
-    
-    def __init__(self, id_str, stats_manager, num_users):
-        self.num_users = num_users
+    __slots__ = ("num_users", "queues", "num_cores", "network_delay",
+                 "record_task_info", "running_tasks", "queued_tasks",
+                 "current_user", "task_count", "id_str", "stats_manager",
+                 "load_index", "queue_histogram", "probes", "user_index",
+                 "logger",
+                 "relative_weights", "probe_load", "time_started")
+
+    def __init__(self, id_str, stats_manager, config):
+        self.num_users = config.num_users
         # List of queues for each user, indexed by the user id.  Each queue
-        # contains (job, task_id) pairs.
+        # is a deque of (job, task_id) pairs, so that both adding a task and
+        # launching the next task take constant time.
         self.queues = []
         for user in range(self.num_users):
-            self.queues.append([])
-        self.num_cores = get_param("cores_per_server")
-        assert self.num_cores >= 1
+            self.queues.append(collections.deque())
+        self.num_cores = config.cores_per_server
+        self.network_delay = config.network_delay
+        self.record_task_info = config.record_task_info
         # Number of currently running tasks.
         self.running_tasks = 0
+        # Total number of tasks in all queues.
         self.queued_tasks = 0
         # Index of the user whose task was most recently launched.
         self.current_user = 0
@@ -244,77 +744,64 @@ class Server(object):
         self.task_count = 0
         self.id_str = str(id_str)        
         self.stats_manager = stats_manager
-        # An ordered list of probes received for this machine
-        self.probes = []
+        # ServerLoadIndex to notify when this server's load changes, if any.
+        self.load_index = None
+        # QueueLengthHistogram to notify when this server's number of queued
+        # tasks changes, if any.
+        self.queue_histogram = None
+        # Times of probes received for this machine that may still be
+        # in flight.
+        self.probes = ProbeWindow()
+        # Index of queue lengths used by the per_user_estimate metric, or
+        # None if that metric hasn't been used.
+        self.user_index = None
         self.logger = logging.getLogger("Server")
-        
-        self.relative_weights = get_param("relative_weights")
-        if self.relative_weights == []:
-            for user in range(self.num_users):
-                self.relative_weights.append(1)
+
+        self.relative_weights = config.relative_weights
         assert self.num_users == len(self.relative_weights)
-        
-    def probe_load(self, user_id, current_time):
-        """ Returns the current load on the machine, based on 'load_metric'.
+
+        # probe_load(user_id, current_time) returns the current load on the
+        # machine, based on 'load_metric'.
+        self.probe_load = {"total": self.__total_load,
+                           "estimate": self.__estimate_load,
+                           "per_user_length": self.__per_user_length,
+                           "per_user_estimate": self.__per_user_estimate
+                          }[config.load_metric]
+
+    def __total_load(self, user_id, current_time):
+        return self.queued_tasks + self.running_tasks
+
+    def __estimate_load(self, user_id, current_time):
+        # Probes received within the last round trip may result in tasks
+        # that have not arrived yet.
+        self.probes.expire(current_time - 2 * self.network_delay)
+        estimated_load = (self.queued_tasks + self.running_tasks +
+                          len(self.probes))
+        self.probes.add(current_time)
+        return estimated_load
+
+    def __per_user_length(self, user_id, current_time):
+        return len(self.queues[user_id])
+
+    def __per_user_estimate(self, user_id, current_time):
+        if self.user_index is None:
+            # Build the index the first time it's needed; from then on, it is
+            # updated whenever a queue changes.
+            self.user_index = UserQueueIndex(
+                self.relative_weights, [len(q) for q in self.queues])
+        return self.user_index.tasks_before(user_id, self.current_user,
+                                            self.task_count,
+                                            self.running_tasks)
+
+    def estimated_load(self, current_time):
+        """ Returns the load the "estimate" metric would report.
+
+        Unlike probe_load, this does not count as a probe, so it does not
+        change the server's state.
         """
-        if get_param("load_metric") == "estimate":
-            probe_start = current_time - 2 * get_param("network_delay")
-            start_index = 0
-            while start_index < len(self.probes) and \
-                    self.probes[start_index] <= probe_start:
-                start_index += 1
-            self.probes = self.probes[start_index:]
-            estimated_load = (self.queued_tasks + self.running_tasks +
-                              len(self.probes))
-            self.probes.append(current_time)
-            return estimated_load
-        elif get_param("load_metric") == "per_user_length":
-            return len(self.queues[user_id])
-        elif get_param("load_metric") == "per_user_estimate":
-            # First, we compute the number of rounds needed to empty user_id's
-            # queue and run the potential new task.  Based on that number of
-            # rounds, we examine the queues for all users to determine how
-            # many tasks will run before the potential task for user_id.
-    
-            # Tasks that will be run before a task for the given user_id
-            # (including any currently running tasks, since we realistically
-            # assume that we don't know when these will complete).
-            total_tasks_before = self.running_tasks
-            # Compute the number of rounds (including the current one) needed to empty
-            # the queue and ultimately run the task for this user.  1 indicates
-            # that the task will be run as part of the current round, and so forth.
-            queue_length = len(self.queues[user_id]) + 1
-            if self.current_user == user_id:
-                queue_length += self.task_count
-            rounds = math.ceil(float(queue_length) /
-                               self.relative_weights[user_id])
-            # Whether the user specified by index (below) comes after user_id
-            # in the scheduling round.
-            past_user = False
-            for count in range(len(self.queues)):
-                index = (count + self.current_user) % len(self.queues)
-                if past_user:
-                    # The user specified by index comes after user_id, so
-                    # there will be one less scheduling round before
-                    # index.
-                    potential_tasks_before = ((rounds - 1) *
-                                              self.relative_weights[index])
-                else:
-                    potential_tasks_before = (rounds *
-                                              self.relative_weights[index])
-                if self.running_tasks > 0 and self.current_user == index:
-                    # Account for tasks that have already run in this round.
-                    potential_tasks_before -= self.task_count
-                tasks_before = min(len(self.queues[index]),
-                                   potential_tasks_before)
-                    
-                total_tasks_before += tasks_before
-
-                if index == user_id:
-                    past_user = True
-            return total_tasks_before
-        else:
-            return self.queued_tasks + self.running_tasks
+        probe_start = current_time - 2 * self.network_delay
+        return (self.queued_tasks + self.running_tasks +
+                self.probes.count_after(probe_start))
 
     def queue_task(self, job, task_index, current_time):
         """ Adds the given job to the queue of tasks.
@@ -323,8 +810,17 @@ class Server(object):
         Returns a TaskCompletion event, if there are no tasks running.
         """
         self.queued_tasks += 1
-        self.queues[job.user_id].append((job, task_index))
+        queue = self.queues[job.user_id]
+        queue.append((job, task_index))
+        if self.user_index is not None:
+            self.user_index.update(job.user_id, len(queue))
         self.stats_manager.task_queued(job.user_id, current_time)
+        if self.load_index is not None:
+            self.load_index.update(self,
+                                   self.queued_tasks + self.running_tasks)
+        if self.queue_histogram is not None:
+            self.queue_histogram.update(self.queued_tasks - 1,
+                                        self.queued_tasks)
         if self.running_tasks < self.num_cores:
             # Not all cores are in use, so launch this task.
             return [self.__launch_task(current_time)]
@@ -335,6 +831,9 @@ class Server(object):
         Returns a TaskCompletion for the next task, if one exists. """
         assert self.running_tasks > 0
         self.running_tasks -= 1
+        if self.load_index is not None:
+            self.load_index.update(self,
+                                   self.queued_tasks + self.running_tasks)
         if self.queued_tasks > 0:
             # If there are queued tasks, all but the core just freed should be
             # in use.
@@ -350,6 +849,9 @@ class Server(object):
         assert self.running_tasks < self.num_cores
 
         self.queued_tasks -= 1
+        if self.queue_histogram is not None:
+            self.queue_histogram.update(self.queued_tasks + 1,
+                                        self.queued_tasks)
         tasks_per_round = self.relative_weights[self.current_user]
         if self.task_count >= tasks_per_round:
             # Move on to the next user.
@@ -359,26 +861,148 @@ class Server(object):
         while len(self.queues[self.current_user]) == 0:
             self.current_user = (self.current_user + 1) % self.num_users
             self.task_count = 0
-        # Get the first task from the queue
-        job, task_id = self.queues[self.current_user][0]
-        # Remove the task from the user's queue.
-        self.queues[self.current_user] = self.queues[self.current_user][1:]
+        # Remove the first task from the user's queue.
+        queue = self.queues[self.current_user]
+        job, task_id = queue.popleft()
+        if self.user_index is not None:
+            self.user_index.update(self.current_user, len(queue))
         self.task_count += 1
         assert job.user_id == self.current_user
         task_length = job.get_task_length(task_id)
         event = (current_time + task_length, TaskCompletion(job, self))
         self.stats_manager.task_started(self.current_user, current_time)
         self.time_started = current_time
-        if get_param("record_task_info"):
+        if self.record_task_info:
             job.record_wait_time(task_id, current_time)
         self.running_tasks += 1
         return event
         
+class ServerLoadIndex(object):
+    """ Index of the total load (queued plus running tasks) on every server.
+
+    Servers are kept in buckets by load, so the n least loaded servers can be
+    found without examining every server.  Servers report load changes with
+    update().
+    """
+    def __init__(self, servers, rng):
+        self.rng = rng
+        # buckets[load] is a list of the servers with that load.
+        self.buckets = [list(servers)]
+        # Maps each server to its load and its position in its bucket.
+        self.loads = {}
+        self.positions = {}
+        for position, server in enumerate(servers):
+            self.loads[server] = 0
+            self.positions[server] = position
+        # Lowest load of any server.
+        self.min_load = 0
+
+    def update(self, server, load):
+        """ Records that the given server now has the given load. """
+        old_load = self.loads[server]
+        # Remove the server from its bucket by moving the last server in the
+        # bucket into its position.
+        bucket = self.buckets[old_load]
+        position = self.positions[server]
+        last_server = bucket.pop()
+        if last_server is not server:
+            bucket[position] = last_server
+            self.positions[last_server] = position
+
+        while len(self.buckets) <= load:
+            self.buckets.append([])
+        self.positions[server] = len(self.buckets[load])
+        self.buckets[load].append(server)
+        self.loads[server] = load
+
+        if load < self.min_load:
+            self.min_load = load
+        while len(self.buckets[self.min_load]) == 0:
+            self.min_load += 1
+
+    def least_loaded(self, n):
+        """ Returns (server, load) pairs for the n least loaded servers.
+
+        Pairs are in order of increasing load.  Ties between servers with the
+        same load are broken randomly.
+        """
+        assert n <= len(self.loads)
+        result = []
+        load = self.min_load
+        while len(result) < n:
+            bucket = self.buckets[load]
+            if len(bucket) <= n - len(result):
+                chosen = bucket
+            else:
+                chosen = self.rng.sample(bucket, n - len(result))
+            for server in chosen:
+                result.append((server, load))
+            load += 1
+        return result
+
+class QueueLengthHistogram(object):
+    """ Histogram of the number of queued tasks on each server.
+
+    Servers report changes to their queue lengths with update(), so a
+    snapshot of the queue lengths on all servers takes time proportional to
+    the longest queue, rather than to the number of servers.
+    """
+    __slots__ = ("counts", "num_servers")
+
+    def __init__(self, num_servers):
+        # counts[length] is the number of servers with that many queued
+        # tasks.
+        self.counts = [num_servers]
+        self.num_servers = num_servers
+
+    def update(self, old_length, new_length):
+        """ Records that a server's queue length changed. """
+        self.counts[old_length] -= 1
+        while len(self.counts) <= new_length:
+            self.counts.append(0)
+        self.counts[new_length] += 1
+
+    def num_empty(self):
+        """ Returns the number of servers with no queued tasks. """
+        return self.counts[0]
+
+    def quantiles(self, percents):
+        """ Returns the queue lengths at the given percentiles.
+
+        percents must be sorted, and each between 0 and 1.
+        """
+        result = []
+        servers_seen = 0
+        length = 0
+        for percent in percents:
+            # Index, in sorted order, of the queue at this percentile.
+            rank = min(int(percent * self.num_servers), self.num_servers - 1)
+            while servers_seen + self.counts[length] <= rank:
+                servers_seen += self.counts[length]
+                length += 1
+            result.append(length)
+        return result
+
 class FrontEnd(object):
     """ Represents a front end server, which places jobs.
     """
-    def __init__(self, servers, id_str, stats_manager):
+    __slots__ = ("servers", "rng", "oracle_placement", "num_servers",
+                 "probes_ratio", "shuffle_probes", "network_delay",
+                 "record_task_info", "load_index", "stats_manager",
+                 "queue_lengths", "id_str", "logger", "get_best_n_queues")
+
+    def __init__(self, servers, id_str, stats_manager, config, rng,
+                 load_index=None):
         self.servers = servers
+        self.rng = rng
+        self.oracle_placement = config.oracle_placement
+        self.num_servers = config.num_servers
+        self.probes_ratio = config.probes_ratio
+        self.shuffle_probes = config.probe_sampling == "shuffle"
+        self.network_delay = config.network_delay
+        self.record_task_info = config.record_task_info
+        # ServerLoadIndex used to place jobs when oracle_placement is set.
+        self.load_index = load_index
         self.stats_manager = stats_manager
         self.queue_lengths = []
         self.id_str = str(id_str)
@@ -386,99 +1010,118 @@ class FrontEnd(object):
 
         while len(self.queue_lengths) < len(servers):
             self.queue_lengths.append(0)
+
+        # get_best_n_queues(queue_lengths, n) assigns n tasks to the given
+        # queues, based on 'queue_selection'.  It returns a sublist of
+        # queue_lengths with the chosen queues.  Queues with the same length
+        # are considered in the order they appear in queue_lengths.
+        self.get_best_n_queues = {
+            "greedy": self.__greedy_queues,
+            "pack": self.__pack_queues,
+            "reverse_pack": functools.partial(self.__pack_queues,
+                                              reverse=True),
+            "patrick": self.__patrick_queues}[config.queue_selection]
         
     def place_job(self, job, current_time):
         """ Begins the process of placing the job and returns the probe events.
+
+        With oracle_placement, skips probing and returns the event that
+        delivers the job's tasks.
         """
-        servers_copy = copy.copy(self.servers)
-        random.shuffle(servers_copy)
-        num_probes = get_param("num_servers")
-        if get_param("probes_ratio") >= 1:
-            num_probes = int(round(job.num_tasks * get_param("probes_ratio")))
+        if self.oracle_placement:
+            # Equivalent to probing every server with no network delay.
+            return self.probe_completed(
+                job, self.load_index.least_loaded(job.num_tasks),
+                current_time)
+
+        num_probes = self.num_servers
+        if self.probes_ratio >= 1:
+            num_probes = int(round(job.num_tasks * self.probes_ratio))
         assert num_probes <= len(self.servers)
-        candidates = servers_copy[:num_probes]
-        
-        network_delay = get_param("network_delay")
+        if self.shuffle_probes:
+            servers_copy = copy.copy(self.servers)
+            self.rng.shuffle(servers_copy)
+            candidates = servers_copy[:num_probes]
+        else:
+            # Takes time proportional to num_probes, rather than to the
+            # number of servers.
+            candidates = self.rng.sample(self.servers, num_probes)
+
         probe_event = Probe(self, job, candidates)
-        return [(current_time + network_delay, probe_event)]
+        return [(current_time + self.network_delay, probe_event)]
     
     def probe_completed(self, job, queue_lengths, current_time):
         """ Sends the job to server(s) based on the result of the probe.
         
-        Returns the task finished events.
+        Returns a single event that delivers all of the job's tasks.
         """
-        events = []
-        task_arrival_time = current_time + get_param("network_delay")
+        task_arrival_time = current_time + self.network_delay
+        placements = []
         for (counter, (server, length)) in enumerate(
                 self.get_best_n_queues(queue_lengths, job.num_tasks)):
-            if get_param("record_task_info"):
+            if self.record_task_info:
                 job.record_probe_result(counter, length)
-            events.append((task_arrival_time,
-                           TaskArrival(server, job, counter)))
+            placements.append((server, counter))
             #self.logger.debug("\t%d\tAssigning job %s for user %d to %s" % 
             #                  (current_time, job.id_str, job.user_id,
             #                   server.id_str))
-        return events
+        return [(task_arrival_time, BatchedTaskArrival(job, placements))]
       
-    def get_best_n_queues(self, queue_lengths, n):
-        """ Given an array of queue lengths, assign n tasks to those queues.
+    def __greedy_queues(self, queue_lengths, n):
+        """ Places a single task on each of the n shortest queues. """
+        assert len(queue_lengths) >= n
+        if len(queue_lengths) > 40 * n:
+            # Selects the n shortest queues in O(p log n) time, where p is the
+            # number of probed queues, without sorting the full list.  This
+            # is slower than sorting unless n is much smaller than p.
+            return heapq.nsmallest(n, queue_lengths,
+                                   key=operator.itemgetter(1))
+        queue_lengths.sort(key=operator.itemgetter(1))
+        return queue_lengths[:n]
 
-        Returns a sublist of queue_lengths with the chosen queues.
+    def __pack_queues(self, queue_lengths, n, reverse=False):
+        """ Packs multiple tasks into servers to minimize the longest queue
+        length.
+
+        This "water-fills" the queues: for each queue length (level), starting
+        with the shortest queue, a task is placed on every server whose queue
+        is no longer than that level.  Each level's tasks are placed in order
+        of increasing queue length, or decreasing queue length if reverse is
+        set.  The longest queue is never used.
         """
-        queue_lengths.sort(key = lambda k: k[1])
-
-        queue_selection = get_param("queue_selection")
-        if queue_selection == "greedy":
-            assert len(queue_lengths) >= n
-            return queue_lengths[:n]
-        elif queue_selection == "pack" or queue_selection == "reverse_pack":
-            # Pack multiple tasks into servers to minimize the longest queue
-            # length.
-            longest_queue = 0
-            tasks_placed = 0
-            sublist = []
-            for i, (server, length) in enumerate(queue_lengths):
-                while length > longest_queue:
-                    if queue_selection == "pack":
-                        for prev_server, prev_length in queue_lengths[:i]:
-                            sublist.append((prev_server, longest_queue))
-                    if queue_selection == "reverse_pack":
-                        for prev_server, prev_length in \
-                                reversed(queue_lengths[:i]):
-                            sublist.append((prev_server, longest_queue))
-                    longest_queue += 1
+        queue_lengths.sort(key=operator.itemgetter(1))
+        num_candidates = len(queue_lengths) - 1
+        assert num_candidates > 0
+        level = max(0, int(math.ceil(queue_lengths[0][1])))
+        # Number of servers with queues no longer than the current level.
+        num_eligible = 0
+        sublist = []
+        while True:
+            while (num_eligible < num_candidates and
+                   queue_lengths[num_eligible][1] <= level):
+                num_eligible += 1
+            if reverse:
+                indices = xrange(num_eligible - 1, -1, -1)
+            else:
+                indices = xrange(num_eligible)
+            for index in indices:
+                sublist.append((queue_lengths[index][0], level))
                 if len(sublist) >= n:
-                    return sublist[:n]
-            # Distribute jobs over remaining servers
-            while len(sublist) < n:
-                if queue_selection == "pack":
-                    for prev_server, prev_length in queue_lengths[:i]:
-                        sublist.append((prev_server, longest_queue))
-                        if len(sublist) >= n:
-                            return sublist
-                elif queue_selection == "reverse_pack":
-                    for prev_server, prev_length in reversed(queue_lengths[:i]):
-                        sublist.append((prev_server, longest_queue))
-                        if len(sublist) >= n:
-                            return sublist
-                longest_queue += 1
-            assert(False)
-        elif queue_selection == "patrick":
-            # Longest queue we'd have to place a task in, using the greedy
-            # policy.
-            longest_queue = queue_lengths[n - 1][1]
-            # This is used to store the index of the last queue with length
-            # at MOST longest_queue.
-            last_index = n - 1
-            while last_index < len(queue_lengths) and \
-                    queue_lengths[last_index][1] <= longest_queue:
-                last_index += 1
-            return queue_lengths[last_index - n:last_index]
-
-        # default, return first n queues
-        self.logger.warn("Specified queue parameter, %s, is not a valid option"
-                         % queue_selection)
-        return queue_lengths[:n]
+                    return sublist
+            level += 1
+
+    def __patrick_queues(self, queue_lengths, n):
+        queue_lengths.sort(key=operator.itemgetter(1))
+        # Longest queue we'd have to place a task in, using the greedy
+        # policy.
+        longest_queue = queue_lengths[n - 1][1]
+        # This is used to store the index of the last queue with length
+        # at MOST longest_queue.
+        last_index = n - 1
+        while last_index < len(queue_lengths) and \
+                queue_lengths[last_index][1] <= longest_queue:
+            last_index += 1
+        return queue_lengths[last_index - n:last_index]
 
 
 ###############################################################################
@@ -486,7 +1129,13 @@ class FrontEnd(object):
 ###############################################################################
 
 class Event(object):
-    """ Abstract class representing events. """
+    """ Abstract class representing events.
+
+    Events are allocated for every job and task, so each subclass lists its
+    attributes in __slots__ rather than giving instances a __dict__.
+    """
+    __slots__ = ()
+
     def __init__(self):
         raise NotImplementedError("Event is an abstract class and cannot be "
                                   "instantiated directly")
@@ -497,41 +1146,79 @@ class Event(object):
                                   "each class subclassing Event")
         
 class RecordQueueState(Event):
-    """ Event to periodically record information about the worker queues. """
-    def __init__(self, servers, stats_manager, query_interval):
-        self.servers = servers
+    """ Event to periodically record information about the worker queues.
+
+    Queue lengths are read from a QueueLengthHistogram that the servers keep
+    up to date.  Stops recording once no other events remain in event_queue,
+    so that it doesn't keep the simulation running.
+    """
+    __slots__ = ("queue_histogram", "stats_manager", "query_interval",
+                 "event_queue")
+
+    def __init__(self, queue_histogram, stats_manager, query_interval,
+                 event_queue):
+        self.queue_histogram = queue_histogram
         self.stats_manager = stats_manager
         self.query_interval = query_interval
+        self.event_queue = event_queue
         
     def run(self, current_time):
-        queue_lengths = []
-        for server in self.servers:
-            queue_lengths.append(server.queue_length)
-        self.stats_manager.record_queue_lengths(queue_lengths)
+        self.stats_manager.record_queue_state(current_time,
+                                              self.queue_histogram)
         
+        if self.event_queue.empty():
+            return []
         return [(current_time + self.query_interval, self)]
         
 class JobArrival(Event):
-    """ Event to handle jobs arriving at a front end. """
-    def __init__(self, job, front_end):
+    """ Event to handle jobs arriving at a front end.
+
+    Only the next arrival at each front end is in the event queue at a time:
+    when a job arrives, the event is rescheduled for the next job from
+    arrivals, an iterator over the front end's remaining jobs in order of
+    arrival time.
+    """
+    __slots__ = ("job", "front_end", "arrivals")
+
+    def __init__(self, job, front_end, arrivals):
         self.job = job
         self.front_end = front_end
+        self.arrivals = arrivals
         
     def run(self, current_time):
-        return self.front_end.place_job(self.job, current_time)
+        events = self.front_end.place_job(self.job, current_time)
+        next_job = next(self.arrivals, None)
+        if next_job is not None:
+            self.job = next_job
+            events.append((next_job.arrival_time, self))
+        return events
     
-class TaskArrival(Event):
-    """ Event to handle a task arriving at a server. """
-    def __init__(self, server, job, task_index):
-        self.server = server
+class BatchedTaskArrival(Event):
+    """ Event to handle all of a job's tasks arriving at their servers.
+
+    All tasks in a job are sent at the same time, so they are delivered with
+    one event rather than one event per task.  Each server queues its tasks
+    exactly as if they had arrived separately.
+    """
+    __slots__ = ("job", "placements")
+
+    def __init__(self, job, placements):
         self.job = job
-        self.task_index = task_index
+        # List of (server, task_index) pairs.
+        self.placements = placements
         
     def run(self, current_time):
-        return self.server.queue_task(self.job, self.task_index, current_time)
+        events = []
+        for server, task_index in self.placements:
+            new_events = server.queue_task(self.job, task_index, current_time)
+            if new_events:
+                events.extend(new_events)
+        return events
         
 class TaskCompletion(Event):
     """ Event to handle tasks completing. """
+    __slots__ = ("job", "server")
+
     def __init__(self, job, server):
         self.job = job
         self.server = server
@@ -546,6 +1233,8 @@ class Probe(Event):
     This event is used for both a probe and a probe reply to avoid copying
     state to a new event.  Whether the queue_lengths variable has been
     populated determines what type of event it's currently being used for. """
+    __slots__ = ("front_end", "job", "servers", "queue_lengths")
+
     def __init__(self, front_end, job, servers):
         self.front_end = front_end
         self.job = job
@@ -560,7 +1249,7 @@ class Probe(Event):
                 self.queue_lengths.append((server,
                                            server.probe_load(self.job.user_id,
                                                              current_time)))
-            return [(current_time + get_param("network_delay"), self)]
+            return [(current_time + self.front_end.network_delay, self)]
         else:
             # Already collected state; returning to front end.
             return self.front_end.probe_completed(self.job, self.queue_lengths,
@@ -570,131 +1259,334 @@ class Probe(Event):
 #               Practical things needed for the simulation                    #
 ###############################################################################
 
+class TimeSeries(object):
+    """ A count that changes over time, such as the number of running tasks.
+
+    Every change is recorded as a (time, count) sample.  Samples are stored
+    in two arrays, one of times and one of counts, which take 12 bytes per
+    sample rather than a tuple (and its contents) per sample; arrays grow
+    geometrically, so appending takes amortized constant time.  Iterating
+    over a TimeSeries yields (time, count) tuples.
+
+    Attributes:
+        count: The current count (the count of the last sample, or 0 if
+            there are no samples).
+    """
+    __slots__ = ("times", "counts", "count")
+
+    def __init__(self):
+        self.times = array.array("d")
+        self.counts = array.array("i")
+        self.count = 0
+
+    def add(self, time, delta):
+        """ Changes the count by delta at the given time.
+
+        Returns the new count.
+        """
+        self.count += delta
+        self.times.append(time)
+        self.counts.append(self.count)
+        return self.count
+
+    def __len__(self):
+        return len(self.times)
+
+    def __iter__(self):
+        return itertools.izip(self.times, self.counts)
+
+    def __reversed__(self):
+        return itertools.izip(reversed(self.times), reversed(self.counts))
+
+# Most samples kept by each DownsampledTimeSeries.
+DOWNSAMPLED_TIME_SERIES_SAMPLES = 10000
+
+class DownsampledTimeSeries(TimeSeries):
+    """ A TimeSeries that keeps at most max_samples samples, so its memory
+    doesn't grow with the length of the simulation.
+
+    Time is divided into intervals, and only the last sample in each
+    interval is kept.  Intervals start out 1ms long; whenever max_samples
+    samples are kept and a sample arrives in a new interval, the intervals
+    double in length, and only the last sample in each of the longer
+    intervals is kept.  The series always covers the whole simulation, at a
+    resolution that decreases as the simulation goes on.
+    """
+    __slots__ = ("max_samples", "interval")
+
+    def __init__(self, max_samples=DOWNSAMPLED_TIME_SERIES_SAMPLES):
+        TimeSeries.__init__(self)
+        self.max_samples = max_samples
+        self.interval = 1
+
+    def add(self, time, delta):
+        self.count += delta
+        interval_index = time // self.interval
+        while (len(self.times) > 0 and
+               self.times[-1] // self.interval != interval_index and
+               len(self.times) >= self.max_samples):
+            self.coarsen()
+            interval_index = time // self.interval
+        if (len(self.times) > 0 and
+                self.times[-1] // self.interval == interval_index):
+            self.times[-1] = time
+            self.counts[-1] = self.count
+        else:
+            self.times.append(time)
+            self.counts.append(self.count)
+        return self.count
+
+    def coarsen(self):
+        """ Doubles the length of the intervals, keeping the last sample in
+        each. """
+        self.interval *= 2
+        times = array.array("d")
+        counts = array.array("i")
+        for time, count in itertools.izip(self.times, self.counts):
+            if len(times) > 0 and times[-1] // self.interval == (
+                    time // self.interval):
+                times[-1] = time
+                counts[-1] = count
+            else:
+                times.append(time)
+                counts.append(count)
+        self.times = times
+        self.counts = counts
+
+class JobGroup(object):
+    """ Response times of a group of completed jobs, such as one user's jobs.
+
+    Attributes:
+        arrival_times: List of the arrival time of each job.
+        response_times: List of the response time of each job, in the same
+            order as arrival_times.
+        job_overhead: Sum of StatsManager.job_overhead() for the jobs.
+    """
+    __slots__ = ("arrival_times", "response_times", "job_overhead")
+
+    def __init__(self):
+        self.arrival_times = []
+        self.response_times = []
+        self.job_overhead = 0.0
+
+    def add(self, arrival_time, response_time, job_overhead):
+        self.arrival_times.append(arrival_time)
+        self.response_times.append(response_time)
+        self.job_overhead += job_overhead
+
+    def sorted_response_times(self):
+        """ Returns a sorted list of the response times. """
+        if N is not None and len(self.response_times) > 0:
+            return N.sort(N.array(self.response_times)).tolist()
+        return sorted(self.response_times)
+
+# Percentiles of the queue lengths on all servers recorded by
+# StatsManager.record_queue_state.
+QUEUE_LENGTH_PERCENTILES = [0.5, 0.95, 0.99, 1]
+
 class StatsManager(object):
     """ Keeps track of statistics about job latency, throughput, etc.
     """
-    def __init__(self):
+    def __init__(self, config):
+        self.config = config
         self.total_enqueued_tasks = 0
-        # Total enqueued jobs per-user over time, stored as a list of
-        # (time, queue_length) tuples.
+        # With the response_time_sketch parameter, the task counts over time
+        # are downsampled, so that memory doesn't grow with total_time.
+        time_series = TimeSeries
+        if config.response_time_sketch > 0:
+            time_series = DownsampledTimeSeries
+        # Total enqueued (queued or running) tasks per-user over time, stored
+        # as a TimeSeries for each user.
         self.enqueued_tasks = []
-        for user in range(get_param("num_users")):
-            self.enqueued_tasks.append([])
+        for user in range(self.config.num_users):
+            self.enqueued_tasks.append(time_series())
+        self.num_completed_jobs = 0
         self.completed_jobs = []
-        
-        # Number of running tasks for each user (indexed by user id).
-        # Stored as a list of (time, queue_length) tuples for each user.
+        # With the response_time_sketch parameter, completed jobs are
+        # summarized in sketches, rather than kept in completed_jobs:
+        # response_time_sketches has a LogHistogram of response times for
+        # each user, job_size_sketches maps each job size (number of tasks)
+        # to a LogHistogram of response times, and job_overheads is the sum
+        # of job_overhead() for each user's jobs.
+        self.response_time_sketches = None
+        if config.response_time_sketch > 0:
+            self.response_time_sketches = []
+            for user in range(self.config.num_users):
+                self.response_time_sketches.append(
+                    quantile_sketch.LogHistogram(config.response_time_sketch))
+            self.job_size_sketches = {}
+            self.job_overheads = [0.0] * self.config.num_users
+        
+        # Number of running tasks for each user (indexed by user id), stored
+        # as a TimeSeries for each user.
         self.running_tasks = []
-        # List of (time, queue_length) tuples describing the total number of
-        # running tasks in the cluster.
-        self.total_running_tasks = []
-        for user in range(get_param("num_users")):
-            self.running_tasks.append([])
+        # TimeSeries describing the total number of running tasks in the
+        # cluster.
+        self.total_running_tasks = time_series()
+        for user in range(self.config.num_users):
+            self.running_tasks.append(time_series())
 
         self.logger = logging.getLogger("StatsManager")        
         
-        # Logging for queue lengths.
-        # Length of individual queues, at fixed intervals.
-        self.queue_lengths = []
-        # Number of empty queues, at fixed intervals.
-        self.empty_queues = []
-
-        # Calculate utilization
-        avg_num_tasks = get_param("num_tasks")
-        if get_param("task_distribution") == "bimodal":
-            avg_num_tasks = (200. / 6) + (10 * 5. / 6)
-        tasks_per_milli = (float(get_param('num_fes') * avg_num_tasks) /
-                           get_param('job_arrival_delay'))
+        # Logging for queue lengths, at fixed intervals (only with
+        # record_queue_state).  Times of the samples.
+        self.queue_state_times = array.array("d")
+        # Number of empty queues.
+        self.empty_queues = array.array("i")
+        # For each of QUEUE_LENGTH_PERCENTILES, the queue length at that
+        # percentile.
+        self.queue_length_percentiles = []
+        for percent in QUEUE_LENGTH_PERCENTILES:
+            self.queue_length_percentiles.append(array.array("i"))
 
-        capacity_tasks_per_milli = (float(get_param('num_servers') *
-                                          get_param("cores_per_server")) /
-                                    get_param('task_length'))
-        self.utilization = tasks_per_milli / capacity_tasks_per_milli
+        self.utilization = offered_utilization(config)
 
         self.logger.info("Utilization: %s" % self.utilization)
         
-    def record_queue_lengths(self, queue_lengths):
-        num_empty_queues = 0
-        for length in queue_lengths:
-            if length == 0:
-                num_empty_queues += 1
-            self.queue_lengths.append(length)
-        self.empty_queues.append(num_empty_queues)
+    def record_queue_state(self, current_time, queue_histogram):
+        """ Records the number of empty queues and the queue length
+        percentiles from the given QueueLengthHistogram. """
+        self.queue_state_times.append(current_time)
+        self.empty_queues.append(queue_histogram.num_empty())
+        lengths = queue_histogram.quantiles(QUEUE_LENGTH_PERCENTILES)
+        for samples, length in zip(self.queue_length_percentiles, lengths):
+            samples.append(length)
 
     def task_queued(self, user_id, current_time):
-        num_queued_tasks = 1
-        queued_tasks_history = self.enqueued_tasks[user_id]
-        if len(queued_tasks_history) > 0:
-            num_queued_tasks = queued_tasks_history[-1][1] + 1
-            assert num_queued_tasks >= 1
-        queued_tasks_history.append((current_time, num_queued_tasks))
+        self.enqueued_tasks[user_id].add(current_time, 1)
         self.total_enqueued_tasks += 1
         
     def task_started(self, user_id, current_time):
         """ Should be called when a task begins running. """
-        # Infer number of currently running tasks.
-        num_running_tasks = 1
-        if len(self.running_tasks[user_id]) > 0:
-            num_running_tasks = self.running_tasks[user_id][-1][1] + 1
-            assert num_running_tasks >= 1
-        self.running_tasks[user_id].append((current_time, num_running_tasks))
-        
-        total_running_tasks = 1
-        if len(self.total_running_tasks) > 0:
-            total_running_tasks = self.total_running_tasks[-1][1] + 1
-            assert total_running_tasks > 0
-        self.total_running_tasks.append((current_time, total_running_tasks))
+        self.running_tasks[user_id].add(current_time, 1)
+        self.total_running_tasks.add(current_time, 1)
 
     def task_finished(self, user_id, current_time):
-        assert len(self.running_tasks[user_id]) > 0
-        num_running_tasks = self.running_tasks[user_id][-1][1] - 1
+        num_running_tasks = self.running_tasks[user_id].add(current_time, -1)
         assert num_running_tasks >= 0
-        self.running_tasks[user_id].append((current_time, num_running_tasks))
-        
-        assert len(self.total_running_tasks) > 0
-        total_running_tasks = self.total_running_tasks[-1][1] - 1
+        total_running_tasks = self.total_running_tasks.add(current_time, -1)
         assert total_running_tasks >= 0
-        self.total_running_tasks.append((current_time, total_running_tasks))
         
         assert self.total_enqueued_tasks > 0
         self.total_enqueued_tasks -= 1
-        queued_tasks_history = self.enqueued_tasks[user_id]
-        assert len(queued_tasks_history) > 0
-        num_queued_tasks = queued_tasks_history[-1][1] - 1
+        num_queued_tasks = self.enqueued_tasks[user_id].add(current_time, -1)
         assert num_queued_tasks >= 0
-        queued_tasks_history.append((current_time, num_queued_tasks))
         
     def job_finished(self, job):
-        self.completed_jobs.append(job)
+        self.num_completed_jobs += 1
+        if self.response_time_sketches is None:
+            self.completed_jobs.append(job)
+            return
+        response_time = job.response_time()
+        self.response_time_sketches[job.user_id].add(response_time)
+        if job.num_tasks not in self.job_size_sketches:
+            self.job_size_sketches[job.num_tasks] = (
+                quantile_sketch.LogHistogram(
+                    self.config.response_time_sketch))
+        self.job_size_sketches[job.num_tasks].add(response_time)
+        self.job_overheads[job.user_id] += self.job_overhead(job)
+
+    def job_overhead(self, job):
+        """ Returns the job's response time relative to its longest task.
+
+        In other words, this is the overhead of running on a shared cluster,
+        compared to if the job ran by itself on a cluster, plus one.
+        """
+        # Not really fair to count network overhead in the job overhead.
+        normalized_response_time = (job.response_time() -
+                                    3 * self.config.network_delay)
+        return normalized_response_time * 1.0 / job.longest_task
 
     def output_stats(self):
         assert(self.total_enqueued_tasks == 0)
-        results_dirname = get_param('results_dir')
+        results_dirname = self.config.results_dir
         try:
             os.mkdir(results_dirname)
         except:
             pass
         
-        if get_param("record_task_info"):
-            if get_param("load_metric") in ["total", "estimate"]:
+        if self.config.record_task_info:
+            if self.config.load_metric in ["total", "estimate"]:
                 self.output_wait_time_cdf()
             else:
                 self.output_load_versus_launch_time()
         self.output_running_tasks()
         self.output_bucketed_running_tasks()
+        if self.config.record_queue_state:
+            self.output_queue_state()
         #self.output_queue_size()
        # self.output_queue_size_cdf()
         #self.output_job_overhead()
-        self.output_response_times()
-        
-        if get_param("num_users") > 1:
-            for user_id in range(get_param("num_users")):
-                self.output_response_times(user_id)
+
+        if self.config.truncate_warmup:
+            self.truncate_warmup()
+
+        # Group the completed jobs by user and by job size in one pass.
+        all_jobs = None
+        users = {}
+        job_sizes = {}
+        if self.response_time_sketches is None:
+            all_jobs, groups = self.group_completed_jobs(
+                {"user": operator.attrgetter("user_id"),
+                 "job_size": operator.attrgetter("num_tasks")})
+            users = groups["user"]
+            job_sizes = groups["job_size"]
+        self.output_response_times(group=all_jobs)
+        
+        if self.config.num_users > 1:
+            for user_id in range(self.config.num_users):
+                self.output_response_times(user_id,
+                                           users.get(user_id, JobGroup()))
          
         # This can be problematic for small total runtimes, since the number
         # of jobs with 200 tasks may be just 1 or 0.    
-        if get_param("task_distribution") == "bimodal":
-            self.output_per_job_size_response_time()
+        if self.config.task_distribution == "bimodal":
+            self.output_per_job_size_response_time(job_sizes)
+
+    def truncate_warmup(self):
+        """ Drops the jobs that arrived during the warm-up period from
+        completed_jobs, which is left in order of arrival time. """
+        jobs = sorted(self.completed_jobs,
+                      key=operator.attrgetter("arrival_time"))
+        num_warmup_jobs = steady_state.mser_truncation(
+            [job.response_time() for job in jobs])
+        if num_warmup_jobs > 0:
+            self.logger.info("Dropping %d jobs that arrived in the first %s "
+                             "ms, during warm-up" %
+                             (num_warmup_jobs,
+                              jobs[num_warmup_jobs].arrival_time))
+        self.completed_jobs = jobs[num_warmup_jobs:]
+
+    def group_completed_jobs(self, key_funcs):
+        """ Groups the completed jobs, in a single pass over them.
+
+        Parameters:
+            key_funcs: Dictionary mapping the name of each way to group jobs
+                to a function that returns a job's key in that grouping.
+
+        Returns a (JobGroup of all jobs, groupings) tuple, where groupings
+        maps each name in key_funcs to a dictionary from each key to the
+        JobGroup of jobs with that key.  Jobs are added to groups in the order
+        they completed.
+        """
+        all_jobs = JobGroup()
+        groupings = {}
+        for name in key_funcs:
+            groupings[name] = {}
+        key_funcs = key_funcs.items()
+        for job in self.completed_jobs:
+            response_time = job.response_time()
+            job_overhead = self.job_overhead(job)
+            all_jobs.add(job.arrival_time, response_time, job_overhead)
+            for name, key_func in key_funcs:
+                grouping = groupings[name]
+                key = key_func(job)
+                group = grouping.get(key)
+                if group is None:
+                    group = JobGroup()
+                    grouping[key] = group
+                group.add(job.arrival_time, response_time, job_overhead)
+        return all_jobs, groupings
             
     def output_load_versus_launch_time(self):
         """ Outputs the predicted load and launch time for each task.
@@ -704,16 +1596,16 @@ class StatsManager(object):
         we'd expect to see little correlation between the load and the launch
         time of the task.
         """
-        results_dirname = get_param("results_dir")
+        results_dirname = self.config.results_dir
         per_task_filename = os.path.join(results_dirname,
                                          "%s_task_load_vs_wait" %
-                                         get_param("file_prefix"))
+                                         self.config.file_prefix)
         per_task_file = open(per_task_filename, "w")
         per_task_file.write("load\twait_time\n")
         
         per_job_filename = os.path.join(results_dirname,
                                         "%s_job_load_vs_wait" %
-                                        get_param("file_prefix"))
+                                        self.config.file_prefix)
         per_job_file = open(per_job_filename, "w")
         per_job_file.write("load\twait_time\n")
         for job in self.completed_jobs:
@@ -744,12 +1636,12 @@ class StatsManager(object):
         Outputs two files, one with a CDF for all tasks, and one with
         a CDF for the longest task in each job.
         """
-        results_dirname = get_param("results_dir")
+        results_dirname = self.config.results_dir
         job_filename = os.path.join(results_dirname, "%s_job_wait_cdf" %
-                                    get_param("file_prefix"))
+                                    self.config.file_prefix)
         job_file = open(job_filename, "w")
         task_filename = os.path.join(results_dirname, "%s_task_wait_cdf" %
-                                     get_param("file_prefix"))
+                                     self.config.file_prefix)
         task_file = open(task_filename, "w")
         
         # Dictionary mapping loads (as returned by probes) to a list of wait
@@ -811,14 +1703,14 @@ class StatsManager(object):
         bucketed_running_tasks_per_user = []
         bucket_interval = 100
         
-        results_dirname = get_param("results_dir")
+        results_dirname = self.config.results_dir
         filename = os.path.join(results_dirname,
                                 "%s_bucketed_running_tasks" %
-                                get_param("file_prefix"))
+                                self.config.file_prefix)
         file = open(filename, "w")
         file.write("time\t")
 
-        for user_id in range(get_param("num_users")):
+        for user_id in range(self.config.num_users):
             bucketed_running_tasks = []
             # Total number of CPU milliseconds used during this bucket.
             cpu_millis = 0
@@ -849,7 +1741,7 @@ class StatsManager(object):
         for bucket_index in range(num_buckets):
             file.write("%d\t" % (bucket_index * bucket_interval))
             total_cpu_millis = 0
-            for user_id in range(get_param("num_users")):
+            for user_id in range(self.config.num_users):
                 running_tasks = bucketed_running_tasks_per_user[user_id]
                 if len(running_tasks) > bucket_index:
                     cpu_millis = running_tasks[bucket_index]
@@ -865,10 +1757,10 @@ class StatsManager(object):
         Outputs the number of tasks per user, as well as the number of running
         tasks overall.
         """
-        results_dirname = get_param("results_dir")
-        for user_id in range(get_param("num_users")):
+        results_dirname = self.config.results_dir
+        for user_id in range(self.config.num_users):
             filename = os.path.join(results_dirname, "%s_running_tasks_%d" %
-                                    (get_param("file_prefix"), user_id))
+                                    (self.config.file_prefix, user_id))
             running_tasks_file = open(filename, "w")
             self.write_running_tasks(running_tasks_file,
                                      self.running_tasks[user_id])
@@ -876,16 +1768,16 @@ class StatsManager(object):
             
         # Output aggregate running tasks.
         filename = os.path.join(results_dirname, "%s_running_tasks" %
-                                get_param("file_prefix"))
+                                self.config.file_prefix)
         running_tasks_file = open(filename, "w")
         self.write_running_tasks(running_tasks_file, self.total_running_tasks)
         running_tasks_file.close()    
         
     def write_running_tasks(self, file, tasks_list):
-        """ Writes a list of (time, num_tasks) tuples to file.
+        """ Writes a TimeSeries (or list of (time, num_tasks) tuples) to file.
         
-        Consolidates tuples occurring at the same time, and writes the
-        list in reverse order. """
+        Consolidates samples occurring at the same time, and writes the
+        samples in reverse order. """
         file.write("time\trunning_tasks\n")
         previous_time = -1
         # Write in reverse order so that we automatically get the last event
@@ -897,11 +1789,28 @@ class StatsManager(object):
                 file.write("%d\t%d\n" % (time, running_tasks))
             previous_time = time
   
+    def output_queue_state(self):
+        """ Output the number of empty queues and the queue length
+        percentiles over time. """
+        results_dirname = self.config.results_dir
+        filename = os.path.join(results_dirname,
+                                "%s_queue_state" % self.config.file_prefix)
+        queue_state_file = open(filename, "w")
+        queue_state_file.write("time	empty_queues	%s\n" % "\t".join(
+            ["%dPctlQueueLength" % int(percent * 100)
+             for percent in QUEUE_LENGTH_PERCENTILES]))
+        for index, time in enumerate(self.queue_state_times):
+            queue_state_file.write("%s\t%s\t%s\n" % (
+                time, self.empty_queues[index], "\t".join(
+                    [str(samples[index])
+                     for samples in self.queue_length_percentiles])))
+        queue_state_file.close()
+
     def output_queue_size(self):
         """ Output the queue size over time. """
-        results_dirname = get_param('results_dir')
+        results_dirname = self.config.results_dir
         filename = os.path.join(results_dirname,
-                                '%s_%s' % (get_param('file_prefix'),
+                                '%s_%s' % (self.config.file_prefix,
                                            'queued_tasks'))
         queued_tasks_file = open(filename, 'w')
         queued_tasks_file.write('time\ttotal_queued_tasks\n')
@@ -912,9 +1821,9 @@ class StatsManager(object):
     def output_queue_size_cdf(self):
         """ Output the cumulative probabilities of queue sizes. 
         """
-        results_dirname = get_param("results_dir")
+        results_dirname = self.config.results_dir
         filename = os.path.join(results_dirname,
-                                "%s_%s" % (get_param("file_prefix"),
+                                "%s_%s" % (self.config.file_prefix,
                                            "queue_cdf"))
         queue_cdf_file = open(filename, "w")
         queue_cdf_file.write("%ile\tQueueSize\n")
@@ -933,9 +1842,9 @@ class StatsManager(object):
     def output_job_overhead(self):
         """ Write job completion time and longest task for every job to a file.
         """
-        results_dirname = get_param("results_dir")
+        results_dirname = self.config.results_dir
         filename = os.path.join(results_dirname,
-                                "%s_%s" % (get_param("file_prefix"),
+                                "%s_%s" % (self.config.file_prefix,
                                            "overhead"))
         overhead_file = open(filename, "w")
         overhead_file.write("ResponseTime\tLongestTask\n")
@@ -944,52 +1853,32 @@ class StatsManager(object):
                                 (job.response_time(), job.longest_task))
         overhead_file.close()
 
-    def output_response_times(self, user_id=-1):
+    def output_response_times(self, user_id=-1, group=None):
         """ Aggregate response times, and write job info to file.
         
         Parameters:
             user_id: An optional integer specifying the id of the user for
                 whom to output aggregate response time info.  If absent,
-                outputs delay summaries for all users. """
-        results_dirname = get_param('results_dir')
+                outputs delay summaries for all users.
+            group: JobGroup of the jobs to summarize.  Not used (and may be
+                None) when response times are summarized with sketches. """
+        results_dirname = self.config.results_dir
         user_id_suffix = ""
         if user_id != -1:
             user_id_suffix = "_%d" % user_id
-        filename = os.path.join(results_dirname,
-                                '%s_%s%s' %
-                                (get_param('file_prefix'), 'response_vs_time',
-                                 user_id_suffix))
-        response_vs_time_file = open(filename, 'w')
-        response_vs_time_file.write('arrival\tresponse time\n')
-        response_times = []
-        # Job overhead is defined to the the total time the job took to run,
-        # divided by the runtime of the longest task. In other words, this is
-        # the overhead of running on a shared cluster, compared to if the job
-        # ran by itself on a cluster.
-        job_overhead = 0.0
-        for job in self.completed_jobs:
-            # Doing it this way, rather than just recording the response times
-            # for all users in one go, is somewhat inefficient.
-            if user_id != -1 and job.user_id != user_id:
-                continue
-            assert(job.wait_time >= -0.00001)
-            response_vs_time_file.write('%s\t%s\n' % (job.arrival_time,
-                                                      job.response_time()))
-          
-            response_times.append(job.response_time())
-            # Not really fair to count network overhead in the job overhead.
-            normalized_response_time = (job.response_time() -
-                                        3 * get_param("network_delay"))
-            job_overhead += normalized_response_time * 1.0 / job.longest_task
-        job_overhead = (job_overhead / len(self.completed_jobs)) - 1
-        
+        if self.response_time_sketches is not None:
+            summary = self.sketched_response_time_summary(user_id)
+        else:
+            summary = self.response_time_summary(group, user_id_suffix)
+        mean, stdev, percentiles, job_overhead = summary
+
         # Append avg + stdev to each results file.
-        n = get_param("num_tasks")
-        probes_ratio = get_param("probes_ratio")
+        n = self.config.num_tasks
+        probes_ratio = self.config.probes_ratio
         filename = os.path.join(
-            results_dirname, "%s_response_time%s" % (get_param('file_prefix'),
-                                                     user_id_suffix))
-        if get_param('first_time'):
+            results_dirname,
+            "%s_response_time%s" % (self.config.file_prefix, user_id_suffix))
+        if self.config.first_time:
             f = open(filename, 'w')
             f.write("n\tProbesRatio\tUtil.\tMeanRespTime\tStdDevRespTime\t"
                     "5Pctl\t50Pctl\t95Pctl\t99PctlRespTime\t"
@@ -1000,67 +1889,122 @@ class StatsManager(object):
         avg_empty_queues = -1
         if len(self.empty_queues) > 0:
             avg_empty_queues = stats_mod.lmean(self.empty_queues)
-        response_times.sort()
         f.write(("%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s"
                  "\t%s\t%s\n") %
-                (n, probes_ratio, self.utilization,
-                 stats_mod.lmean(response_times), 
-                 stats_mod.lstdev(response_times),
-                 self.percentile(response_times, 0.05),
-                 self.percentile(response_times, 0.5),
-                 self.percentile(response_times, 0.95),
-                 self.percentile(response_times,.99),
-                 get_param("network_delay"), job_overhead,
-                 get_param("num_servers"), avg_empty_queues))
+                (n, probes_ratio, self.utilization, mean, stdev,
+                 percentiles[0], percentiles[1], percentiles[2],
+                 percentiles[3], self.config.network_delay, job_overhead,
+                 self.config.num_servers, avg_empty_queues))
         f.close()
+
+    def sketched_response_time_summary(self, user_id):
+        """ Summarizes response times using the response time sketches.
+
+        Returns a (mean, standard deviation, [5th, 50th, 95th and 99th
+        percentiles], job overhead) tuple for the given user, or for all
+        users if user_id is -1.
+        """
+        if user_id == -1:
+            sketch = quantile_sketch.LogHistogram(
+                self.config.response_time_sketch)
+            for user_sketch in self.response_time_sketches:
+                sketch.merge(user_sketch)
+            job_overhead = sum(self.job_overheads)
+        else:
+            sketch = self.response_time_sketches[user_id]
+            job_overhead = self.job_overheads[user_id]
+        job_overhead = (job_overhead / self.num_completed_jobs) - 1
+        percentiles = [sketch.quantile(percent)
+                       for percent in [0.05, 0.5, 0.95, 0.99]]
+        return sketch.mean, sketch.stdev(), percentiles, job_overhead
+
+    def response_time_summary(self, group, user_id_suffix):
+        """ Summarizes the response times of the given JobGroup.
+
+        Also writes the arrival and response time of each job to a
+        response_vs_time file.  Returns a (mean, standard deviation, [5th,
+        50th, 95th and 99th percentiles], job overhead) tuple.
+        """
+        results_dirname = self.config.results_dir
+        filename = os.path.join(results_dirname,
+                                '%s_%s%s' %
+                                (self.config.file_prefix,
+                                 'response_vs_time', user_id_suffix))
+        response_vs_time_file = open(filename, 'w')
+        response_vs_time_file.write('arrival\tresponse time\n')
+        for arrival_time, response_time in zip(group.arrival_times,
+                                               group.response_times):
+            response_vs_time_file.write('%s\t%s\n' % (arrival_time,
+                                                      response_time))
+        response_vs_time_file.close()
+        # Job overhead is defined to the the total time the job took to run,
+        # divided by the runtime of the longest task.
+        job_overhead = (group.job_overhead / len(self.completed_jobs)) - 1
+        
+        response_times = group.sorted_response_times()
+        percentiles = [self.percentile(response_times, percent)
+                       for percent in [0.05, 0.5, 0.95, 0.99]]
         
         # Write CDF of response times.
         #filename = os.path.join(results_dirname, "%s_response_time_cdf" %
-        #                       get_param("file_prefix"))
+        #                       self.config.file_prefix)
         #f = open(filename, "w")
         #stride = max(1, len(response_times) / 200)
         #for index, response_time in enumerate(response_times[::stride]):
         #    percentile = (index + 1) * stride * 1.0 / len(response_times)
         #    f.write("%f\t%f\n" % (percentile, response_time))
         #f.close()
+        return (stats_mod.lmean(response_times),
+                stats_mod.lstdev(response_times), percentiles, job_overhead)
             
-    def output_per_job_size_response_time(self):
+    def output_per_job_size_response_time(self, job_sizes):
         """ Output extra, separate files, with response times for each job size.
+
+        Parameters:
+            job_sizes: Dictionary mapping each job size to a JobGroup of jobs
+                of that size.  Not used when response times are summarized
+                with sketches.
         """
-        results_dirname = get_param('results_dir')
-        num_tasks_to_response_times = {}
-        for job in self.completed_jobs:
-            if job.num_tasks not in num_tasks_to_response_times:
-                num_tasks_to_response_times[job.num_tasks] = []
-            num_tasks_to_response_times[job.num_tasks].append(
-                job.response_time())
+        results_dirname = self.config.results_dir
+        # Maps each job size to a (mean, standard deviation, 99th
+        # percentile) tuple of response times.
+        num_tasks_to_summary = {}
+        if self.response_time_sketches is not None:
+            for num_tasks, sketch in self.job_size_sketches.items():
+                num_tasks_to_summary[num_tasks] = (sketch.mean, sketch.stdev(),
+                                                   sketch.quantile(.99))
+        else:
+            for num_tasks, group in job_sizes.items():
+                response_times = group.response_times
+                num_tasks_to_summary[num_tasks] = (
+                    stats_mod.lmean(response_times), 
+                    stats_mod.lstdev(response_times),
+                    stats_mod.lscoreatpercentile(response_times,.99))
             
-        n = get_param("num_tasks")
-        probes_ratio = get_param("probes_ratio")
-        for num_tasks, response_times in num_tasks_to_response_times.items():
+        n = self.config.num_tasks
+        probes_ratio = self.config.probes_ratio
+        for num_tasks, (mean, stdev, percentile_99) in \
+                num_tasks_to_summary.items():
             filename = os.path.join(
                 results_dirname,
-                "%s_response_time_%s" % (get_param("file_prefix"),
+                "%s_response_time_%s" % (self.config.file_prefix,
                                          num_tasks))
-            if get_param('first_time'):
+            if self.config.first_time:
                 f = open(filename, 'w')
                 f.write("n\tProbesRatio\tUtil.\tMean\tStdDev\t99Pctl\t"
                         "NetworkDelay\n")
                 f.close()
             f = open(filename, 'a')
             f.write("%s\t%s\t%s\t%s\t%s\t%s\t%s\n" %
-                    (n, probes_ratio, self.utilization,
-                     stats_mod.lmean(response_times), 
-                     stats_mod.lstdev(response_times),
-                     stats_mod.lscoreatpercentile(response_times,.99),
-                     get_param("network_delay")))
+                    (n, probes_ratio, self.utilization, mean, stdev,
+                     percentile_99, self.config.network_delay))
             f.close()
         
 
     def write_float_array(self, file_suffix, arr, sorted=False):
       filename = os.path.join(
-          get_param('results_dir'),
-          '%s_%s' % (get_param('file_prefix'), file_suffix))
+          self.config.results_dir,
+          '%s_%s' % (self.config.file_prefix, file_suffix))
       f = open(filename, "w")
       if sorted:
           arr.sort()
@@ -1094,102 +2038,127 @@ class StatsManager(object):
 class Simulation(object):
     """
     Attributes:
+        config: The SimulationConfig describing this simulation.
+        rng: Random number generator used for all random choices made by
+            components.
+        workload_seed_rng: Random number generator used only to seed the
+            workload for each front end, so that the workload doesn't depend
+            on the components.
         event_queue: A priority queue of events.  Events are added to queue as
-            (time, event) tuples.
+            (time, event) tuples; events with the same time are run in the
+            order they were added.
+        peak_queue_size: The largest number of events that have been in
+            event_queue at once.
     """
-    def __init__(self, num_front_ends, num_servers, num_users):
+    def __init__(self, config):
+        self.config = config
+        self.workload_seed_rng, self.rng = make_rngs(config)
         self.current_time_ms = 0
-        self.event_queue = Queue.PriorityQueue()
-        self.total_jobs = 0
+        # Number of events run so far.
+        self.events_processed = 0
+        if config.event_queue == "timing_wheel":
+            self.event_queue = event_queue.TimingWheelEventQueue()
+        else:
+            self.event_queue = event_queue.EventQueue()
+        self.peak_queue_size = 0
         self.logger = logging.getLogger("Simulation")
-        self.stats_manager = StatsManager()
-        self.num_users = num_users
+        self.stats_manager = StatsManager(config)
+        self.num_users = config.num_users
 
         # Initialize servers
-        self.num_servers = num_servers
+        self.num_servers = config.num_servers
         self.servers = []
         while len(self.servers) < self.num_servers:
             self.servers.append(Server(len(self.servers), self.stats_manager,
-                                       self.num_users))
+                                       config))
+        self.load_index = None
+        if config.oracle_placement:
+            self.load_index = ServerLoadIndex(self.servers, self.rng)
+            for server in self.servers:
+                server.load_index = self.load_index
        
         # Initialize front ends
-        self.num_front_ends = num_front_ends
+        self.num_front_ends = config.num_fes
         self.front_ends = []
         while len(self.front_ends) < self.num_front_ends:
             self.front_ends.append(FrontEnd(
-                self.servers, len(self.front_ends), self.stats_manager))
+                self.servers, len(self.front_ends), self.stats_manager,
+                config, self.rng, self.load_index))
         
     def create_jobs(self, total_time):
-        """ Creates num_jobs jobs on EACH front end.
+        """ Creates jobs on EACH front end.
+
+        Jobs are generated lazily, as the simulation runs; this only adds the
+        first job arrival for each front end to the event queue.  Each front
+        end's workload, including the lengths of its jobs' tasks, is drawn
+        from its own random number generators, seeded from workload_seed_rng,
+        so it doesn't depend on the random choices made while the simulation
+        runs.
         
         Parameters:
             total_time: The maximum time of any possible job created. We
                 try to create jobs filling most of the allocated time.
         """
-        task_distribution = get_param('task_distribution')
-        num_tasks = get_param('num_tasks')
-        task_length = get_param('task_length')
-        avg_arrival_delay = get_param('job_arrival_delay')
-        job_arrival_distribution = get_param('job_arrival_distribution')
+        if self.config.workload_generator == "legacy":
+            self.create_legacy_jobs(total_time)
+            return
         for front_end in self.front_ends:
-            last_job_arrival = 0
-            count = 0
-            while True:
-                if job_arrival_distribution == "constant":
-                    new_last = last_job_arrival + avg_arrival_delay
-                else:
-                    # If the job arrivals are a Poisson process, the time
-                    # between jobs follows an exponential distribution.  
-                    new_last = last_job_arrival + \
-                        random.expovariate(1.0/avg_arrival_delay)
-
-                # See if we've passed the end of the experiment
-                if new_last > total_time:
-                    break
-                else: 
-                    last_job_arrival = new_last
-                
-                if task_distribution == "bimodal":
-                    if random.random() > (1.0 / 6):
-                        # 5/6 of the jobs have 10 tasks.
-                        num_tasks = 10
-                    else:
-                        num_tasks = 200
-                relative_demands = get_param("relative_demands")
-                if relative_demands == []:
-                    user_id = random.randrange(self.num_users)
-                else:
-                    r = random.random()
-                    user_id = -1
-                    for current_user in range(self.num_users):
-                        if r < get_param("relative_demands")[current_user]:
-                            user_id = current_user
-                            break
-                    assert user_id != -1
-                job = Job(user_id, last_job_arrival, num_tasks, task_length,
-                          self.stats_manager, 
-                          front_end.id_str + ":" + str(count), self.servers)
-                job_arrival_event = JobArrival(job, front_end)
-                self.event_queue.put((last_job_arrival, job_arrival_event))
-                self.total_jobs += 1
-                count = count + 1
+            workload_rng = random.Random(
+                self.workload_seed_rng.getrandbits(64))
+            task_length_rng = random.Random(
+                self.workload_seed_rng.getrandbits(64))
+            arrivals = job_arrivals(self.config, front_end.id_str, total_time,
+                                    self.stats_manager, workload_rng,
+                                    task_length_rng)
+            first_job = next(arrivals, None)
+            if first_job is not None:
+                self.event_queue.put((first_job.arrival_time,
+                                      JobArrival(first_job, front_end,
+                                                 arrivals)))
+
+    def create_legacy_jobs(self, total_time):
+        """ Creates every job on each front end, for the "legacy"
+        workload_generator.
+
+        Jobs are drawn from self.rng, one front end after another, before the
+        simulation starts, and their task lengths are drawn from self.rng as
+        the tasks start, so random numbers are consumed in the same order as
+        in earlier versions of the simulation.
+        """
+        task_lengths = workload.python_task_lengths(self.config, self.rng)
+        for front_end in self.front_ends:
+            jobs = workload.python_job_stream(self.config, total_time,
+                                              self.rng)
+            for count, (arrival_time, num_tasks, user_id) in enumerate(jobs):
+                job = LegacyJob(user_id, arrival_time, num_tasks,
+                                self.config.task_length, self.stats_manager,
+                                front_end.id_str + ":" + str(count),
+                                task_lengths, self.config.record_task_info)
+                # Each job has its own arrival event, so no arrivals follow.
+                self.event_queue.put((arrival_time,
+                                      JobArrival(job, front_end, iter(()))))
 
     def run(self):
-        """ Runs the simulation until all jobs have completed. """
+        """ Runs the simulation until no events remain, which happens once
+        every job has arrived and completed.
+        """
         counter = 0
         counter_increment = 1000 # Reporting frequency
 
         last_time = 0
         
-        if get_param("record_queue_state"):
+        if self.config.record_queue_state:
             # Add event to query queue state.
             query_interval = 1
-            report_queue_state = RecordQueueState(self.servers,
+            queue_histogram = QueueLengthHistogram(len(self.servers))
+            for server in self.servers:
+                server.queue_histogram = queue_histogram
+            report_queue_state = RecordQueueState(queue_histogram,
                                                   self.stats_manager,
-                                                  query_interval)
+                                                  query_interval,
+                                                  self.event_queue)
             self.event_queue.put((query_interval, report_queue_state))
-        while len(self.stats_manager.completed_jobs) < self.total_jobs:
-            assert(not self.event_queue.empty())
+        while not self.event_queue.empty():
             current_time, event = self.event_queue.get()
 
             assert(current_time >= last_time)
@@ -1198,13 +2167,17 @@ class Simulation(object):
             if current_time > counter:
                 counter = counter + counter_increment
             new_events = event.run(current_time)
+            self.events_processed += 1
             if new_events:
-                for new_event in new_events:
-                    self.event_queue.put(new_event)
-    
+                self.event_queue.put_all(new_events)
+                if len(self.event_queue) > self.peak_queue_size:
+                    self.peak_queue_size = len(self.event_queue)
+
+        self.logger.info("Processed %d events" % self.events_processed)
+        self.logger.info("Peak event queue size: %d" % self.peak_queue_size)
         self.stats_manager.output_stats()
         
-        output_params()
+        output_params(self.config)
 
 def main(argv):
     if len(argv) > 0 and "help" in argv[0]:
@@ -1212,41 +2185,23 @@ def main(argv):
           ["[%s=v (%s)] " % (k[0], k[1][1]) for k in PARAMS.items()])
       sys.exit(0)
 
-    # Fill in any specified parameters
-    for arg in argv:
-        kv = arg.split("=")
-        if len(kv) == 2 and kv[0] in PARAMS:
-            set_param(kv[0], kv[1])
-        elif kv[0] not in PARAMS:
-            logging.warn("Ignoring key %s" % kv[0])
-
-    # Sanity check
-    if get_param("probes_ratio") < 1.0 and get_param("probes_ratio") != -1:
-        print ("Given value, %f, is not a valid probes_ratio" %
-               get_param("probes_ratio"))
-        sys.exit(0)
-    relative_demands = get_param("relative_demands")
-    if (relative_demands != [] and \
-        len(relative_demands) != get_param("num_users")):
-        print ("The length of relative demands does not match the "
-               "given number of users")
-        sys.exit(0)
-    
-    relative_weights = get_param("relative_weights")
-    if (relative_weights != [] and \
-        len(relative_weights) != get_param("num_users")):
-        print ("The length of relative weights does not match the "
-               "given number of users")
+    # Fill in any specified parameters, and sanity check them.
+    try:
+        config = SimulationConfig.from_args(argv)
+    except ValueError as e:
+        print e
         sys.exit(0)
 
-    logging.basicConfig(level=LEVELS.get(get_param('log_level')))
+    logging.basicConfig(level=LEVELS.get(config.log_level))
 
-    if get_param("deterministic") is True:
-        random.seed(get_param("random_seed"))
+    if config.partitions > 1:
+        # Imported here, since parallel imports this module.
+        import parallel
+        parallel.run(config)
+        return
 
-    sim = Simulation(get_param("num_fes"), get_param("num_servers"),
-                     get_param("num_users"))
-    sim.create_jobs(get_param("total_time"))
+    sim = Simulation(config)
+    sim.create_jobs(config.total_time)
     sim.run()
     
 if __name__ == '__main__':
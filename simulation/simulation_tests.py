@@ -1,16 +1,62 @@
 """ Tests for simulation code. """
 
+import itertools
+import math
+import os
+import random
+import shutil
+import tempfile
+import time
 import unittest
+
+import capacity
+import effect_of_network_delay
+import effect_of_probes
+import event_queue
+import parallel
+import quantile_sketch
+import replication
 import simulation
+import stats
+import steady_state
+import sweep
+import workload
+
+def constant_task_lengths():
+    return itertools.repeat(100)
+
+class TestSimulationConfig(unittest.TestCase):
+    def test_converts_and_defaults(self):
+        config = simulation.SimulationConfig(num_users="3", probes_ratio=2)
+        self.assertEqual(3, config.num_users)
+        self.assertEqual(2, config.probes_ratio)
+        self.assertEqual((1, 1, 1), config.relative_weights)
+        self.assertEqual(simulation.PARAMS["num_servers"][1],
+                         config.num_servers)
+
+    def test_immutable(self):
+        config = simulation.SimulationConfig()
+        self.assertRaises(AttributeError, setattr, config, "num_users", 5)
+
+    def test_invalid_values(self):
+        self.assertRaises(ValueError, simulation.SimulationConfig,
+                          probes_ratio=0.5)
+        self.assertRaises(ValueError, simulation.SimulationConfig,
+                          load_metric="bogus")
+        self.assertRaises(ValueError, simulation.SimulationConfig,
+                          num_users=2, relative_weights="1,2,3")
+        self.assertRaises(ValueError, simulation.SimulationConfig,
+                          oracle_placement=True, queue_selection="pack")
 
 class TestServer(unittest.TestCase):
     def setUp(self):
-        self.stats_manager = simulation.StatsManager()
-        simulation.set_param("network_delay", 10)
-        
+        self.stats_manager = simulation.StatsManager(
+            simulation.SimulationConfig())
+
     def test_probe_load_estimates(self):
-        server = simulation.Server("test", self.stats_manager, 1)
-        simulation.set_param("load_metric", "estimate")
+        config = simulation.SimulationConfig(num_users=1, network_delay=10,
+                                             load_metric="estimate")
+        server = simulation.Server("test", self.stats_manager, config)
         # Ensure that estimates are being incorporated into load.
         self.assertEquals(0, server.probe_load(0, 0))
         self.assertEquals(1, server.probe_load(0, 2))
@@ -20,15 +66,28 @@ class TestServer(unittest.TestCase):
         # Now ensure that actual queue length is being incorporated as well.
         server.queued_tasks = 5
         self.assertEquals(7, server.probe_load(0, 25))
+
+    def test_estimated_load_does_not_record_probe(self):
+        config = simulation.SimulationConfig(num_users=1, network_delay=10,
+                                             load_metric="estimate")
+        server = simulation.Server("test", self.stats_manager, config)
+        server.probe_load(0, 0)
+        server.probe_load(0, 15)
+        self.assertEquals(2, server.estimated_load(15))
+        self.assertEquals(2, server.estimated_load(15))
+        # The probe at time 0 is no longer in flight at time 25.
+        self.assertEquals(1, server.estimated_load(25))
+        self.assertEquals(1, server.probe_load(0, 25))
         
     def test_probe_load_per_user(self):
-        simulation.set_param("relative_weights", "1,1,1,1,1")
-        server = simulation.Server("test", self.stats_manager, 5)
+        config = simulation.SimulationConfig(
+            num_users=5, relative_weights="1,1,1,1,1",
+            load_metric="per_user_estimate")
+        server = simulation.Server("test", self.stats_manager, config)
         server.current_user = 3
         server.running_tasks = 1
         server.task_count = 1
-        simulation.set_param("load_metric", "per_user_estimate")
-        
+
         # Add fake jobs to the queues on the server (ok to just use strings
         # in the queue, since probe load only looks at the queue length).
         num_jobs_per_user = [1, 3, 2, 5, 4]
@@ -45,9 +104,10 @@ class TestServer(unittest.TestCase):
         self.assertEqual(15, server.probe_load(4, current_time))
         
     def test_probe_load_per_user_weighted_simple(self):
-        simulation.set_param("load_metric", "per_user_estimate")
-        simulation.set_param("relative_weights", "2,2")
-        server = simulation.Server("test", self.stats_manager, 2)
+        config = simulation.SimulationConfig(
+            num_users=2, relative_weights="2,2",
+            load_metric="per_user_estimate")
+        server = simulation.Server("test", self.stats_manager, config)
         server.current_user = 0
         server.task_count = 1
         server.running_tasks = 1
@@ -63,9 +123,10 @@ class TestServer(unittest.TestCase):
         self.assertEqual(3, server.probe_load(1, current_time))
         
     def test_probe_load_per_user_weighted_incorporates_task_count(self):
-        simulation.set_param("load_metric", "per_user_estimate")
-        simulation.set_param("relative_weights", "2,2")
-        server = simulation.Server("test", self.stats_manager, 2)
+        config = simulation.SimulationConfig(
+            num_users=2, relative_weights="2,2",
+            load_metric="per_user_estimate")
+        server = simulation.Server("test", self.stats_manager, config)
         server.current_user = 0
         server.task_count = 2
         server.queued_tasks = 2
@@ -81,9 +142,10 @@ class TestServer(unittest.TestCase):
         self.assertEqual(2, server.probe_load(1, current_time))
         
     def test_probe_load_per_user_weighted(self):
-        simulation.set_param("load_metric", "per_user_estimate")
-        simulation.set_param("relative_weights", "2,1,1,4,5")
-        server = simulation.Server("test", self.stats_manager, 5)
+        config = simulation.SimulationConfig(
+            num_users=5, relative_weights="2,1,1,4,5",
+            load_metric="per_user_estimate")
+        server = simulation.Server("test", self.stats_manager, config)
         server.current_user = 3
         server.task_count = 2
         server.running_tasks = 1
@@ -103,9 +165,98 @@ class TestServer(unittest.TestCase):
         self.assertEqual(13, server.probe_load(3, current_time))
         self.assertEqual(7, server.probe_load(4, current_time))
 
+def per_user_estimate_by_scan(server, user_id):
+    """ Computes the per_user_estimate load by examining every user's queue.
+    """
+    total_tasks_before = server.running_tasks
+    queue_length = len(server.queues[user_id]) + 1
+    if server.current_user == user_id:
+        queue_length += server.task_count
+    rounds = math.ceil(float(queue_length) /
+                       server.relative_weights[user_id])
+    past_user = False
+    for count in range(len(server.queues)):
+        index = (count + server.current_user) % len(server.queues)
+        if past_user:
+            potential_tasks_before = ((rounds - 1) *
+                                      server.relative_weights[index])
+        else:
+            potential_tasks_before = rounds * server.relative_weights[index]
+        if server.running_tasks > 0 and server.current_user == index:
+            potential_tasks_before -= server.task_count
+        total_tasks_before += min(len(server.queues[index]),
+                                  potential_tasks_before)
+        if index == user_id:
+            past_user = True
+    return total_tasks_before
+
+class TestUserQueueIndex(unittest.TestCase):
+    def setUp(self):
+        self.num_users = 40
+
+    def test_matches_scan_as_queues_change(self):
+        random.seed(1)
+        weights = [random.randint(1, 4) for i in range(self.num_users)]
+        config = simulation.SimulationConfig(
+            num_users=self.num_users, cores_per_server=2,
+            load_metric="per_user_estimate", relative_weights=weights)
+        self.stats_manager = simulation.StatsManager(config)
+        server = simulation.Server("test", self.stats_manager, config)
+        current_time = 0
+        for step in range(3000):
+            current_time += 1
+            if server.running_tasks > 0 and random.random() < 0.3:
+                server.task_finished(0, current_time)
+            else:
+                # Skew demand so that some users build up long queues.
+                user_id = min(int(random.expovariate(0.2)),
+                              self.num_users - 1)
+                job = simulation.Job(user_id, current_time, 1, 100,
+                                     self.stats_manager, step,
+                                     constant_task_lengths())
+                server.queue_task(job, 0, current_time)
+            user_id = random.randrange(self.num_users)
+            self.assertEqual(per_user_estimate_by_scan(server, user_id),
+                             server.probe_load(user_id, current_time))
+
+def get_best_n_queues_by_sorting(queue_lengths, n, queue_selection):
+    """ Selects queues by sorting all of them and repeatedly re-scanning. """
+    queue_lengths = sorted(queue_lengths, key=lambda k: k[1])
+    if queue_selection == "greedy":
+        return queue_lengths[:n]
+    elif queue_selection == "patrick":
+        longest_queue = queue_lengths[n - 1][1]
+        last_index = n - 1
+        while last_index < len(queue_lengths) and \
+                queue_lengths[last_index][1] <= longest_queue:
+            last_index += 1
+        return queue_lengths[last_index - n:last_index]
+    longest_queue = 0
+    sublist = []
+    for i, (server, length) in enumerate(queue_lengths):
+        while length > longest_queue:
+            previous = queue_lengths[:i]
+            if queue_selection == "reverse_pack":
+                previous.reverse()
+            for prev_server, prev_length in previous:
+                sublist.append((prev_server, longest_queue))
+            longest_queue += 1
+        if len(sublist) >= n:
+            return sublist[:n]
+    while len(sublist) < n:
+        previous = queue_lengths[:i]
+        if queue_selection == "reverse_pack":
+            previous.reverse()
+        for prev_server, prev_length in previous:
+            sublist.append((prev_server, longest_queue))
+            if len(sublist) >= n:
+                return sublist
+        longest_queue += 1
+
 class TestFrontEnd(unittest.TestCase):
     def setUp(self):
-        self.stats_manager = simulation.StatsManager()
+        self.stats_manager = simulation.StatsManager(
+            simulation.SimulationConfig())
         # Just use a dummy string in place of the servers, since the servers
         # themselves aren't touched during queue selection.
         self.servers = ["a", "b", "c", "d", "e", "f", "g", "h", "i", "j"]
@@ -113,9 +264,12 @@ class TestFrontEnd(unittest.TestCase):
         self.queues = []
         for server, length in zip(self.servers, self.queue_lengths):
             self.queues.append((server, length))
-        self.front_end = simulation.FrontEnd(self.servers,"test",
-                                             self.stats_manager)
-        
+
+    def get_front_end(self, queue_selection):
+        config = simulation.SimulationConfig(queue_selection=queue_selection)
+        return simulation.FrontEnd(self.servers, "test", self.stats_manager,
+                                   config, random.Random(1))
+
     def assert_lists_equal(self, expected_list, resulting_list):
         self.assertEqual(len(expected_list), len(resulting_list),
                          "Expect list to have %d items; found %d" %
@@ -127,22 +281,22 @@ class TestFrontEnd(unittest.TestCase):
         
     def test_get_best_n_queues_greedy_empty_queues(self):
         """ Tests greedy queue placement when all queues are empty. """
-        simulation.set_param("queue_selection", "greedy")
+        front_end = self.get_front_end("greedy")
         queues = []
         for server in self.servers:
             queues.append((server, 0))
-        placement = self.front_end.get_best_n_queues(queues, 3)
+        placement = front_end.get_best_n_queues(queues, 3)
         expected_placement = [("a", 0), ("b", 0), ("c", 0)]
         self.assert_lists_equal(expected_placement, placement)
         
         
     def test_get_best_n_queues_pack_simple(self):
         """ Tests "pack" queue placement in a simple case. """
-        simulation.set_param("queue_selection", "pack")
-        
+        front_end = self.get_front_end("pack")
+
         # This should result in placing 4 tasks on "i", 3 tasks on "c", and 1
         # task on "d"
-        placement = self.front_end.get_best_n_queues(self.queues, 8)
+        placement = front_end.get_best_n_queues(self.queues, 8)
         expected_placement = [("i", 0), ("i", 1), ("i", 2), ("i", 3), ("c", 1),
                               ("c", 2), ("c", 3), ("d", 3)]
         self.assert_lists_equal(expected_placement, placement)
@@ -152,21 +306,935 @@ class TestFrontEnd(unittest.TestCase):
         
         For this test, not all queues have the same length at the end.
         """
-        simulation.set_param("queue_selection", "pack")
+        front_end = self.get_front_end("pack")
         # This should result in placing 7 tasks on "i", 5 tasks on "c", and 3
         # task on "d".
-        placement = self.front_end.get_best_n_queues(self.queues, 15)
+        placement = front_end.get_best_n_queues(self.queues, 15)
         expected_placement = [("i", 0), ("i", 1), ("i", 2), ("i", 3), ("i", 4),
                               ("i", 5), ("c", 1), ("c", 2), ("c", 3), ("c", 4),
                               ("c", 5), ("d", 3), ("d", 4), ("d", 5), ("h", 4)]
         self.assert_lists_equal(expected_placement, placement)
         
+    def test_get_best_n_queues_matches_sorting(self):
+        """ Compares each policy with sorting all of the queues. """
+        random.seed(1)
+        for queue_selection in ["greedy", "pack", "reverse_pack", "patrick"]:
+            front_end = self.get_front_end(queue_selection)
+            for trial in range(200):
+                num_queues = random.randint(2, 30)
+                n = random.randint(1, num_queues)
+                queues = []
+                for i in range(num_queues):
+                    length = random.randint(0, 8)
+                    if random.random() < 0.2:
+                        length += 0.5
+                    queues.append((i, length))
+                expected = get_best_n_queues_by_sorting(queues, n,
+                                                        queue_selection)
+                placement = front_end.get_best_n_queues(list(queues), n)
+                self.assertEqual(expected, placement)
+
+        # With more than 40 queues per task, greedy selection uses a heap
+        # rather than sorting; ties must still go to the earlier queue.
+        front_end = self.get_front_end("greedy")
+        for trial in range(50):
+            n = random.randint(1, 4)
+            num_queues = random.randint(40 * n + 1, 60 * n)
+            queues = [(i, random.randint(0, 3)) for i in range(num_queues)]
+            expected = get_best_n_queues_by_sorting(queues, n, "greedy")
+            placement = front_end.get_best_n_queues(list(queues), n)
+            self.assertEqual(expected, placement)
+
+    def test_probe_sampling(self):
+        job = simulation.Job(0, 0, 4, 100, self.stats_manager, "job",
+                             constant_task_lengths())
+        for probe_sampling in ["sample", "shuffle"]:
+            config = simulation.SimulationConfig(
+                probes_ratio=1.5, probe_sampling=probe_sampling)
+            front_end = simulation.FrontEnd(self.servers, "test",
+                                            self.stats_manager, config,
+                                            random.Random(1))
+            for trial in range(20):
+                [(time, probe)] = front_end.place_job(job, 0)
+                self.assertEqual(6, len(probe.servers))
+                self.assertEqual(6, len(set(probe.servers)))
+                self.assertTrue(set(probe.servers) <= set(self.servers))
+            self.assertEqual(["a", "b", "c", "d", "e", "f", "g", "h", "i",
+                              "j"], self.servers)
+
+        # shuffle draws the same random numbers as shuffling a copy of the
+        # servers, as earlier versions of the simulation did.
+        front_end = simulation.FrontEnd(self.servers, "test",
+                                        self.stats_manager, config,
+                                        random.Random(1))
+        rng = random.Random(1)
+        for trial in range(20):
+            servers_copy = list(self.servers)
+            rng.shuffle(servers_copy)
+            [(time, probe)] = front_end.place_job(job, 0)
+            self.assertEqual(servers_copy[:6], probe.servers)
+        self.assertEqual(rng.random(), front_end.rng.random())
+
     def test_get_best_n_queues_reverse_pack(self):
         """ Tests "reverse_pack" queue placement. """
-        simulation.set_param("queue_selection", "reverse_pack")
-        placement = self.front_end.get_best_n_queues(self.queues, 2)
+        front_end = self.get_front_end("reverse_pack")
+        placement = front_end.get_best_n_queues(self.queues, 2)
         expected_placement = [("i", 0), ("c", 1)]
         self.assert_lists_equal(expected_placement, placement)
         
+class TestProbeWindow(unittest.TestCase):
+    def test_expire(self):
+        window = simulation.ProbeWindow()
+        for time in range(100):
+            window.add(time)
+        window.expire(9)
+        self.assertEqual(90, len(window))
+        self.assertEqual(80, window.count_after(19))
+        window.expire(79)
+        self.assertEqual(20, len(window))
+        self.assertEqual(20, window.count_after(0))
+        window.add(100)
+        window.expire(200)
+        self.assertEqual(0, len(window))
+
+class TestServerLoadIndex(unittest.TestCase):
+    def test_least_loaded_matches_sorting(self):
+        random.seed(1)
+        servers = range(50)
+        loads = [0] * len(servers)
+        index = simulation.ServerLoadIndex(servers, random.Random(1))
+        for step in range(2000):
+            server = random.choice(servers)
+            if loads[server] > 0 and random.random() < 0.5:
+                loads[server] -= 1
+            else:
+                loads[server] += 1
+            index.update(server, loads[server])
+            n = random.randint(1, len(servers))
+            chosen = index.least_loaded(n)
+            self.assertEqual(sorted(loads)[:n], [load for s, load in chosen])
+            self.assertEqual(n, len(set([s for s, load in chosen])))
+            for chosen_server, load in chosen:
+                self.assertEqual(loads[chosen_server], load)
+
+class TestQueueLengthHistogram(unittest.TestCase):
+    def test_matches_server_queues(self):
+        config = simulation.SimulationConfig(num_users=1)
+        stats_manager = simulation.StatsManager(config)
+        servers = [simulation.Server(i, stats_manager, config)
+                   for i in range(20)]
+        histogram = simulation.QueueLengthHistogram(len(servers))
+        for server in servers:
+            server.queue_histogram = histogram
+        random.seed(2)
+        percents = [0, 0.5, 0.95, 1]
+        for i in range(500):
+            server = random.choice(servers)
+            if server.running_tasks > 0 and random.random() < 0.4:
+                server.task_finished(0, i)
+            else:
+                job = simulation.Job(0, i, 1, 100, stats_manager, i,
+                                     constant_task_lengths())
+                server.queue_task(job, 0, i)
+            lengths = sorted([s.queued_tasks for s in servers])
+            self.assertEqual(lengths.count(0), histogram.num_empty())
+            self.assertEqual(
+                [lengths[min(int(p * len(lengths)), len(lengths) - 1)]
+                 for p in percents],
+                histogram.quantiles(percents))
+
+class TestBatchedTaskArrival(unittest.TestCase):
+    def test_tasks_queued_on_each_server(self):
+        config = simulation.SimulationConfig(num_users=1)
+        stats_manager = simulation.StatsManager(config)
+        servers = [simulation.Server(i, stats_manager, config)
+                   for i in range(2)]
+        job = simulation.Job(0, 0, 3, 100, stats_manager, "job",
+                             constant_task_lengths())
+        event = simulation.BatchedTaskArrival(
+            job, [(servers[0], 0), (servers[1], 1), (servers[0], 2)])
+        new_events = event.run(5)
+        # One task launches on each server; the second task for servers[0]
+        # waits in its queue.
+        self.assertEqual(2, len(new_events))
+        for time, completion in new_events:
+            self.assertEqual(105, time)
+        self.assertEqual(1, servers[0].queued_tasks)
+        self.assertEqual(0, servers[1].queued_tasks)
+
+class TestSimulation(unittest.TestCase):
+    def test_one_arrival_queued_per_front_end(self):
+        config = simulation.SimulationConfig(num_fes=3, deterministic=True)
+        sim = simulation.Simulation(config)
+        sim.create_jobs(1000)
+        self.assertEqual(3, len(sim.event_queue))
+        time, arrival = sim.event_queue.get()
+        self.assertTrue(isinstance(arrival, simulation.JobArrival))
+        self.assertEqual(time, arrival.job.arrival_time)
+        # Running the arrival reschedules the event for the front end's next
+        # job, as well as scheduling the job's tasks.
+        new_events = arrival.run(time)
+        rescheduled = [(t, e) for t, e in new_events if e is arrival]
+        self.assertEqual(1, len(rescheduled))
+        self.assertTrue(rescheduled[0][0] >= time)
+        self.assertEqual(rescheduled[0][0], arrival.job.arrival_time)
+
+    def get_workload(self, config, num_jobs):
+        """ Returns the (arrival time, user, number of tasks, task lengths) of
+        the first (at least) num_jobs jobs. """
+        sim = simulation.Simulation(config)
+        sim.create_jobs(config.total_time)
+        workload = []
+        while len(sim.event_queue) > 0:
+            time, event = sim.event_queue.get()
+            if not isinstance(event, simulation.JobArrival):
+                continue
+            job = event.job
+            workload.append((job.arrival_time, job.user_id, job.num_tasks,
+                             tuple(job.task_lengths)))
+            if len(workload) < num_jobs:
+                for new_time, new_event in event.run(time):
+                    if new_event is event:
+                        sim.event_queue.put((new_time, new_event))
+        return workload
+
+    def test_workload_seed_replays_workload(self):
+        # Different policies, and different random seeds for the policies,
+        # see the same workload.
+        params = {"num_fes": 2, "num_users": 2,
+                  "task_length_distribution": "exponential",
+                  "workload_seed": 7}
+        workload = self.get_workload(simulation.SimulationConfig(
+            probes_ratio=1, **params), 20)
+        self.assertTrue(len(workload) >= 20)
+        self.assertEqual(workload, self.get_workload(
+            simulation.SimulationConfig(probes_ratio=2,
+                                        load_metric="estimate", **params),
+            20))
+        self.assertEqual(workload, self.get_workload(
+            simulation.SimulationConfig(probes_ratio=2, deterministic=True,
+                                        random_seed=5, **params), 20))
+        params["workload_seed"] = 8
+        self.assertNotEqual(workload, self.get_workload(
+            simulation.SimulationConfig(probes_ratio=1, **params), 20))
+
+    def test_legacy_workload_reproduces_earlier_results(self):
+        results_dir = tempfile.mkdtemp()
+        try:
+            config = simulation.SimulationConfig(
+                num_servers=100, num_tasks=10, total_time=2000,
+                job_arrival_delay=5, num_users=2,
+                job_arrival_distribution="poisson", deterministic=True,
+                workload_generator="legacy", probe_sampling="shuffle",
+                log_level="warning", results_dir=results_dir)
+            sim = simulation.Simulation(config)
+            sim.create_jobs(config.total_time)
+            # Every job is created up front, rather than one per front end.
+            self.assertTrue(len(sim.event_queue) > config.num_fes)
+            sim.run()
+            results_file = open(os.path.join(results_dir,
+                                             "results_response_time"))
+            mean_response_time = float(
+                results_file.readlines()[1].split("\t")[3])
+            results_file.close()
+        finally:
+            shutil.rmtree(results_dir)
+        # The mean response time given by versions of the simulation from
+        # before the workload had its own random streams.
+        self.assertAlmostEqual(1826.94152365, mean_response_time, places=6)
+        self.assertRaises(ValueError, simulation.SimulationConfig,
+                          workload_generator="legacy", workload_seed=3)
+
+class TestSweep(unittest.TestCase):
+    def setUp(self):
+        self.results_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.results_dir)
+
+    def get_points(self):
+        points = []
+        for network_delay in [0, 1, 2]:
+            points.append(["num_servers=20", "num_tasks=2", "num_users=1",
+                           "total_time=200", "log_level=warning",
+                           "network_delay=%d" % network_delay,
+                           "results_dir=%s" % self.results_dir,
+                           "first_time=%s" % (network_delay == 0)])
+        return points
+
+    def read_response_times(self):
+        results_file = open(os.path.join(self.results_dir,
+                                         "results_response_time"))
+        lines = results_file.readlines()
+        results_file.close()
+        return lines
+
+    def test_rows_merged_in_order(self):
+        sweep.run_sweep(self.get_points(), processes=2, seed=5)
+        lines = self.read_response_times()
+        self.assertEqual(4, len(lines))
+        self.assertTrue(lines[0].startswith("n\t"))
+        # NetworkDelay is the 10th column.
+        self.assertEqual(["0", "1", "2"],
+                         [line.split("\t")[9] for line in lines[1:]])
+        # Only the merged results remain.
+        for name in os.listdir(self.results_dir):
+            self.assertFalse(name.startswith(".sweep_"))
+
+    def test_seeded_sweep_matches_serial_sweep(self):
+        sweep.run_sweep(self.get_points(), processes=2, seed=5,
+                        use_cache=False)
+        parallel_lines = self.read_response_times()
+        sweep.run_sweep(self.get_points(), processes=1, seed=5,
+                        use_cache=False)
+        self.assertEqual(parallel_lines, self.read_response_times())
+        self.assertEqual([], sweep.cache_entries(self.results_dir))
+
+    def test_cached_points_not_rerun(self):
+        sweep.run_sweep(self.get_points(), processes=2, seed=5)
+        lines = self.read_response_times()
+        self.assertEqual(3, len(sweep.cache_entries(self.results_dir)))
+        os.remove(os.path.join(self.results_dir, "results_response_time"))
+        run = simulation.Simulation.run
+        def fail(sim):
+            self.fail("Cached point was run again")
+        simulation.Simulation.run = fail
+        try:
+            sweep.run_sweep(self.get_points(), processes=1, seed=5)
+        finally:
+            simulation.Simulation.run = run
+        self.assertEqual(lines, self.read_response_times())
+        # A different seed is a different point.
+        sweep.run_sweep(self.get_points(), processes=1, seed=6)
+        self.assertEqual(6, len(sweep.cache_entries(self.results_dir)))
+
+    def test_evict(self):
+        sweep.run_sweep(self.get_points(), processes=1, seed=5)
+        entries = sweep.cache_entries(self.results_dir)
+        self.assertEqual([], sweep.evict(self.results_dir, max_age_days=1))
+        total_size = sum([entry[2] for entry in entries])
+        # Leave room for all but the least recently used entry.
+        max_size_mb = (total_size - 1) / (1024.0 * 1024)
+        self.assertEqual([entries[0][0]],
+                         sweep.evict(self.results_dir,
+                                     max_size_mb=max_size_mb))
+        self.assertEqual(sorted([entry[0] for entry in entries[1:]]),
+                         sorted(sweep.evict(self.results_dir,
+                                            max_age_days=0)))
+        self.assertEqual([], sweep.cache_entries(self.results_dir))
+
+    def test_unseeded_points_not_cached(self):
+        sweep.run_sweep(self.get_points(), processes=1)
+        self.assertEqual(4, len(self.read_response_times()))
+        self.assertEqual([], sweep.cache_entries(self.results_dir))
+        for name in os.listdir(self.results_dir):
+            self.assertFalse(name.startswith(sweep.TEMP_DIR_PREFIX))
+
+    def test_cache_key_includes_task_lengths(self):
+        filename = os.path.join(self.results_dir, "task_lengths")
+        keys = []
+        for lengths in ["1\n2\n", "1\n3\n"]:
+            task_length_file = open(filename, "w")
+            task_length_file.write(lengths)
+            task_length_file.close()
+            keys.append(sweep.cache_key(simulation.SimulationConfig(
+                task_length_distribution="empirical",
+                task_length_file=filename)))
+        self.assertNotEqual(keys[0], keys[1])
+
+    def test_evict_removes_stale_temp_dirs(self):
+        cache_dir = os.path.join(self.results_dir, sweep.CACHE_DIRNAME)
+        sweep.make_dirs(cache_dir)
+        # Results left by an interrupted point.
+        stale_dir = tempfile.mkdtemp(prefix=sweep.TEMP_DIR_PREFIX,
+                                     dir=cache_dir)
+        old_time = time.time() - sweep.STALE_TEMP_DIR_AGE - 60
+        os.utime(stale_dir, (old_time, old_time))
+        # Results for a point that may still be running.
+        running_dir = tempfile.mkdtemp(prefix=sweep.TEMP_DIR_PREFIX,
+                                       dir=cache_dir)
+        self.assertEqual([os.path.basename(stale_dir)],
+                         sweep.evict(self.results_dir))
+        self.assertFalse(os.path.exists(stale_dir))
+        self.assertTrue(os.path.isdir(running_dir))
+
+    def test_experiment_sweep_cached(self):
+        experiment = effect_of_probes.EffectOfProbes("test")
+        experiment.probes_ratio_values = [1.0, 1.5]
+        experiment.num_servers = 400
+        experiment.cores_per_server = 1
+        experiment.total_time = 2000
+        # Write the results to results_dir, rather than raw_results.
+        sweep_points = experiment.sweep_points
+        experiment.sweep_points = lambda trial_number: [
+            point + ["results_dir=%s" % self.results_dir]
+            for point in sweep_points(trial_number)]
+        experiment.run_single(-1)
+        self.assertEqual(len(sweep_points(-1)),
+                         len(sweep.cache_entries(self.results_dir)))
+        run = simulation.Simulation.run
+        def fail(sim):
+            self.fail("Cached point was run again")
+        simulation.Simulation.run = fail
+        try:
+            experiment.run_single(-1)
+        finally:
+            simulation.Simulation.run = run
+
+class TestExperimentPoints(unittest.TestCase):
+    def get_workload_seeds(self, points):
+        return [simulation.SimulationConfig.from_args(point).workload_seed
+                for point in points]
+
+    def test_workload_seeds_set(self):
+        for experiment in [effect_of_probes.EffectOfProbes("test"),
+                           effect_of_network_delay.EffectOfNetworkDelay()]:
+            for trial_number in [-1, 0, 3]:
+                seeds = self.get_workload_seeds(
+                    experiment.sweep_points(trial_number))
+                self.assertTrue(min(seeds) >= 0)
+            # Each variant gets the same seed at each utilization.
+            seeds = self.get_workload_seeds(experiment.sweep_points(-1))
+            num_variants = len(experiment.probes_ratio_values)
+            points_per_variant = len(seeds) / num_variants
+            self.assertEqual(seeds[:points_per_variant] * num_variants, seeds)
+            self.assertEqual(points_per_variant,
+                             len(set(seeds[:points_per_variant])))
+
+class TestReplication(unittest.TestCase):
+    def setUp(self):
+        self.results_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.results_dir)
+
+    def test_t_critical_value(self):
+        self.assertAlmostEqual(12.706, replication.t_critical_value(1, 0.95),
+                               places=3)
+        self.assertAlmostEqual(2.262, replication.t_critical_value(9, 0.95),
+                               places=3)
+        self.assertAlmostEqual(2.576,
+                               replication.t_critical_value(10000, 0.99),
+                               places=2)
+
+    def test_replicates_until_converged(self):
+        point = ["num_servers=20", "num_tasks=2", "num_users=1",
+                 "total_time=500", "log_level=warning",
+                 "results_dir=%s" % self.results_dir, "first_time=True"]
+        # At low load, no tasks wait, so the median response time is always
+        # the task length and two replications suffice.
+        idle_point = point + ["job_arrival_delay=200"]
+        results = replication.replicate([idle_point], metric="p50",
+                                        relative_half_width=1e-9,
+                                        max_replications=4, processes=1)
+        self.assertEqual(2, len(results[0].values))
+        self.assertEqual(0, results[0].half_width)
+        self.assertTrue(results[0].converged(1e-9))
+        # At high load, the mean varies, so an impossible precision uses
+        # every replication.
+        busy_point = point + ["job_arrival_delay=12"]
+        results = replication.replicate([busy_point], metric="mean",
+                                        relative_half_width=1e-9,
+                                        max_replications=4, processes=1)
+        self.assertEqual(4, len(results[0].values))
+        self.assertFalse(results[0].converged(1e-9))
+        self.assertTrue(results[0].half_width > 0)
+
+        summary_file = open(os.path.join(self.results_dir,
+                                         "results_replications"))
+        lines = summary_file.readlines()
+        summary_file.close()
+        # The point sets first_time, so only the last summary remains.
+        self.assertEqual(2, len(lines))
+        self.assertEqual(["4", "False"], lines[1].strip().split("\t")[-2:])
+
+    def test_paired_points_converge_on_differences(self):
+        # Every server is probed and gets one task of each job, so placement
+        # doesn't depend on the random choices: the two points differ only
+        # in their workloads, which are shared when they are paired.
+        point = ["num_servers=2", "num_tasks=2", "probes_ratio=1",
+                 "num_users=1", "total_time=500", "job_arrival_delay=120",
+                 "log_level=warning", "results_dir=%s" % self.results_dir]
+        points = [point + ["file_prefix=reference"],
+                  point + ["file_prefix=compared"]]
+        results = replication.replicate(points, metric="mean",
+                                        relative_half_width=1e-9,
+                                        max_replications=4,
+                                        references=[None, 0], processes=1)
+        self.assertEqual(4, len(results[0].values))
+        self.assertFalse(results[0].converged(1e-9))
+        self.assertEqual(2, len(results[1].values))
+        self.assertEqual(0, results[1].difference_half_width)
+        self.assertTrue(results[1].converged(1e-9))
+        self.assertEqual(results[0].values[:2], results[1].values)
+
+        # Unpaired, the same point doesn't converge.
+        results = replication.replicate(points[1:], metric="mean",
+                                        relative_half_width=1e-9,
+                                        max_replications=4, processes=1)
+        self.assertEqual(4, len(results[0].values))
+
+        # Unpaired replications of a point with its own workload_seed each
+        # see a different workload, so they are independent.
+        results = replication.replicate([point + ["workload_seed=5"]],
+                                        metric="mean",
+                                        relative_half_width=1e-9,
+                                        max_replications=4, processes=1)
+        self.assertEqual(4, len(results[0].values))
+        self.assertEqual(4, len(set(results[0].values)))
+
+class TestCapacity(unittest.TestCase):
+    def setUp(self):
+        self.results_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.results_dir)
+
+    def test_point_for_utilization(self):
+        args = ["num_servers=20", "num_tasks=2", "task_distribution=bimodal"]
+        point = capacity.point_for_utilization(args, 0.7)
+        config = simulation.SimulationConfig.from_args(point)
+        self.assertAlmostEqual(0.7, simulation.offered_utilization(config))
+
+    def test_find_capacity(self):
+        args = ["num_servers=20", "num_tasks=2", "num_users=1",
+                "total_time=1000", "log_level=warning",
+                "results_dir=%s" % self.results_dir]
+        utilization = capacity.find_capacity(args, 200, metric="mean",
+                                             tolerance=0.1,
+                                             max_replications=3,
+                                             processes=1)
+        self.assertTrue(0.05 < utilization < 1)
+        results_file = open(os.path.join(self.results_dir,
+                                         "results_capacity"))
+        rows = [line.split("\t") for line in results_file.readlines()[1:]]
+        results_file.close()
+        # The minimum and maximum utilizations, and then at least 4 steps of
+        # bisection.
+        self.assertTrue(len(rows) >= 6)
+        for row in rows:
+            meets = float(row[2]) + float(row[3]) <= 200
+            self.assertEqual(str(meets), row[5].strip())
+        # The capacity is the highest utilization that met the SLO.
+        self.assertAlmostEqual(utilization,
+                               max([float(row[0]) for row in rows
+                                    if row[5].strip() == "True"]),
+                               places=5)
+
+class TestParallel(unittest.TestCase):
+    def setUp(self):
+        self.results_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.results_dir)
+
+    def get_config(self, **overrides):
+        params = {"num_servers": 50, "num_fes": 3, "num_tasks": 5,
+                  "num_users": 1, "network_delay": 3, "probes_ratio": 2,
+                  "total_time": 20000, "deterministic": True,
+                  "workload_seed": 4, "log_level": "warning",
+                  "results_dir": self.results_dir}
+        params.update(overrides)
+        return simulation.SimulationConfig(**params)
+
+    def run_sequential(self, config):
+        sim = simulation.Simulation(config)
+        sim.create_jobs(config.total_time)
+        sim.run()
+        return sim.stats_manager
+
+    def response_times(self, stats_manager):
+        return dict([(job.id_str, job.response_time())
+                     for job in stats_manager.completed_jobs])
+
+    def test_invalid_configs(self):
+        self.assertRaises(ValueError, self.get_config, partitions=2,
+                          network_delay=0)
+        self.assertRaises(ValueError, self.get_config, partitions=2,
+                          oracle_placement=True)
+        self.assertRaises(ValueError, self.get_config, partitions=51)
+
+    def test_matches_sequential_when_idle(self):
+        # With almost no load, every task runs as soon as it arrives, so
+        # each job's response time depends only on the (identical) workload.
+        config = self.get_config(job_arrival_delay=1000)
+        expected = self.response_times(self.run_sequential(config))
+        self.assertTrue(len(expected) > 30)
+        self.assertEqual(set([3 * 3 + 100]), set(expected.values()))
+        stats_manager = parallel.run(self.get_config(
+            job_arrival_delay=1000, partitions=3), use_processes=False)
+        self.assertEqual(expected, self.response_times(stats_manager))
+        self.assertEqual(0, stats_manager.total_running_tasks.count)
+
+    def test_statistically_equivalent_under_load(self):
+        params = {"job_arrival_delay": 25,
+                  "task_length_distribution": "exponential"}
+        sequential = self.response_times(self.run_sequential(
+            self.get_config(**params)))
+        stats_manager = parallel.run(self.get_config(partitions=2, **params),
+                                     use_processes=False)
+        response_times = self.response_times(stats_manager)
+        self.assertEqual(sorted(sequential.keys()),
+                         sorted(response_times.keys()))
+        sequential_mean = stats.lmean(sequential.values())
+        self.assertTrue(sequential_mean > 150)
+        self.assertAlmostEqual(
+            1, stats.lmean(response_times.values()) / sequential_mean,
+            delta=0.05)
+
+        # Running the partitions in their own processes gives exactly the
+        # same results.
+        stats_manager = parallel.run(self.get_config(partitions=2, **params))
+        self.assertEqual(response_times, self.response_times(stats_manager))
+
+    def test_sweep_runs_partitions(self):
+        params = {"job_arrival_delay": 25, "total_time": 5000,
+                  "task_length_distribution": "exponential",
+                  "probes_ratio": 2.0}
+        point = ["%s=%s" % item for item in params.items()] + [
+            "num_servers=50", "num_fes=3", "num_tasks=5", "num_users=1",
+            "network_delay=3", "log_level=warning", "workload_seed=4",
+            "partitions=2"]
+        parallel.run(self.get_config(partitions=2, **params),
+                     use_processes=False)
+        expected = self.read_response_time_row(self.results_dir)
+        # In a pool of processes, and in this process.
+        for processes in [2, 1]:
+            results_dir = os.path.join(self.results_dir, str(processes))
+            sweep.run_sweep([point + ["results_dir=%s" % results_dir]],
+                            processes=processes, seed=1, use_cache=False)
+            self.assertEqual(expected,
+                             self.read_response_time_row(results_dir))
+
+    def read_response_time_row(self, results_dir):
+        results_file = open(os.path.join(results_dir,
+                                         "results_response_time"))
+        row = results_file.readlines()[1]
+        results_file.close()
+        return row
+
+    def test_merge_time_series(self):
+        first = simulation.TimeSeries()
+        second = simulation.TimeSeries()
+        for time, delta in [(1, 1), (3, 1), (3, -1), (6, -1)]:
+            first.add(time, delta)
+        for time, delta in [(2, 1), (3, 1), (5, -2)]:
+            second.add(time, delta)
+        expected = [(1, 1), (2, 2), (3, 3), (3, 2), (3, 3), (5, 1), (6, 0)]
+        self.assertEqual(expected,
+                         list(parallel.merge_time_series([first, second])))
+        numpy = simulation.N
+        try:
+            simulation.N = None
+            merged = parallel.merge_time_series([first, second])
+        finally:
+            simulation.N = numpy
+        self.assertEqual(expected, list(merged))
+        self.assertEqual(0, merged.count)
+
+class TestSteadyState(unittest.TestCase):
+    def test_truncates_warmup(self):
+        rng = random.Random(1)
+        # Response times rise over the first 200 values, then level off.
+        values = [min(i, 200) + rng.gauss(0, 5) for i in range(2000)]
+        truncation = steady_state.mser_truncation(values)
+        self.assertEqual(0, truncation % 5)
+        self.assertTrue(150 <= truncation <= 250)
+
+    def test_steady_series(self):
+        rng = random.Random(1)
+        values = [rng.gauss(100, 5) for i in range(2000)]
+        self.assertTrue(steady_state.mser_truncation(values) < 200)
+        self.assertEqual(0, steady_state.mser_truncation([5, 1, 1]))
+        # Never discards more than half of the values.
+        values = range(100)
+        self.assertEqual(50, steady_state.mser_truncation(values))
+
+class TestStatsManager(unittest.TestCase):
+    def test_group_completed_jobs(self):
+        config = simulation.SimulationConfig(num_users=3)
+        stats_manager = simulation.StatsManager(config)
+        for i in range(12):
+            job = simulation.Job(i % 3, i, [10, 200][i % 2], 100,
+                                 stats_manager, i, constant_task_lengths())
+            job.longest_task = 100
+            job.completion_time = 200 + i * i
+            stats_manager.job_finished(job)
+        all_jobs, groups = stats_manager.group_completed_jobs(
+            {"user": lambda job: job.user_id,
+             "job_size": lambda job: job.num_tasks})
+        self.assertEqual(range(12), all_jobs.arrival_times)
+        self.assertEqual([0, 3, 6, 9], groups["user"][0].arrival_times)
+        self.assertEqual([200 + i * i - i for i in [0, 3, 6, 9]],
+                         groups["user"][0].response_times)
+        self.assertEqual([1, 3, 5, 7, 9, 11],
+                         groups["job_size"][200].arrival_times)
+        self.assertAlmostEqual(
+            sum([stats_manager.job_overhead(job)
+                 for job in stats_manager.completed_jobs]),
+            all_jobs.job_overhead)
+        self.assertEqual(sorted(all_jobs.response_times),
+                         all_jobs.sorted_response_times())
+
+    def test_truncate_warmup(self):
+        config = simulation.SimulationConfig(num_users=1, truncate_warmup=True)
+        stats_manager = simulation.StatsManager(config)
+        for i in range(1000):
+            job = simulation.Job(0, i, 1, 100, stats_manager, i,
+                                 constant_task_lengths())
+            job.longest_task = 100
+            # Early jobs complete quickly; later jobs wait.
+            job.completion_time = i + 100 + min(i, 100)
+            stats_manager.job_finished(job)
+        stats_manager.truncate_warmup()
+        arrival_times = [job.arrival_time
+                         for job in stats_manager.completed_jobs]
+        self.assertEqual(sorted(arrival_times), arrival_times)
+        self.assertTrue(50 <= arrival_times[0] <= 100)
+        self.assertRaises(ValueError, simulation.SimulationConfig,
+                          truncate_warmup=True, response_time_sketch=0.01)
+
+class TestWorkload(unittest.TestCase):
+    def get_config(self, workload_generator):
+        return simulation.SimulationConfig(
+            num_users=3, relative_demands="1,2,3", task_distribution="bimodal",
+            job_arrival_delay=2, workload_generator=workload_generator)
+
+    def check_stream(self, config, total_time, jobs):
+        arrival_times = [job[0] for job in jobs]
+        self.assertEqual(sorted(arrival_times), arrival_times)
+        self.assertTrue(0 < arrival_times[0])
+        self.assertTrue(arrival_times[-1] <= total_time)
+        # The expected number of jobs is total_time / job_arrival_delay.
+        self.assertTrue(abs(len(jobs) - total_time / 2) < 0.05 * total_time)
+        for job in jobs:
+            self.assertTrue(job[1] in (10, 200))
+            self.assertTrue(0 <= job[2] < config.num_users)
+        # User 2 has 3 times the demand of user 0.
+        user_jobs = [sum(1 for job in jobs if job[2] == user)
+                     for user in range(config.num_users)]
+        self.assertAlmostEqual(3, user_jobs[2] / float(user_jobs[0]),
+                               delta=0.3)
+
+    def test_python_job_stream(self):
+        config = self.get_config("python")
+        jobs = list(workload.job_stream(config, 50000, random.Random(3)))
+        self.check_stream(config, 50000, jobs)
+        self.assertEqual(
+            jobs, list(workload.job_stream(config, 50000, random.Random(3))))
+
+    @unittest.skipIf(workload.N is None, "NumPy is not available")
+    def test_numpy_job_stream(self):
+        config = self.get_config("numpy")
+        # Use small batches, so jobs span several batches.
+        jobs = list(workload.numpy_job_stream(config, 50000, 3, 1000))
+        self.check_stream(config, 50000, jobs)
+        self.assertEqual(jobs,
+                         list(workload.numpy_job_stream(config, 50000, 3, 1000)))
+
+    def check_task_lengths(self, generator, distribution, **params):
+        config = simulation.SimulationConfig(
+            task_length=100, task_length_distribution=distribution,
+            workload_generator=generator, **params)
+        lengths = list(itertools.islice(
+            workload.task_lengths(config, random.Random(3)), 20000))
+        self.assertEqual(lengths, list(itertools.islice(
+            workload.task_lengths(config, random.Random(3)), 20000)))
+        self.assertTrue(min(lengths) >= 0)
+        return lengths
+
+    def test_python_task_lengths(self):
+        lengths = self.check_task_lengths("python", "exponential")
+        self.assertAlmostEqual(100, sum(lengths) / len(lengths), delta=3)
+        lengths = self.check_task_lengths("python", "facebook")
+        self.assertEqual(100, min(lengths))
+        self.assertAlmostEqual(100.5, sum(lengths) / len(lengths), delta=0.2)
+
+    def test_empirical_task_lengths(self):
+        trace = tempfile.NamedTemporaryFile()
+        trace.write("# Task lengths\n1\n\n3\n")
+        trace.flush()
+        lengths = self.check_task_lengths("python", "empirical",
+                                          task_length_file=trace.name)
+        # Lengths are scaled to have mean task_length.
+        self.assertEqual(set([50, 150]), set(lengths))
+        self.assertRaises(ValueError, simulation.SimulationConfig,
+                          task_length_distribution="empirical")
+
+    @unittest.skipIf(workload.N is None, "NumPy is not available")
+    def test_numpy_task_lengths(self):
+        lengths = self.check_task_lengths("numpy", "exponential")
+        self.assertAlmostEqual(100, sum(lengths) / len(lengths), delta=3)
+        lengths = self.check_task_lengths("numpy", "facebook")
+        self.assertEqual(100, min(lengths))
+        self.assertAlmostEqual(100.5, sum(lengths) / len(lengths), delta=0.2)
+
+class TestTimeSeries(unittest.TestCase):
+    def test_records_counts(self):
+        series = simulation.TimeSeries()
+        self.assertEqual(1, series.add(0, 1))
+        self.assertEqual(2, series.add(5, 1))
+        self.assertEqual(1, series.add(7.5, -1))
+        self.assertEqual(1, series.count)
+        self.assertEqual(3, len(series))
+        self.assertEqual([(0, 1), (5, 2), (7.5, 1)], list(series))
+        self.assertEqual([(7.5, 1), (5, 2), (0, 1)], list(reversed(series)))
+
+    def test_downsampled_series_bounded(self):
+        series = simulation.DownsampledTimeSeries(max_samples=100)
+        exact = simulation.TimeSeries()
+        rng = random.Random(3)
+        time = 0
+        for i in range(10000):
+            time += rng.random()
+            delta = rng.choice([-1, 1])
+            if exact.count + delta < 0:
+                delta = 1
+            self.assertEqual(exact.add(time, delta), series.add(time, delta))
+            self.assertTrue(len(series) <= 100)
+        self.assertEqual(exact.count, series.count)
+        # The series keeps the last of the exact samples in each interval,
+        # and covers the whole simulation.
+        self.assertTrue(series.interval > 1)
+        exact_samples = dict(exact)
+        for time, count in series:
+            self.assertEqual(exact_samples[time], count)
+        self.assertEqual(list(exact)[-1], list(series)[-1])
+        self.assertTrue(list(series)[0][0] < series.interval)
+        intervals = [int(time // series.interval) for time, count in series]
+        self.assertEqual(sorted(set(intervals)), intervals)
+
+def exact_quantile(values, percent):
+    """ Computes a quantile by sorting, as StatsManager.percentile does. """
+    values = sorted(values)
+    k = (len(values) - 1) * percent
+    f = math.floor(k)
+    c = math.ceil(k)
+    if f == c:
+        return values[int(k)]
+    return values[int(f)] * (c - k) + values[int(c)] * (k - f)
+
+class TestLogHistogram(unittest.TestCase):
+    def test_quantiles_within_relative_accuracy(self):
+        random.seed(1)
+        for accuracy in [0.05, 0.01, 0.001]:
+            sketch = quantile_sketch.LogHistogram(accuracy)
+            values = [random.expovariate(1.0 / 300) + random.randint(0, 50)
+                      for i in range(20000)]
+            for value in values:
+                sketch.add(value)
+            for percent in [0.5, 0.95, 0.99]:
+                exact = exact_quantile(values, percent)
+                self.assertTrue(
+                    abs(sketch.quantile(percent) - exact) <= accuracy * exact,
+                    "%s quantile %s is %s; expected %s" %
+                    (accuracy, percent, sketch.quantile(percent), exact))
+            self.assertAlmostEqual(sum(values) / len(values), sketch.mean)
+
+    def test_stdev_of_fewer_than_two_values(self):
+        sketch = quantile_sketch.LogHistogram(0.01)
+        self.assertEqual(0, sketch.stdev())
+        sketch.add(250)
+        self.assertEqual(0, sketch.stdev())
+        sketch.add(350)
+        self.assertAlmostEqual(stats.lstdev([250, 350]), sketch.stdev())
+
+    def test_merge_matches_adding_all_values(self):
+        random.seed(1)
+        merged = quantile_sketch.LogHistogram(0.01)
+        combined = quantile_sketch.LogHistogram(0.01)
+        values = []
+        for part in range(3):
+            sketch = quantile_sketch.LogHistogram(0.01)
+            for i in range(1000):
+                value = random.randint(0, 1000)
+                values.append(value)
+                sketch.add(value)
+                combined.add(value)
+            merged.merge(sketch)
+        self.assertEqual(len(values), len(merged))
+        self.assertEqual(combined.buckets, merged.buckets)
+        self.assertEqual(combined.zero_count, merged.zero_count)
+        self.assertAlmostEqual(combined.mean, merged.mean)
+        self.assertAlmostEqual(combined.stdev(), merged.stdev())
+        self.assertAlmostEqual(stats.lstdev(values), merged.stdev())
+        for percent in [0, 0.5, 0.99, 1]:
+            self.assertEqual(combined.quantile(percent),
+                             merged.quantile(percent))
+
+    def test_stats_manager_releases_jobs(self):
+        config = simulation.SimulationConfig(num_users=2,
+                                             response_time_sketch=0.01)
+        stats_manager = simulation.StatsManager(config)
+        for i in range(10):
+            job = simulation.Job(i % 2, 0, 1, 100, stats_manager, i,
+                                 constant_task_lengths())
+            job.longest_task = 100
+            job.completion_time = 100 + i
+            stats_manager.job_finished(job)
+        self.assertEqual(10, stats_manager.num_completed_jobs)
+        self.assertEqual([], stats_manager.completed_jobs)
+        self.assertEqual(5, len(stats_manager.response_time_sketches[1]))
+        self.assertEqual(10, len(stats_manager.job_size_sketches[1]))
+
+class TestEventQueue(unittest.TestCase):
+    def test_ties_run_in_insertion_order(self):
+        queue = event_queue.EventQueue()
+        queue.put((5, "b"))
+        queue.put((1, "a"))
+        queue.put((5, "c"))
+        queue.put_all([(5, "d"), (0, "e")])
+        order = []
+        while not queue.empty():
+            order.append(queue.get())
+        self.assertEqual([(0, "e"), (1, "a"), (5, "b"), (5, "c"), (5, "d")],
+                         order)
+
+    def test_put_all_matches_put(self):
+        random.seed(1)
+        entries = [(random.randint(0, 20), i) for i in range(500)]
+        single = event_queue.EventQueue()
+        bulk = event_queue.EventQueue()
+        # Mix small and large batches so both insertion paths are used.
+        single.put((10, "first"))
+        bulk.put((10, "first"))
+        for entry in entries:
+            single.put(entry)
+        bulk.put_all(entries[:3])
+        bulk.put_all(entries[3:])
+        self.assertEqual(len(single), len(bulk))
+        while not single.empty():
+            self.assertEqual(single.get(), bulk.get())
+
+class TestTimingWheelEventQueue(unittest.TestCase):
+    def test_same_order_as_heap(self):
+        """ Mixes integer, fractional, and far-future times. """
+        random.seed(1)
+        heap = event_queue.EventQueue()
+        wheel = event_queue.TimingWheelEventQueue(wheel_size=64)
+        current_time = 0
+        for i in range(5000):
+            new_events = []
+            for j in range(random.randint(0, 3)):
+                choice = random.random()
+                if choice < 0.5:
+                    delay = random.randint(0, 10)
+                elif choice < 0.8:
+                    delay = random.expovariate(0.1)
+                else:
+                    delay = random.randint(50, 500)
+                new_events.append((current_time + delay, i))
+            heap.put_all(new_events)
+            wheel.put_all(new_events)
+            self.assertEqual(len(heap), len(wheel))
+            if not heap.empty():
+                self.assertEqual(heap.peek_time(), wheel.peek_time())
+            if not heap.empty() and random.random() < 0.6:
+                current_time, event = heap.get()
+                self.assertEqual((current_time, event), wheel.get())
+        while not heap.empty():
+            self.assertEqual(heap.get(), wheel.get())
+        self.assertTrue(wheel.empty())
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,49 @@
+""" Detects the end of the warm-up period at the start of an experiment.
+
+Early in an experiment, queues start out empty, so response times are lower
+than in steady state.  mser_truncation picks how many of the earliest
+observations to discard using MSER-5 (the Marginal Standard Error Rule,
+applied to the means of batches of 5 observations): it discards the prefix
+that minimizes the standard error of the mean of the observations that
+remain.
+
+Used by both the simulation and the prototype's log parser.
+"""
+
+BATCH_SIZE = 5
+
+def mser_truncation(values, batch_size=BATCH_SIZE):
+    """ Returns the number of values, from the start of the list, that are
+    part of the warm-up period.
+
+    values should be ordered by time (e.g., response times ordered by
+    arrival time).  The truncation point is a multiple of batch_size, and at
+    most half of the values are discarded, since a truncation point later
+    than that means the experiment never reached steady state.
+    """
+    num_batches = len(values) / batch_size
+    if num_batches < 2:
+        return 0
+    batch_means = []
+    for batch in range(num_batches):
+        start = batch * batch_size
+        batch_means.append(
+            sum(values[start:start + batch_size]) / float(batch_size))
+
+    # Sums of the batch means, and of their squares, from each batch to the
+    # end, so that the statistic for each truncation point takes constant
+    # time.
+    suffix_sum = 0.0
+    suffix_sum_squares = 0.0
+    # statistics[d] is the MSER statistic for discarding d batches.
+    statistics = [0.0] * num_batches
+    for batch in range(num_batches - 1, -1, -1):
+        suffix_sum += batch_means[batch]
+        suffix_sum_squares += batch_means[batch] ** 2
+        remaining = num_batches - batch
+        # Sum of squared deviations from the mean, divided by remaining^2.
+        statistics[batch] = ((suffix_sum_squares - suffix_sum ** 2 / remaining)
+                             / remaining ** 2)
+    best_batches = min(range(num_batches / 2 + 1),
+                       key=statistics.__getitem__)
+    return best_batches * batch_size
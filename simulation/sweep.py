@@ -0,0 +1,304 @@
+""" Runs the simulations for a sweep over parameter values in parallel.
+
+A sweep is a list of points, each of which is a list of "key=value"
+arguments, as taken by simulation.main.  Each point's simulation runs in a
+separate process, with its own SimulationConfig, and writes its results to a
+private directory; once a point finishes, its results are merged into
+results_dir in the order the points were given.  Rows in the response time
+files are appended to the files from earlier points with the same
+file_prefix (unless the point sets first_time=True), exactly as if the
+points had been run one after another; other results files are replaced.
+
+Each point's results are cached in results_dir/cache, in a directory named
+by a hash of the point's parameters (including the contents of any
+task_length_file) and of the simulation code, so a sweep skips points that
+have already been run (including by an earlier, interrupted run of the same
+sweep).  Only points with deterministic=True are cached, since rerunning any
+other point should give a new random sample.  The cache can be listed and
+trimmed from the command line:
+
+    python sweep.py list [results_dir=raw_results]
+    python sweep.py evict [max_age_days=d] [max_size_mb=m]
+        [results_dir=raw_results]
+"""
+
+import functools
+import hashlib
+import itertools
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import event_queue
+import parallel
+import quantile_sketch
+import simulation
+import stats
+import workload
+
+# Results files whose names start with the file prefix followed by this
+# suffix get one row per simulation, and are appended to.
+APPENDED_SUFFIX = "_response_time"
+
+# Name of the directory, in results_dir, that holds cached results.
+CACHE_DIRNAME = "cache"
+
+# Prefix of the temporary directories that points run in.
+TEMP_DIR_PREFIX = ".sweep_"
+
+# Temporary directories in the cache older than this many seconds are left
+# from interrupted runs, and are removed by evict.
+STALE_TEMP_DIR_AGE = 24 * 60 * 60
+
+# Parameters that don't affect a simulation's results.
+UNCACHED_PARAMS = ["first_time", "log_level", "results_dir"]
+
+# Modules whose code determines the results of a simulation.
+SIMULATION_MODULES = [event_queue, parallel, quantile_sketch, simulation,
+                      stats, workload]
+
+def code_version():
+    """ Returns a hash of the source of the simulation code. """
+    version = hashlib.sha1()
+    for module in SIMULATION_MODULES:
+        source_file = open(os.path.splitext(module.__file__)[0] + ".py")
+        version.update(source_file.read())
+        source_file.close()
+    return version.hexdigest()
+
+def cache_key(config):
+    """ Returns the key for the results of a simulation with the given
+    config. """
+    key = hashlib.sha1(code_version())
+    for name, value in sorted(config.items()):
+        if name not in UNCACHED_PARAMS:
+            key.update("%s=%r\n" % (name, value))
+    # task_length_file is only a path, so also hash the lengths read from
+    # it, in case the file has changed.
+    if len(config.empirical_task_lengths) > 0:
+        key.update("empirical_task_lengths=%r\n" %
+                   (config.empirical_task_lengths,))
+    return key.hexdigest()
+
+def cacheable(config):
+    """ Returns whether the results of a simulation with the given config
+    can be cached: only simulations with fixed random seeds give the same
+    results when they are run again. """
+    return config.deterministic
+
+def make_dirs(dirname):
+    if not os.path.isdir(dirname):
+        try:
+            os.makedirs(dirname)
+        except OSError:
+            # Another point created it first.
+            pass
+
+def run_point(args, use_cache=True):
+    """ Runs the simulation for one point, unless its results are cached.
+
+    Returns the name of the directory, inside results_dir, that holds the
+    point's results.  Points that aren't cacheable are never cached.
+    """
+    config = simulation.SimulationConfig.from_args(args)
+    cache_dir = os.path.join(config.results_dir, CACHE_DIRNAME)
+    use_cache = use_cache and cacheable(config)
+    if use_cache:
+        cached_dir = os.path.join(cache_dir, cache_key(config))
+        if os.path.isdir(cached_dir):
+            # Mark the entry as recently used, so it is evicted last.
+            os.utime(cached_dir, None)
+            return cached_dir
+        make_dirs(cache_dir)
+        point_dir = tempfile.mkdtemp(prefix=TEMP_DIR_PREFIX, dir=cache_dir)
+    else:
+        make_dirs(config.results_dir)
+        point_dir = tempfile.mkdtemp(prefix=TEMP_DIR_PREFIX,
+                                     dir=config.results_dir)
+    # Always write headers, so that merge_results can tell them apart from
+    # rows.
+    config = simulation.SimulationConfig.from_args(
+        args + ["results_dir=%s" % point_dir, "first_time=True"])
+    logging.basicConfig(level=simulation.LEVELS.get(config.log_level))
+    if config.partitions > 1:
+        # Processes in a pool can't start processes of their own, so there
+        # the partitions take turns in this process instead.
+        parallel.run(config, use_processes=not
+                     multiprocessing.current_process().daemon)
+    else:
+        sim = simulation.Simulation(config)
+        sim.create_jobs(config.total_time)
+        sim.run()
+    if use_cache:
+        # Renaming is atomic, so an interrupted run never leaves a partial
+        # entry in the cache.
+        try:
+            os.rename(point_dir, cached_dir)
+        except OSError:
+            if not os.path.isdir(cached_dir):
+                raise
+            # An identical point finished first.
+            shutil.rmtree(point_dir)
+        return cached_dir
+    return point_dir
+
+def merge_results(args, point_dir, keep=False):
+    """ Copies the results for the given point from point_dir into
+    results_dir.  Removes point_dir, unless keep is True. """
+    config = simulation.SimulationConfig.from_args(args)
+    for name in sorted(os.listdir(point_dir)):
+        filename = os.path.join(point_dir, name)
+        destination = os.path.join(config.results_dir, name)
+        appended = name.startswith(config.file_prefix + APPENDED_SUFFIX)
+        if appended and not config.first_time:
+            point_file = open(filename)
+            # Skip the header.
+            lines = point_file.readlines()[1:]
+            point_file.close()
+            destination_file = open(destination, "a")
+            destination_file.writelines(lines)
+            destination_file.close()
+        else:
+            shutil.copy(filename, destination)
+    if not keep:
+        shutil.rmtree(point_dir)
+
+def run_points(points, processes=None, use_cache=True):
+    """ Runs the simulation for each point.
+
+    Yields the directory holding each point's results, in the order of the
+    points; the directories are in the cache if use_cache is True and the
+    point is cacheable, and should be removed by the caller otherwise.  See
+    run_sweep for the parameters.
+    """
+    run_func = functools.partial(run_point, use_cache=use_cache)
+    if processes == 1:
+        for point_dir in itertools.imap(run_func, points):
+            yield point_dir
+        return
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        # imap returns results in the order of the points, so each point's
+        # results are available as soon as it and all earlier points finish.
+        for point_dir in pool.imap(run_func, points):
+            yield point_dir
+    finally:
+        pool.close()
+        pool.join()
+
+def run_sweep(points, processes=None, seed=None, use_cache=True):
+    """ Runs the simulation for each point, and merges the results.
+
+    Parameters:
+        points: List of points, each a list of "key=value" arguments.
+        processes: Number of simulations to run at once; defaults to the
+            number of cores.  With 1, the simulations run in this process.
+        seed: If given, point i runs with deterministic=True and
+            random_seed=seed + i, so the sweep is reproducible and no two
+            points share a random stream.
+        use_cache: Whether to use cached results for points that have
+            already been run, and to cache the results of new points.
+    """
+    if seed is not None:
+        points = [point + ["deterministic=True", "random_seed=%d" % (seed + i)]
+                  for i, point in enumerate(points)]
+    point_dirs = run_points(points, processes, use_cache)
+    for point, point_dir in itertools.izip(points, point_dirs):
+        cached = use_cache and cacheable(
+            simulation.SimulationConfig.from_args(point))
+        merge_results(point, point_dir, keep=cached)
+
+def cache_entries(results_dir):
+    """ Returns a (key, last used time, size in bytes, file prefix) tuple
+    for each entry in the cache in results_dir, least recently used first.
+    """
+    cache_dir = os.path.join(results_dir, CACHE_DIRNAME)
+    if not os.path.isdir(cache_dir):
+        return []
+    entries = []
+    for key in os.listdir(cache_dir):
+        entry_dir = os.path.join(cache_dir, key)
+        if key.startswith("."):
+            # Results for a point that is running, or was interrupted.
+            continue
+        size = 0
+        file_prefix = ""
+        for name in os.listdir(entry_dir):
+            size += os.path.getsize(os.path.join(entry_dir, name))
+            if name.endswith(".params"):
+                file_prefix = name[:-len(".params")]
+        entries.append((key, os.path.getmtime(entry_dir), size, file_prefix))
+    entries.sort(key=lambda entry: entry[1])
+    return entries
+
+def evict(results_dir, max_age_days=None, max_size_mb=None):
+    """ Removes cache entries not used in the last max_age_days, and then the
+    least recently used entries until the cache is no larger than
+    max_size_mb.  Also removes temporary directories left by points that
+    were interrupted more than STALE_TEMP_DIR_AGE seconds ago.
+
+    Returns the keys of the removed entries, and the names of the removed
+    temporary directories.
+    """
+    removed = []
+    cache_dir = os.path.join(results_dir, CACHE_DIRNAME)
+    if os.path.isdir(cache_dir):
+        cutoff = time.time() - STALE_TEMP_DIR_AGE
+        for name in os.listdir(cache_dir):
+            temp_dir = os.path.join(cache_dir, name)
+            if (name.startswith(TEMP_DIR_PREFIX) and
+                    os.path.getmtime(temp_dir) < cutoff):
+                shutil.rmtree(temp_dir)
+                removed.append(name)
+
+    entries = cache_entries(results_dir)
+    evicted = []
+    if max_age_days is not None:
+        cutoff = time.time() - max_age_days * 24 * 60 * 60
+        evicted.extend([entry for entry in entries if entry[1] < cutoff])
+    if max_size_mb is not None:
+        remaining = [entry for entry in entries if entry not in evicted]
+        total_size = sum([entry[2] for entry in remaining])
+        for entry in remaining:
+            if total_size <= max_size_mb * 1024 * 1024:
+                break
+            evicted.append(entry)
+            total_size -= entry[2]
+    for key, mtime, size, file_prefix in evicted:
+        shutil.rmtree(os.path.join(cache_dir, key))
+    return removed + [entry[0] for entry in evicted]
+
+def main(argv):
+    if len(argv) == 0 or argv[0] not in ["list", "evict"]:
+        print __doc__
+        sys.exit(1)
+    options = {"results_dir": simulation.PARAMS["results_dir"][1]}
+    for arg in argv[1:]:
+        key, value = arg.split("=")
+        options[key] = value
+    results_dir = options.pop("results_dir")
+    if argv[0] == "list":
+        print "key	age_days	size_kb	file_prefix"
+        for key, mtime, size, file_prefix in cache_entries(results_dir):
+            print "%s\t%.1f\t%.1f\t%s" % (
+                key, (time.time() - mtime) / (24 * 60 * 60), size / 1024.0,
+                file_prefix)
+    else:
+        max_age_days = options.pop("max_age_days", None)
+        if max_age_days is not None:
+            max_age_days = float(max_age_days)
+        max_size_mb = options.pop("max_size_mb", None)
+        if max_size_mb is not None:
+            max_size_mb = float(max_size_mb)
+        for key in evict(results_dir, max_age_days, max_size_mb):
+            print "Evicted %s" % key
+    for key in options:
+        logging.warn("Ignoring key %s" % key)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,224 @@
+""" Generators for the jobs that arrive at a front end.
+
+A job stream is an iterator over (arrival time, number of tasks, user id)
+tuples, in order of arrival time, for the jobs that arrive at one front end
+before the end of the simulation.  Streams are generated lazily, so the
+whole workload never needs to be in memory at once.
+
+The lengths of the jobs' tasks come from a separate, infinite iterator over
+task lengths.
+"""
+
+import itertools
+
+try:
+    # Needed for the "numpy" workload generator.
+    import numpy as N
+except ImportError:
+    N = None
+
+# Number of jobs drawn at a time by numpy_job_stream.
+NUMPY_BATCH_SIZE = 65536
+
+def python_job_stream(config, total_time, rng):
+    """ Generates jobs one at a time, using the given random.Random.
+
+    Each job's random numbers are drawn in the same order as in earlier
+    versions of the simulation, which drew the whole workload from the
+    simulation's single random stream; the "legacy" workload_generator
+    still does, to reproduce their results.
+    """
+    num_tasks = config.num_tasks
+    avg_arrival_delay = config.job_arrival_delay
+    constant_arrivals = config.job_arrival_distribution == "constant"
+    bimodal = config.task_distribution == "bimodal"
+    relative_demands = config.relative_demands
+    num_users = config.num_users
+    last_job_arrival = 0
+    while True:
+        if constant_arrivals:
+            new_last = last_job_arrival + avg_arrival_delay
+        else:
+            # If the job arrivals are a Poisson process, the time between
+            # jobs follows an exponential distribution.
+            new_last = last_job_arrival + rng.expovariate(
+                1.0 / avg_arrival_delay)
+
+        # See if we've passed the end of the experiment
+        if new_last > total_time:
+            return
+        last_job_arrival = new_last
+
+        if bimodal:
+            if rng.random() > (1.0 / 6):
+                # 5/6 of the jobs have 10 tasks.
+                num_tasks = 10
+            else:
+                num_tasks = 200
+        if len(relative_demands) == 0:
+            user_id = rng.randrange(num_users)
+        else:
+            r = rng.random()
+            user_id = -1
+            for current_user in range(num_users):
+                if r < relative_demands[current_user]:
+                    user_id = current_user
+                    break
+            assert user_id != -1
+        yield last_job_arrival, num_tasks, user_id
+
+def numpy_job_stream(config, total_time, seed, batch_size=NUMPY_BATCH_SIZE):
+    """ Generates jobs in batches, using NumPy.
+
+    The arrival gaps, job sizes and user ids for batch_size jobs at a time
+    are drawn as arrays, so the cost per job is a small constant rather than
+    several calls into the random module.  Jobs have the same distribution
+    as with python_job_stream, but a different random stream.
+
+    Parameters:
+        seed: Seed for the NumPy random number generator, so the same seed
+            always generates the same jobs.
+    """
+    assert N is not None, "numpy_job_stream requires NumPy"
+    random_state = N.random.RandomState(seed)
+    avg_arrival_delay = config.job_arrival_delay
+    num_users = config.num_users
+    # relative_demands holds the cumulative fraction of demand for each
+    # user, so a user can be chosen with a binary search.
+    cumulative_demands = N.array(config.relative_demands)
+    last_job_arrival = 0.0
+    while True:
+        if config.job_arrival_distribution == "constant":
+            gaps = N.empty(batch_size)
+            gaps.fill(avg_arrival_delay)
+        else:
+            gaps = random_state.exponential(avg_arrival_delay, batch_size)
+        arrivals = last_job_arrival + N.cumsum(gaps)
+        # Number of jobs in this batch that arrive before the end of the
+        # experiment.
+        end = int(N.searchsorted(arrivals, total_time, side="right"))
+
+        if config.task_distribution == "bimodal":
+            # 5/6 of the jobs have 10 tasks, and the rest have 200.
+            num_tasks = N.where(random_state.random_sample(end) > (1.0 / 6),
+                                10, 200).tolist()
+        else:
+            num_tasks = itertools.repeat(config.num_tasks, end)
+        if len(cumulative_demands) == 0:
+            user_ids = random_state.randint(0, num_users, end)
+        else:
+            user_ids = N.searchsorted(cumulative_demands,
+                                      random_state.random_sample(end),
+                                      side="right")
+            # Guard against rounding in the last cumulative demand.
+            user_ids = N.minimum(user_ids, num_users - 1)
+
+        for job in itertools.izip(arrivals[:end].tolist(), num_tasks,
+                                  user_ids.tolist()):
+            yield job
+        if end < batch_size:
+            return
+        last_job_arrival = arrivals[-1]
+
+def job_stream(config, total_time, rng):
+    """ Returns the job stream for one front end, based on
+    'workload_generator'.
+
+    Random numbers are drawn from rng, either directly or to seed NumPy's
+    generator, so a seeded rng always gives the same jobs.
+    """
+    if config.workload_generator == "numpy":
+        return numpy_job_stream(config, total_time, rng.randrange(2 ** 32))
+    return python_job_stream(config, total_time, rng)
+
+# Number of task lengths drawn at a time by numpy_task_lengths.
+NUMPY_TASK_LENGTH_BATCH_SIZE = 65536
+
+def constant_task_length(rng, mean):
+    return mean
+
+def exponential_task_length(rng, mean):
+    return rng.expovariate(1.0 / mean)
+
+def facebook_task_length(rng, mean):
+    task_length = mean
+    if rng.random() > 0.95:
+        task_length += rng.expovariate(10.0 / mean)
+    return task_length
+
+# task_length_distribution => function that, given a random number generator
+# and the mean task length, returns the length of a task.  The "empirical"
+# distribution samples from a list of lengths, so is handled separately.
+TASK_LENGTH_SAMPLERS = {"constant": constant_task_length,
+                        "exponential": exponential_task_length,
+                        "facebook": facebook_task_length}
+
+def read_task_lengths(filename, mean):
+    """ Reads task lengths, one per line, from the given file.
+
+    Blank lines and lines starting with "#" are ignored.  The lengths are
+    scaled so that their mean is the given mean; only the shape of the
+    distribution in the file is used.
+    """
+    lengths = []
+    f = open(filename)
+    for line in f:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            lengths.append(float(line))
+    f.close()
+    if len(lengths) == 0 or min(lengths) < 0 or sum(lengths) == 0:
+        raise ValueError("%s does not contain any task lengths" % filename)
+    scale = mean * len(lengths) / sum(lengths)
+    return tuple([length * scale for length in lengths])
+
+def python_task_lengths(config, rng):
+    """ Generates task lengths one at a time, using the given random.Random.
+    """
+    mean = config.task_length
+    if config.task_length_distribution == "constant":
+        return itertools.repeat(mean)
+    if config.task_length_distribution == "empirical":
+        lengths = config.empirical_task_lengths
+        return (rng.choice(lengths) for _ in itertools.repeat(None))
+    sample = TASK_LENGTH_SAMPLERS[config.task_length_distribution]
+    return (sample(rng, mean) for _ in itertools.repeat(None))
+
+def numpy_task_lengths(config, seed, batch_size=NUMPY_TASK_LENGTH_BATCH_SIZE):
+    """ Generates task lengths in batches, using NumPy.
+
+    Task lengths have the same distribution as with python_task_lengths, but
+    a different random stream.
+    """
+    assert N is not None, "numpy_task_lengths requires NumPy"
+    random_state = N.random.RandomState(seed)
+    mean = config.task_length
+    distribution = config.task_length_distribution
+    if distribution == "constant":
+        for length in itertools.repeat(mean):
+            yield length
+    if distribution == "empirical":
+        lengths = N.array(config.empirical_task_lengths)
+    while True:
+        if distribution == "exponential":
+            batch = random_state.exponential(mean, batch_size)
+        elif distribution == "facebook":
+            # 5% of tasks take an extra exponentially distributed time, with
+            # mean 0.1 * mean.
+            extra = random_state.exponential(0.1 * mean, batch_size)
+            batch = mean + N.where(random_state.random_sample(batch_size) >
+                                   0.95, extra, 0)
+        else:
+            batch = lengths[random_state.randint(0, len(lengths), batch_size)]
+        for length in batch.tolist():
+            yield length
+
+def task_lengths(config, rng):
+    """ Returns an infinite iterator over task lengths, based on
+    'workload_generator' and 'task_length_distribution'.
+
+    As with job_stream, a seeded rng always gives the same task lengths.
+    """
+    if config.workload_generator == "numpy":
+        return numpy_task_lengths(config, rng.randrange(2 ** 32))
+    return python_task_lengths(config, rng)
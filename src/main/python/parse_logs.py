@@ -8,6 +8,7 @@ import math
 import os
 import subprocess
 import stats
+import steady_state
 import sys
 import time
 
@@ -15,6 +16,9 @@ INVALID_TIME = 0
 INVALID_TIME_DELTA = -sys.maxint - 1
 INVALID_QUEUE_LENGTH = -1
 
+# Requests that arrive between START_SEC and END_SEC seconds after the first
+# logged event are used for the aggregate results.  If START_SEC is None, the
+# warm-up period is found automatically, with MSER-5.
 START_SEC = 200
 END_SEC = 250
 
@@ -657,6 +661,23 @@ class LogParser:
         gnuplot_file.write("plot '%s' using 1:2 lw 4 with lp notitle\n" %
                            running_tasks_filename)
 
+    def __steady_state_start(self, complete_requests, end_time):
+        """ Returns the time when the warm-up period ended, based on the
+        response times of requests that arrived before end_time.
+
+        If no request is left after the warm-up period (e.g., because none
+        arrived before end_time), nothing is truncated, and the time of the
+        first logged event is returned. """
+        arrivals = [(request.arrival_time(), request.response_time())
+                    for request in complete_requests
+                    if request.arrival_time() <= end_time]
+        arrivals.sort()
+        num_warmup_requests = steady_state.mser_truncation(
+            [response_time for arrival_time, response_time in arrivals])
+        if num_warmup_requests >= len(arrivals):
+            return self.__earliest_time
+        return arrivals[num_warmup_requests][0]
+
     def output_aggregate_stats(self, requests, output_directory):
         # Overhead versus best possible response time of a request, given its service times
         overheads = []
@@ -682,7 +703,6 @@ class LogParser:
 
         get_task_task_counts = []
 
-        start_time = self.__earliest_time + (START_SEC * 1000)
         end_time = self.__earliest_time + (END_SEC * 1000)
 
         complete_requests = filter(lambda k: k.complete(), requests.values())
@@ -692,6 +712,12 @@ class LogParser:
             for request in requests.values():
                 request.complete(True)
             return
+        if START_SEC is None:
+            start_time = self.__steady_state_start(complete_requests, end_time)
+            print "Warm-up ends %s ms after the first event" % (
+                start_time - self.__earliest_time)
+        else:
+            start_time = self.__earliest_time + (START_SEC * 1000)
         considered_requests = filter(lambda k: k.arrival_time() >= start_time and
                                      k.arrival_time() <= end_time and
                                      k.complete(), requests.values())
@@ -903,7 +929,10 @@ def main(argv):
             output_dir = kv[1]
         elif kv[0] == PARAMS[2]:
             global START_SEC
-            START_SEC = int(kv[1])
+            if kv[1] == "auto":
+                START_SEC = None
+            else:
+                START_SEC = int(kv[1])
         elif kv[0] == PARAMS[3]:
             global END_SEC
             END_SEC = int(kv[1])
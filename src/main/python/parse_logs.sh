@@ -1,4 +1,4 @@
 #!/bin/sh
 cd "`dirname $0`"
-PYTHONPATH="$PYTHONPATH:third_party" python parse_logs.py $@
+PYTHONPATH="$PYTHONPATH:third_party:../../../simulation" python parse_logs.py $@
 